@@ -0,0 +1,626 @@
+"""
+This module deploys the main page of the Radar Crop Monitor web app (filters, charts of the selected fields, crop
+overview and field map) for a data backend opened in main.py. It imports the heavy packages of the app (pandas,
+Altair, pyarrow), so main.py does not import it before the path screen is shown, but loads it in a background thread
+while the user enters the path. The charts of the selected fields are made in charts.py, which does not depend on
+Streamlit (it is also used by batch_export.py and benchmark.py).
+
+Authors: Markus Adam, Laura Walder
+|  Python version: 3.8  |
+"""
+# import packages
+import os
+import streamlit as st
+import pandas as pd
+import sqlite3
+import time
+import uuid
+import altair as alt
+from charts import CHART_TITLES, CHART_WIDTH, axis_label, make_chart, split_by_parameter
+from db_pool import get_pool, pool_stats
+from decimation import decimate_records
+from derived import (ANOMALY_SUFFIX, PAIR_PARAMETERS, derived_parameters, derived_records, derived_title, is_derived,
+                     pair_unit, source_parameters)
+from geometry import field_features
+from instrumentation import Profiler
+from loader import concat_typed, date_bounds, memory_report
+from trendlines import get_trendline
+from optimize_db import optimize_database
+from prefetch import prefetcher, superset_selection
+from queries import normalize_selection
+from query_cache import result_cache
+from summaries import load_overview, refresh_summaries, summary_path
+
+# minimum seconds between updates of the preview charts while the records are loaded progressively
+PREVIEW_SECONDS = 1.0
+
+
+# define function to replace filter value abbreviations with full words, and vice versa
+def replace_strings(string_list, string_dict):
+    """
+    Uses a dictionary to convert a list of strings in two ways:
+        - searching if keys from dictionary are in list and replacing them with corresponding values
+        - searching if values from dictionary are in list and replacing them with corresponding keys
+
+    Direction of conversion is chosen automatically depending on whether keys or values from dictionary are in list.
+
+    :param string_list: list of strings
+    :param string_dict: dictionary where keys and values are strings
+    :return: potentially updated list of strings
+    """
+
+    updated_string_list = string_list.copy()
+
+    # search for dict keys in input list and replace them with corresponding values
+    for string in string_dict.keys():
+        if string in updated_string_list:
+            updated_string_list = [w.replace(string, string_dict.get(string)) for w in updated_string_list]
+
+    # if keys have been found and replaced, new list differs from input list
+    if updated_string_list != string_list:
+        return updated_string_list
+
+    # if no change occurred (= no keys to replace found), search for values and replace them with corresponding keys
+    else:
+        for string in string_dict.values():
+            if string in updated_string_list:
+                matching_key_list = [key for key, value in string_dict.items() if value == string]
+                matching_key = matching_key_list[0]
+                updated_string_list = [w.replace(string, matching_key) for w in updated_string_list]
+        return updated_string_list
+
+
+# define function to display chart
+def display_chart(chart, placeholder=None):
+    """
+    Displays chart in app (with font sizes of title and legend).
+
+    :param chart: altair.Chart (or altair.VConcatChart) object
+    :param placeholder: streamlit placeholder (st.empty()) in which the chart is displayed, None to append it to
+        the page
+    """
+    chart = chart.configure_title(fontSize=28).configure_legend(titleFontSize=20, labelFontSize=18)
+    if placeholder is None:
+        st.altair_chart(chart)
+    else:
+        placeholder.altair_chart(chart)
+
+
+# define function to make crop overview chart
+def make_overview_chart(overview, axis_label, title):
+    """
+    Creates a chart of the summary of all fields of a crop type for one parameter: median (line), mean (dashed
+    line) and percentile bands (10-90 % light, 25-75 % darker) per date, one series per acquisition mode and product.
+
+    :param overview: dataframe with summary of one parameter (see summaries.load_overview()) and column "series"
+    :param axis_label: string with y-axis label
+    :param title: string with chart title
+    :return: altair.Chart object
+    """
+    base = alt.Chart(overview).encode(
+        x=alt.X("date:T", axis=alt.Axis(title='Date', titleFontSize=22)),
+        color=alt.Color("series:N", legend=alt.Legend(title="Acquisition / Product")))
+    outer_band = base.mark_area(opacity=0.15).encode(
+        y=alt.Y("p10:Q", axis=alt.Axis(title=axis_label, titleFontSize=22)), y2="p90:Q")
+    inner_band = base.mark_area(opacity=0.3).encode(y="p25:Q", y2="p75:Q")
+    median_line = base.mark_line().encode(
+        y="median:Q", tooltip=["date:T", "series:N", "fields:Q", "mean:Q", "median:Q", "p10:Q", "p90:Q"])
+    mean_line = base.mark_line(strokeDash=[4, 4]).encode(y="mean:Q")
+
+    return (outer_band + inner_band + median_line + mean_line).properties(title=title, width=CHART_WIDTH, height=500)
+
+
+# define function to add a chunk of records to the preview data of the charts
+def update_preview(preview_records, chunk, parameters):
+    """
+    Adds the records of a chunk to the preview data per parameter and reduces them to the point budget of the
+    charts, so the preview data stays small while the records are loaded.
+
+    :param preview_records: dictionary with preview dataframe per parameter (updated in place)
+    :param chunk: typed dataframe with records
+    :param parameters: iterable with parameters that are shown (VV,VH,NDVI)
+    """
+    for param, pol_records in split_by_parameter(chunk, parameters).items():
+        if param in preview_records:
+            pol_records = concat_typed([preview_records[param], pol_records])
+        preview_records[param] = decimate_records(pol_records, CHART_WIDTH, "LTTB", group_columns=("fid",))[0]
+
+
+# define function to make the preview chart of the records loaded so far
+def make_preview(preview_records, statistic):
+    """
+    :param preview_records: dictionary with preview dataframe per parameter (see update_preview())
+    :param statistic: string with statistic selected by user
+    :return: altair.VConcatChart object with one scatterplot per parameter (points colored by FID, no trendline)
+    """
+    start_date = min(pol_records["datetime"].min() for pol_records in preview_records.values())
+    end_date = max(pol_records["datetime"].max() for pol_records in preview_records.values())
+    domain = pd.to_datetime([start_date, end_date]).view("int64") / 10 ** 6
+    selection = alt.selection_multi(fields=["fid"], bind="legend")
+    charts = [make_chart(preview_records[param], axis_label(param, statistic), domain, selection, "fid", None,
+                         CHART_TITLES[param] + " (loading)", "None", add_selection=index == 0)
+              for index, param in enumerate(param for param in CHART_TITLES if param in preview_records)]
+    return alt.vconcat(*charts)
+
+
+# define function to load the records progressively
+def stream_records(db, selection, statistic, stage):
+    """
+    Loads the records of a selection chunk by chunk (see streaming.py) and shows a progress bar and preview charts
+    of the records loaded so far while the query runs. If the app run is stopped before the query has ended
+    (Streamlit stops the run at the next update of the page when the user changes the filters), the query is
+    cancelled, so the database connection is free for the next run.
+
+    :param db: backends.SQLiteBackend object
+    :param selection: queries.FilterSelection object
+    :param statistic: string with statistic selected by user
+    :param stage: dictionary with details of the "records_query" stage, to which "cached", "streamed",
+        "chunks" and "query_seconds" are added
+    :return: typed dataframe with records of selection
+    """
+    # cancel the query of a previous run of this session if it is still running
+    previous_query = st.session_state.get("streaming_query")
+    if previous_query is not None:
+        previous_query.cancel()
+
+    query = db.stream_records(selection)
+    st.session_state["streaming_query"] = query
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    preview = st.empty()
+    preview_records = {}
+    chunks = 0
+    last_preview = time.perf_counter()
+    try:
+        for chunk in query.chunks():
+            if chunk is not None:
+                chunks += 1
+                update_preview(preview_records, chunk, selection.parameter)
+            progress_bar.progress(query.progress())
+            status.text("{} records loaded".format(query.rows))
+            if preview_records and time.perf_counter() - last_preview > PREVIEW_SECONDS:
+                display_chart(make_preview(preview_records, statistic), preview)
+                last_preview = time.perf_counter()
+    finally:
+        # cancel the query if the run has been stopped (does nothing if the query has ended)
+        query.cancel()
+        st.session_state.pop("streaming_query", None)
+    progress_bar.empty()
+    status.empty()
+    preview.empty()
+
+    stage.update(cached=query.cached, streamed=True, chunks=chunks, query_seconds=query.query_seconds)
+    return query.records
+
+
+# define function to make map of field geometries
+def make_map(features, title):
+    """
+    :param features: list of dictionaries with GeoJSON features of fields (see geometry.field_features())
+    :param title: string with title of map
+    :return: altair.Chart object displaying the fields, colored by FID
+    """
+    # the identity projection works for projected and geographic coordinates, the y-axis is flipped
+    # so that north is up
+    map_chart = alt.Chart(alt.Data(values=features)).mark_geoshape(stroke="black", strokeWidth=0.5).encode(
+        color=alt.Color("properties.fid:N", legend=alt.Legend(title="FID")),
+        tooltip=[alt.Tooltip("properties.fid:N", title="FID")]). \
+        project(type="identity", reflectY=True). \
+        properties(title=title, width=CHART_WIDTH, height=500)
+
+    return map_chart
+
+
+# define function for deploying the crop overview
+def overview_part(db, selection, profiler):
+    """
+    Displays the crop overview: per date and parameter, the median, mean and percentile bands of the values of all
+    fields of the selected crop type, read from the summary tables of the database (see summaries.py).
+
+    :param db: data backend (the overview is only available for backends.SQLiteBackend objects)
+    :param selection: queries.FilterSelection object (the FID selection is not used)
+    :param profiler: instrumentation.Profiler object that records the stages of this app run
+    """
+    if db.kind != "sqlite":
+        st.info("The crop overview is only available for SQLite databases")
+        return
+    path = summary_path(db.pool.db_path)
+    if not os.path.exists(path):
+        st.info("No summary tables exist for this database yet. Build them with \"Refresh summary tables\" "
+                "(Database maintenance in the sidebar) or with: python summaries.py <path_to_database>")
+        return
+
+    # the summary table is read by its primary key (aoi, year, crop type, statistic, parameter, ...)
+    with profiler.stage("overview_query") as stage:
+        with get_pool(path).connection() as summary_db:
+            overview = load_overview(summary_db, selection)
+        profiler.add_frame(stage, overview)
+    if overview.empty:
+        st.warning("No summary available for this filter combination. Please select other filter combinations "
+                   "or refresh the summary tables.")
+        return
+
+    acquisition_names = overview["acquisition"].map({"A": "ascending", "D": "descending"})
+    overview["series"] = acquisition_names.fillna(overview["acquisition"]) + " / " + overview["product"]
+    parameter_overviews = dict(tuple(overview.groupby("parameter", sort=False)))
+    for param in CHART_TITLES:
+        if param not in parameter_overviews:
+            continue
+        with profiler.stage("make_chart:overview:" + param):
+            chart = make_overview_chart(parameter_overviews[param], axis_label(param, selection.statistic),
+                                        "{} ({}, all fields)".format(CHART_TITLES[param], selection.crop_type))
+        profiler.add_chart("chart_spec:overview:" + param, chart)
+        with profiler.stage("display_chart:overview:" + param):
+            display_chart(chart)
+
+
+# define function to describe the last refresh of the cached data
+def refresh_text(refresh):
+    """
+    :param refresh: dictionary with refresh info of data backend (see refresh_info() of backends.py)
+    :return: string describing the kind of the last change
+    """
+    if refresh["change"] == "append":
+        return "{} new rows".format(refresh["new_rows"])
+    return {"initial": "loaded", "full": "full reload", "export": "Parquet export"}.get(refresh["change"],
+                                                                                         refresh["change"])
+
+
+# define function to display the performance details of an app run
+def display_performance(profiler):
+    """
+    Prints the stages of the app run (time, rows, memory, chart size) and the query plans in the sidebar,
+    if the performance details are shown.
+
+    :param profiler: instrumentation.Profiler object that records the stages of this app run
+    """
+    if profiler.detailed:
+        with st.sidebar.expander("Performance details", expanded=True):
+            st.dataframe(profiler.table())
+            for stage_name, plan in profiler.plans():
+                st.text("Query plan of {}:".format(stage_name))
+                st.code(plan)
+
+
+# define function for deploying main page of app
+def main_part(db, profiler=None):
+    """
+    Deploys the main page of the app and its functionalities. This mainly includes:
+        - setting app title and description
+        - getting and displaying available data filter values from database, then getting filter selections from user
+        - querying data as dataframe from database, based on filter values selected by user
+        - making and displaying charts based on queried dataframe
+        - or, in the crop overview, displaying the summary of all fields of the selected crop type (overview_part())
+
+    :param db: data backend (backends.SQLiteBackend/ParquetBackend/DuckDBBackend/ShardedBackend object)
+    :param profiler: instrumentation.Profiler object that records the stages of this app run (None for a new one)
+    :return: no return in script, but deploys streamlit app functionalities (filters, charts)
+    """
+    if profiler is None:
+        profiler = Profiler()
+
+    # print app title and description
+    st.title('Radar Crop Monitor App')
+    st.markdown('This app can be used to display SAR parameters and NDVI values for crop monitoring.')
+    st.markdown("Please select the main and dependent filter first. Note that displaying the data may take some time.")
+    st.markdown('#')
+
+    # print titles for data filters in app
+    # select view: time series of the selected fields, or summary of all fields of the crop type (crop overview)
+    view_selection = st.sidebar.radio("View", ("Fields", "Crop overview"))
+
+    st.sidebar.title("Filter")
+    st.sidebar.markdown("#")
+    st.sidebar.header('Main Filter')
+
+    # define dict of filter values that need to be converted from abbreviations to full words
+    string_dict = {"DEMM": "Demmin", "FRIEN": "Frienstedt", "MRKN": "Markneukirchen",
+                   "A": "Ascending", "D": "Descending"}
+
+    # get filter values from the cached filter catalog (only rebuilt when the database changes)
+    # abbreviated values (in aoi/acquisition) are converted to full words with replace_strings()
+    with profiler.stage("filter_values") as stage:
+        catalog = db.catalog()
+        stage["values"] = sum(len(values) for values in catalog.values.values())
+    aoi_names = replace_strings(catalog.values["aoi"], string_dict)
+    years = catalog.values["year"]
+    crop_types = catalog.values["crop_type"]
+    parameter = catalog.values["parameter"]
+    stats = catalog.values["statistic"]
+
+    # get single value selections of main filters from user
+    # full words (in aoi) are converted back to abbreviations for sql query
+    aoi_selection = [st.sidebar.selectbox("AOI", aoi_names)]
+    aoi_selection = replace_strings(aoi_selection, string_dict)
+    aoi_selection = aoi_selection[0]
+    year_selection = st.sidebar.selectbox("Year", years)
+    crop_selection = st.sidebar.selectbox("Crop Type", crop_types)
+    stat_selection = st.sidebar.selectbox("Statistic", stats)
+
+    # narrow dependent filter values to those that exist for the selected AOI, year and crop type
+    dependent_values = catalog.dependent_values(aoi_selection, year_selection, crop_selection)
+    products = dependent_values["product"]
+    acq_types = replace_strings(dependent_values["acquisition"], string_dict)
+    fid = dependent_values["fid"]
+
+    # print title for dependent filters in app
+    st.sidebar.markdown('#')
+    st.sidebar.header('Dependent Filter')
+
+    # get tuples of multiselections (dependent filters) from user
+    # full words (in acquisition) are converted back to abbreviations for sql query
+    acq_selection = st.sidebar.multiselect("Acquisition Mode", acq_types)
+    acq_selection = replace_strings(acq_selection, string_dict)
+    acq_selection = tuple(acq_selection)
+    product_selection = tuple(st.sidebar.multiselect("Product", products))
+    # derived parameters (ratio, difference, anomalies) are computed from the loaded records (see derived.py)
+    param_selection = tuple(st.sidebar.multiselect("Parameter", parameter + derived_parameters(parameter)))
+    fid_selection = tuple(st.sidebar.multiselect("FID", fid))
+
+    # print data source and contributors in app
+    st.sidebar.markdown("#")
+    st.sidebar.markdown("Data Source: ESA Copernicus-Data")
+    st.sidebar.markdown("Contributors: Markus Adam, Laura Walder")
+
+    # print when the cached data was last refreshed (appended acquisitions are merged into the cached data,
+    # see deltas.py)
+    refresh = db.refresh_info()
+    if refresh:
+        st.sidebar.caption("Data last refreshed: {} ({})".format(refresh["refreshed"], refresh_text(refresh)))
+
+    # print stats of database connection pools (shared by all app sessions)
+    with st.sidebar.expander("Database connections"):
+        st.json(pool_stats())
+
+    # print stats of query result cache (shared by all app sessions)
+    with st.sidebar.expander("Query cache"):
+        st.json(result_cache.stats())
+        st.json(prefetcher.stats())
+
+    # record details of the stages of this app run (chart sizes, query plans) for the performance panel
+    profiler.detailed = st.sidebar.checkbox("Show performance details")
+
+    # load the records of SQLite databases chunk by chunk with progress and preview charts (the query is
+    # cancelled when the filters are changed), Parquet snapshots are read at once
+    stream_load = db.kind == "sqlite" and st.sidebar.checkbox("Load records progressively", value=True)
+
+    # optimize database (year column, indexes, ANALYZE) on request and print query plans before and after
+    # (only for SQLite databases, Parquet snapshots are already columnar and partitioned)
+    if db.kind == "sqlite":
+        with st.sidebar.expander("Database maintenance"):
+            if st.button("Optimize database"):
+                if db.pool.immutable:
+                    st.error("Database is opened as immutable snapshot and cannot be optimized from the app")
+                else:
+                    try:
+                        optimization = optimize_database(db.pool.db_path)
+                        st.text("Query plan before optimization:")
+                        st.code(optimization["before"])
+                        st.text("Query plan after optimization:")
+                        st.code(optimization["after"])
+                    except sqlite3.Error as error:
+                        st.error("Error while optimizing database:" + str(error))
+            # the summary tables are stored in a side database, so they can also be refreshed for immutable databases
+            if st.button("Refresh summary tables"):
+                try:
+                    refresh = refresh_summaries(db.pool.db_path)
+                    st.text("Refreshed {} AOI/year combinations ({} rows) in {} s".format(
+                        len(refresh["refreshed"]), refresh["rows"], refresh["seconds"]))
+                except (sqlite3.Error, OSError) as error:
+                    st.error("Error while refreshing summary tables:" + str(error))
+
+    # define list of multiselection tuples
+    dependent_selections = [acq_selection, product_selection, param_selection, fid_selection]
+
+    # normalize filter selections (sorted tuples of unique values), so they can be used as cache key
+    # (the records of the parameters the derived parameters are computed from are loaded instead of them)
+    selection = normalize_selection(aoi_selection, year_selection, crop_selection, stat_selection,
+                                    acq_selection, product_selection, source_parameters(param_selection),
+                                    fid_selection)
+
+    # show the crop overview from the summary tables instead of the records of the selected fields
+    if view_selection == "Crop overview":
+        overview_part(db, selection, profiler)
+        display_performance(profiler)
+        return
+
+    # load the records of all dependent filter values of the selected main filters in the background, so that
+    # later changes of the dependent filters are answered from memory
+    # (a prefetch of the previous main filters of this session is dropped if it has not started yet, supersets that
+    # are too large for the result cache according to the record counts of the catalog are not prefetched)
+    superset = superset_selection(selection, dependent_values, parameter)
+    if superset != selection:
+        if "prefetch_session" not in st.session_state:
+            st.session_state["prefetch_session"] = uuid.uuid4().hex
+        prefetcher.prefetch(db, superset, st.session_state["prefetch_session"],
+                            catalog.row_count(aoi_selection, year_selection, crop_selection, stat_selection))
+
+    # load records of selection as dataframe by filtering the prefetched superset (if it has been loaded already),
+    # or from backend (parameterized sql query with pooled connection for databases, filtered scan for Parquet
+    # snapshots), or from the result cache if this selection has already been loaded and the data has not
+    # changed since
+    with profiler.stage("records_query") as stage:
+        records = prefetcher.lookup(db, superset, selection)
+        stage["prefetched"] = records is not None
+        if records is None and stream_load:
+            records = stream_records(db, selection, stat_selection, stage)
+        elif records is None:
+            records = db.load_records(selection, timings=stage)
+        profiler.add_frame(stage, records)
+    # the query plan is recorded in a stage of its own, so its query does not add to the time of the records query
+    if profiler.detailed:
+        with profiler.stage("query_plan") as stage:
+            stage["plan"] = db.explain_records(selection)
+
+    # print dtype and memory usage per column of the loaded records
+    with st.sidebar.expander("Records memory"):
+        st.dataframe(memory_report(records))
+
+    # print warning when no filter is selected and error when invalid filter combination (with no data) is selected
+    if records.empty:
+        if any(len(x) == 0 for x in dependent_selections):
+            st.warning("No selection has been made. Please select filter combination.")
+        else:
+            st.error("No data is available for this filter combination. Please select other filter combinations.")
+
+    # create time slider for date range selection (start and end date of x-axis of charts)
+    # as well as selections for trendlines in chart (LOESS/Rolling Mean)
+    # and for data point coloring variable (FID/Acquisition Mode)
+
+    # get earliest and latest date from dataframe as boundaries for slider
+    # (columns "datetime" and "date" are already converted to datetime64 by the loader)
+    start_date, end_date = date_bounds(records)
+
+    st.markdown("#")
+
+    # define expander box which will contain time slider and radiobuttons for trendline and coloring selection
+    with st.expander("Additional filter", expanded=True):
+
+        # define slider values from user selection and filter dataframe based on these values
+        st.subheader("Select date range")
+        if start_date is None:
+            st.warning("Date range slider is only available after a valid filter combination has been selected")
+            date_range = None
+        else:
+            slider_1, slider_2 = st.slider('', value=(start_date, end_date), format="DD.MM.YY")
+            with profiler.stage("date_filter") as stage:
+                records = records[(records["date"] >= pd.Timestamp(slider_1))
+                                  & (records["date"] <= pd.Timestamp(slider_2))]
+                profiler.add_frame(stage, records)
+            date_range = (slider_1, slider_2)
+
+        st.markdown("#")
+
+        # make columns for trendline/coloring/point reduction selection buttons
+        col1, col2, col3 = st.columns(3)
+
+        # make button for selection of trendline type
+        col1.subheader("Select trendline")
+        stat_button = col1.radio("", ("None", "LOESS", "Rolling Mean"))
+        trend_per_fid = col1.checkbox("Trendline per FID")
+
+        # make button for selection of coloring column
+        col2.subheader("Select data point coloring")
+        color_button = col2.radio("", ("by FID", "by Acquisiton Mode"))
+
+        # make button for selection of point reduction method (applied to charts with more points than pixels)
+        col3.subheader("Select point reduction")
+        reduction_button = col3.radio("", ("LTTB", "Min/Max", "None"))
+        combine_charts = col3.checkbox("Combine charts (shared date axis)")
+
+    st.markdown("#")
+
+    # create charts (scatterplots and trendlines) for VV, VH and NDVI values
+
+    # remap acquisition values from abbreviations (A/D) to full words (ascending/descending)
+    records["acquisition"] = records["acquisition"].map({"A": "ascending", "D": "descending"})
+
+    # set dataframe column by which points are colored in charts (acquisition or fid, based on user selection)
+    if color_button == "by FID":
+        color_selection = alt.selection_multi(fields=['fid'], bind='legend')
+        color_column = "fid"
+        sort = None
+    else:
+        color_selection = alt.selection_multi(fields=['acquisition'], bind='legend')
+        color_column = "acquisition"
+        sort = ["D"]
+
+    # get earliest and latest acquisition time again from potentially time-filtered dataframe
+    start_date = records["datetime"].min()
+    end_date = records["datetime"].max()
+
+    # set domain containing earliest and latest date in dataframe, used as boundaries for x-axis of charts
+    domain_pd = pd.to_datetime([start_date, end_date]).view("int64") / 10 ** 6
+
+    # set grouping of trendlines and version of data (trendlines are cached per data version, selection,
+    # date range and parameter); the trendlines are grouped by the legend column as well, so they follow the
+    # legend selection, and without "Trendline per FID" the line pooled over all points is shown while no legend
+    # value is selected
+    trend_group = tuple(dict.fromkeys(["fid", color_column] if trend_per_fid else [color_column]))
+    data_version = db.version()
+
+    # split records by parameter in a single pass (each subset is the one dataset of its chart)
+    parameter_records = split_by_parameter(records, param_selection)
+
+    # compute the selected derived parameters from the records; the anomalies are computed against all fields of
+    # the crop type (peers), whose records are loaded at once if they have not been prefetched yet (the anomalies
+    # are not shown if they are too large to be loaded), and the ratio/difference are only computed if the values
+    # of their parameters have one unit
+    derived_selection = [param for param in param_selection if is_derived(param)]
+    anomaly_selection = [param for param in derived_selection if param.endswith(ANOMALY_SUFFIX)]
+    pair_units = {param: pair_unit(records, param) for param in derived_selection if param in PAIR_PARAMETERS}
+    skipped = []
+    peers = records
+    if anomaly_selection and not records.empty and superset != selection:
+        if prefetcher.fits(catalog.row_count(aoi_selection, year_selection, crop_selection, stat_selection)):
+            with profiler.stage("peer_records") as stage:
+                with st.spinner("Loading the fields of the crop type for the anomalies..."):
+                    peers = prefetcher.load(db, superset)
+                profiler.add_frame(stage, peers)
+        else:
+            st.info("Anomalies are not shown, as the records of all fields of the crop type are too large to be "
+                    "loaded")
+            skipped.extend(anomaly_selection)
+    for param, unit in pair_units.items():
+        if unit is None and records["parameter"].isin(PAIR_PARAMETERS[param][:2]).any():
+            st.warning("{} is not shown, as the values of {} and {} have no unit or different units".format(
+                param, *PAIR_PARAMETERS[param][:2]))
+            skipped.append(param)
+    derived_selection = [param for param in derived_selection if param not in skipped]
+    if derived_selection:
+        with profiler.stage("derived_parameters") as stage:
+            parameter_records.update(derived_records(records, derived_selection, peers))
+            stage["peer_fids"] = int(peers["fid"].nunique())
+
+    # go through selected parameters, compute trendline from all points of parameter subset, reduce subset to
+    # the point budget of the chart (if selected) and make corresponding charts, if data is available
+    charts = []
+    for param in param_selection:
+        if param not in CHART_TITLES and not is_derived(param):
+            continue
+        if param not in parameter_records:
+            # if selection has been made, but no data with parameter available (derived parameters that are not
+            # shown have been reported above):
+            if records.empty is False and param not in skipped:
+                st.warning("No data available for parameter {}".format(param))
+            continue
+        with profiler.stage("post_processing:" + param) as stage:
+            pol_records = parameter_records[param]
+            trend_key = (db.key, data_version, (selection, date_range, param))
+            trend = get_trendline(pol_records, stat_button, trend_group, CHART_WIDTH, trend_key)
+            pooled = None if trend_per_fid else get_trendline(pol_records, stat_button, None, CHART_WIDTH, trend_key)
+            pol_records, dropped = decimate_records(pol_records, CHART_WIDTH, reduction_button,
+                                                    group_columns=("fid",))
+            profiler.add_frame(stage, pol_records)
+            stage["dropped_points"] = dropped
+        with profiler.stage("make_chart:" + param):
+            label = axis_label(param, stat_selection, pair_units.get(param))
+            chart = make_chart(pol_records, label, domain_pd, color_selection, color_column, sort,
+                               CHART_TITLES.get(param) or derived_title(param), stat_button, dropped, trend,
+                               add_selection=not (combine_charts and charts), pooled_records=pooled)
+        profiler.add_chart("chart_spec:" + param, chart)
+        charts.append((param, chart))
+
+    # display charts one below the other, or as one combined chart with a shared date axis
+    # (the time covers the serialization of the charts on the server, not the rendering in the browser)
+    if combine_charts and charts:
+        with profiler.stage("display_chart:combined"):
+            display_chart(alt.vconcat(*[chart for _, chart in charts]).resolve_scale(x="shared"))
+    else:
+        for param, chart in charts:
+            with profiler.stage("display_chart:" + param):
+                display_chart(chart)
+
+    # show map of selected fields on request (geometries are only loaded when the map is shown, and are cached
+    # simplified per field)
+    st.markdown("#")
+    if not records.empty and st.checkbox("Show field map"):
+        features = field_features(db, selection.aoi, selection.year, selection.fid)
+        if features:
+            st.altair_chart(make_map(features, "Fields").configure_title(fontSize=28).
+                            configure_legend(titleFontSize=20, labelFontSize=18))
+        else:
+            st.warning("No geometries available for the selected FIDs")
+
+    # print the stages of this app run (time, rows, memory, chart size) and the query plan of the main query
+    display_performance(profiler)
@@ -0,0 +1,519 @@
+"""
+This module contains the data backends of the Radar Crop Monitor app. A backend provides the filter catalog and
+the records of a filter selection, so the app does not depend on how the data is stored:
+    - SQLiteBackend: the SQLite database of the project (default)
+    - ParquetBackend: a columnar Parquet snapshot created with export_parquet.py, read with pyarrow
+    - DuckDBBackend: the same Parquet snapshot, queried with DuckDB (optional dependency)
+    - ShardedBackend: an archive split into several databases (e.g. one per campaign year and AOI), given as
+      directory of database files or as list of paths
+
+The Parquet backends push the filters down to the dataset scan (whole aoi/year partitions are skipped) and only
+read the columns of the main query, converted to the same typed dataframes as the SQLite records (see loader.py).
+The sharded backend only queries the shards that contain the selected AOI and year (routing index built from the
+filter catalogs of the shards) and queries several shards in parallel threads.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from catalog import cached_catalog, get_catalog, make_catalog, union_catalogs
+from data_paths import EXPORT_MARKER, SHARD_SEPARATOR, is_parquet_export, shard_paths
+from db_pool import REQUIRED_TABLES, get_pool
+from deltas import get_tracker
+from export_parquet import RECORDS_DIR
+from loader import concat_typed, load_typed, merge_records, typed_records
+from queries import explain_query_plan, geometries_sql, has_year_column, partition_sql, records_sql
+from query_cache import cached_records, load_records, result_cache
+from streaming import StreamingQuery
+
+# DuckDB is optional and only needed for DuckDBBackend
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# columns of the records dataframe, in the order of the main query of the app
+RECORD_COLUMNS = ["value", "mask_label", "unit", "aoi", "datetime", "parameter", "acquisition",
+                  "product", "fid", "year", "sl_nr", "crop_type_code", "crop_type"]
+
+# maximum number of shards that are queried in parallel
+SHARD_WORKERS = 8
+
+
+# define function to convert an arrow table to a dataframe with Arrow-backed string columns
+def arrow_to_pandas(table):
+    """
+    :param table: pyarrow.Table
+    :return: dataframe in which string columns keep their Arrow memory (pandas "string[pyarrow]" dtype)
+    """
+    string_dtype = pd.StringDtype("pyarrow")
+    return table.to_pandas(types_mapper=lambda arrow_type: string_dtype if arrow_type == pa.string() else None)
+
+
+# define function to convert the arrow table of a records query to a typed dataframe
+def convert_table(table, start, timings=None):
+    """
+    :param table: pyarrow.Table with records
+    :param start: time.perf_counter() value of the start of the query
+    :param timings: dictionary to which "query_seconds" and "convert_seconds" are added, or None
+    :return: typed dataframe with records (see loader.py)
+    """
+    converted = time.perf_counter()
+    records = typed_records(arrow_to_pandas(table))
+    if timings is not None:
+        timings["query_seconds"] = round(converted - start, 6)
+        timings["convert_seconds"] = round(time.perf_counter() - converted, 6)
+    return records
+
+
+# define class for the SQLite backend
+class SQLiteBackend:
+    """
+    Backend reading the SQLite database through the shared connection pool (see db_pool.py).
+
+    :param pool: db_pool.ConnectionPool object of database
+    """
+    kind = "sqlite"
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.key = pool.db_path
+
+    def version(self):
+        """
+        :return: tuple with epoch and maximum rowid of the database (see deltas.DeltaTracker.current())
+        """
+        return get_tracker(self.pool).current()
+
+    def refresh_info(self):
+        """
+        :return: dictionary with time of the last refresh of the cached data and kind of the change
+            (see deltas.DeltaTracker.info())
+        """
+        return get_tracker(self.pool).info()
+
+    def table_names(self):
+        return self.pool.table_names()
+
+    def catalog(self):
+        """
+        :return: catalog.FilterCatalog object with filter values
+        """
+        return get_catalog(self.pool)
+
+    def load_records(self, selection, timings=None):
+        """
+        :param selection: queries.FilterSelection object
+        :param timings: dictionary to which cache hit and timings are added (see query_cache.load_records()), or None
+        :return: dataframe with records of selection (see query_cache.load_records())
+        """
+        return load_records(self.pool, selection, timings=timings)
+
+    def cached_records(self, selection, count=True):
+        """
+        :param selection: queries.FilterSelection object
+        :param count: if False, the lookup is not counted as cache hit or miss
+        :return: cached dataframe with records of selection (must not be modified), None if it is not cached
+            (see query_cache.cached_records())
+        """
+        return cached_records(self.pool, selection, copy=False, count=count)
+
+    def stream_records(self, selection):
+        """
+        :param selection: queries.FilterSelection object
+        :return: started streaming.StreamingQuery object that loads the records of the selection chunk by chunk
+        """
+        return StreamingQuery(self.pool, selection).start()
+
+    def load_partition(self, aoi, year, statistic):
+        """
+        :param aoi: string with AOI
+        :param year: year
+        :param statistic: string with statistic
+        :return: typed dataframe with all records of the AOI, year and statistic (not cached)
+        """
+        with self.pool.connection() as db:
+            return load_typed(db, partition_sql(has_year_column(db)), [aoi, year, statistic])
+
+    def explain_records(self, selection):
+        """
+        :param selection: queries.FilterSelection object
+        :return: string with query plan of the main query for the selection
+        """
+        with self.pool.connection() as db:
+            sql_body, params = records_sql(selection, year_column=has_year_column(db))
+            return explain_query_plan(db, sql_body, params)
+
+    def load_geometries(self, aoi, year, fids):
+        """
+        :param aoi: string with AOI
+        :param year: year of fields
+        :param fids: list with FIDs
+        :return: dictionary with geometry value of database per FID (see geometry.py)
+        """
+        with self.pool.connection() as db:
+            rows = db.execute(geometries_sql(fids), [aoi, year] + list(fids)).fetchall()
+        return dict(rows)
+
+
+# define class for the Parquet backend
+class ParquetBackend:
+    """
+    Backend reading a Parquet snapshot created with export_parquet.py, using pyarrow datasets.
+
+    :param export_dir: string with path to export directory
+    """
+    kind = "parquet"
+
+    def __init__(self, export_dir):
+        self.export_dir = os.path.abspath(export_dir)
+        self.key = self.export_dir
+        self._dataset = None
+        self._dataset_version = None
+
+    def version(self):
+        """
+        :return: tuple with modification time and size of the export marker (rewritten by every export)
+        """
+        stat = os.stat(os.path.join(self.export_dir, EXPORT_MARKER))
+        return stat.st_mtime_ns, stat.st_size
+
+    def metadata(self):
+        with open(os.path.join(self.export_dir, EXPORT_MARKER)) as marker_file:
+            return json.load(marker_file)
+
+    def refresh_info(self):
+        """
+        :return: dictionary with time of the export ("refreshed") and kind of the change ("export")
+        """
+        return {"refreshed": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.metadata()["created"])),
+                "change": "export", "new_rows": None}
+
+    def table_names(self):
+        # the records dataset contains the joined tables of the database
+        return list(REQUIRED_TABLES)
+
+    def dataset(self):
+        """
+        :return: pyarrow.dataset.Dataset of the records, partitioned by aoi and year (reopened after a new export)
+        """
+        version = self.version()
+        if self._dataset is None or self._dataset_version != version:
+            year_type = pa.string() if self.metadata()["year_type"] == "string" else pa.int64()
+            partitioning = ds.partitioning(pa.schema([("aoi", pa.string()), ("year", year_type)]), flavor="hive")
+            self._dataset = ds.dataset(os.path.join(self.export_dir, RECORDS_DIR), format="parquet",
+                                       partitioning=partitioning)
+            self._dataset_version = version
+        return self._dataset
+
+    def catalog(self):
+        """
+        :return: catalog.FilterCatalog object with filter values (cached until the next export)
+        """
+        return cached_catalog(self.key, self.version(), self._build_catalog)
+
+    def _build_catalog(self, version):
+        areas = pq.read_table(os.path.join(self.export_dir, "areaofinterest.parquet"),
+                              columns=["aoi", "year", "fid"]).to_pandas()
+        crop_types = pq.read_table(os.path.join(self.export_dir, "croplegend.parquet"),
+                                   columns=["crop_type"]).to_pandas()
+        observations = self.dataset().to_table(columns=["aoi", "year", "crop_type", "fid", "product",
+                                                        "acquisition", "parameter", "statistic"]).to_pandas()
+        s1_values = observations[["product", "acquisition", "parameter", "statistic"]].drop_duplicates()
+        combinations = observations.groupby(["aoi", "year", "crop_type", "fid", "product", "acquisition", "statistic"],
+                                            sort=False, observed=True).size().reset_index(name="row_count")
+        combinations = combinations.sort_values("fid", kind="stable")
+        return make_catalog(areas, crop_types, s1_values, combinations, version)
+
+    def read_records(self, selection, timings=None):
+        """
+        Reads the records of a filter selection from the dataset. The filter is pushed down to the scan, so only
+        the matching aoi/year partition and row groups are read.
+
+        :param selection: queries.FilterSelection object
+        :param timings: dictionary to which the time of the scan ("query_seconds") and of the conversion to the typed
+            dataframe ("convert_seconds") is added, or None
+        :return: typed dataframe with records of selection (columns as in RECORD_COLUMNS, see loader.py)
+        """
+        start = time.perf_counter()
+        # an empty value set has type null, which pyarrow cannot compare with the column, but would match no rows
+        if any(len(values) == 0 for values in (selection.product, selection.acquisition, selection.parameter,
+                                               selection.fid)):
+            return convert_table(self.dataset().schema.empty_table().select(RECORD_COLUMNS), start, timings)
+        expression = ((ds.field("aoi") == selection.aoi) & (ds.field("year") == selection.year)
+                      & (ds.field("crop_type") == selection.crop_type)
+                      & (ds.field("statistic") == selection.statistic)
+                      & ds.field("product").isin(list(selection.product))
+                      & ds.field("acquisition").isin(list(selection.acquisition))
+                      & ds.field("parameter").isin(list(selection.parameter))
+                      & ds.field("fid").isin(list(selection.fid)))
+        table = self.dataset().to_table(columns=RECORD_COLUMNS, filter=expression)
+        table = table.sort_by([("mask_label", "ascending"), ("datetime", "ascending")])
+        return convert_table(table, start, timings)
+
+    def load_records(self, selection, timings=None):
+        """
+        :param selection: queries.FilterSelection object
+        :param timings: dictionary to which "cached" and the timings of read_records() are added, or None
+        :return: dataframe with records of selection (from the process-wide result cache, if available)
+        """
+        version = self.version()
+        records = result_cache.get(self.key, selection, version)
+        if timings is not None:
+            timings["cached"] = records is not None
+        if records is None:
+            records = self.read_records(selection, timings)
+            result_cache.put(self.key, selection, version, records)
+        return records
+
+    def cached_records(self, selection, count=True):
+        """
+        :param selection: queries.FilterSelection object
+        :param count: if False, the lookup is not counted as cache hit or miss
+        :return: cached dataframe with records of selection (must not be modified), None if it is not cached
+        """
+        return result_cache.get(self.key, selection, self.version(), copy=False, count=count)
+
+    def load_partition(self, aoi, year, statistic):
+        """
+        :param aoi: string with AOI
+        :param year: year
+        :param statistic: string with statistic
+        :return: typed dataframe with all records of the AOI, year and statistic (not cached)
+        """
+        expression = ((ds.field("aoi") == aoi) & (ds.field("year") == year)
+                      & (ds.field("statistic") == statistic))
+        table = self.dataset().to_table(columns=RECORD_COLUMNS, filter=expression)
+        table = table.sort_by([("mask_label", "ascending"), ("datetime", "ascending")])
+        return typed_records(arrow_to_pandas(table))
+
+    def load_geometries(self, aoi, year, fids):
+        """
+        :param aoi: string with AOI
+        :param year: year of fields
+        :param fids: list with FIDs
+        :return: dictionary with geometry value per FID (empty for exports without geometries)
+        """
+        path = os.path.join(self.export_dir, "areaofinterest.parquet")
+        if not fids or "field_geom" not in pq.read_schema(path).names:
+            return {}
+        areas = pq.read_table(path, columns=["fid", "field_geom"],
+                              filters=[("aoi", "=", aoi), ("year", "=", year), ("fid", "in", list(fids))])
+        return dict(zip(areas.column("fid").to_pylist(), areas.column("field_geom").to_pylist()))
+
+    def explain_records(self, selection):
+        """
+        :param selection: queries.FilterSelection object
+        :return: None (Parquet snapshots are not queried with SQL)
+        """
+        return None
+
+
+# define class for the DuckDB backend
+class DuckDBBackend(ParquetBackend):
+    """
+    Backend querying a Parquet snapshot created with export_parquet.py with DuckDB.
+    Requires the optional package duckdb.
+
+    :param export_dir: string with path to export directory
+    """
+    kind = "duckdb"
+
+    def __init__(self, export_dir):
+        if duckdb is None:
+            raise ImportError("DuckDBBackend requires the package duckdb (pip install duckdb)")
+        super().__init__(export_dir)
+
+    def read_records(self, selection, timings=None):
+        """
+        :param selection: queries.FilterSelection object
+        :param timings: dictionary to which the timings of the query and conversion are added, or None
+        :return: typed dataframe with records of selection (columns as in RECORD_COLUMNS, see loader.py)
+        """
+        multiselections = [selection.product, selection.acquisition, selection.parameter, selection.fid]
+        # an empty IN list is a syntax error in DuckDB, but would match no rows anyway
+        start = time.perf_counter()
+        if any(len(values) == 0 for values in multiselections):
+            return convert_table(self.dataset().schema.empty_table().select(RECORD_COLUMNS), start, timings)
+
+        files = os.path.join(self.export_dir, RECORDS_DIR, "*", "*", "*.parquet").replace("'", "''")
+        in_lists = ["(" + ", ".join("?" * len(values)) + ")" for values in multiselections]
+        sql_body = """SELECT {columns}
+            FROM read_parquet('{files}', hive_partitioning=true)
+            WHERE aoi = ? AND year = ? AND crop_type = ? AND statistic = ?
+            AND product IN {} AND acquisition IN {} AND parameter IN {} AND fid IN {}
+            ORDER BY mask_label, datetime ASC;""".format(*in_lists, columns=", ".join(RECORD_COLUMNS), files=files)
+        params = [selection.aoi, selection.year, selection.crop_type, selection.statistic]
+        for values in multiselections:
+            params += list(values)
+
+        connection = duckdb.connect()
+        try:
+            table = connection.execute(sql_body, params).fetch_arrow_table()
+        finally:
+            connection.close()
+        return convert_table(table, start, timings)
+
+
+# define class for the backend of an archive split into several databases
+class ShardedBackend:
+    """
+    Backend combining several backends (shards), e.g. one database per campaign year and AOI.
+    The filter catalogs of the shards are unioned, and records are only loaded from the shards that contain data
+    of the selected AOI and year (in parallel threads if there are several, see routing_index()).
+
+    :param shards: list of backends (SQLiteBackend, ParquetBackend or DuckDBBackend objects)
+    :param max_workers: maximum number of shards queried in parallel
+    """
+    kind = "sharded"
+
+    def __init__(self, shards, max_workers=SHARD_WORKERS):
+        self.shards = shards
+        self.max_workers = max_workers
+        self.key = "shards:" + SHARD_SEPARATOR.join(shard.key for shard in shards)
+
+    def version(self):
+        return tuple(shard.version() for shard in self.shards)
+
+    def refresh_info(self):
+        """
+        :return: dictionary with the refresh info of the shard that has been refreshed last (see refresh_info() of
+            the shard backends)
+        """
+        infos = [info for info in (shard.refresh_info() for shard in self.shards) if info]
+        return max(infos, key=lambda info: info["refreshed"]) if infos else {}
+
+    def table_names(self):
+        """
+        :return: list with the table names that exist in all shards (empty if a shard is not a valid database)
+        """
+        names = None
+        for shard in self.shards:
+            shard_names = shard.table_names()
+            names = shard_names if names is None else [name for name in names if name in shard_names]
+        return names or []
+
+    def catalog(self):
+        """
+        :return: catalog.FilterCatalog object with the filter values of all shards (cached until a shard changes)
+        """
+        return cached_catalog(self.key, self.version(),
+                              lambda version: union_catalogs([shard.catalog() for shard in self.shards], version))
+
+    def routing_index(self):
+        """
+        :return: dictionary with (aoi, year) tuples as keys and lists of the shards with data of the AOI and year as
+            values (built from the cached catalogs of the shards)
+        """
+        routing = {}
+        for shard in self.shards:
+            for aoi, year, _ in shard.catalog().dependent_index:
+                shards = routing.setdefault((aoi, year), [])
+                if not shards or shards[-1] is not shard:
+                    shards.append(shard)
+        return routing
+
+    def _fan_out(self, aoi, year, function):
+        # apply function to the shards with data of the AOI and year, in parallel threads if there are several
+        shards = self.routing_index().get((aoi, year), [])
+        if len(shards) <= 1:
+            return [function(shard) for shard in shards]
+        with ThreadPoolExecutor(max_workers=min(len(shards), self.max_workers)) as executor:
+            return list(executor.map(function, shards))
+
+    def load_records(self, selection, timings=None):
+        """
+        :param selection: queries.FilterSelection object
+        :param timings: dictionary to which "shards", "cached" (True if the results of all shards were cached) and
+            "query_seconds" (wall time of the parallel queries) are added, or None
+        :return: typed dataframe with records of selection from all shards (results are cached per shard)
+        """
+        start = time.perf_counter()
+        shard_timings = []
+
+        def load(shard):
+            shard_timing = {}
+            shard_timings.append(shard_timing)
+            return shard.load_records(selection, timings=shard_timing)
+
+        frames = self._fan_out(selection.aoi, selection.year, load)
+        if timings is not None:
+            timings["shards"] = len(frames)
+            timings["cached"] = all(shard_timing.get("cached") for shard_timing in shard_timings)
+            timings["query_seconds"] = round(time.perf_counter() - start, 6)
+        return merge_records(frames, RECORD_COLUMNS) if frames else concat_typed([], RECORD_COLUMNS)
+
+    def cached_records(self, selection, count=True):
+        """
+        :param selection: queries.FilterSelection object
+        :param count: if False, the lookups are not counted as cache hits or misses
+        :return: dataframe with records of selection merged from the cached results of the shards, None if the
+            result of a shard is not cached
+        """
+        frames = self._fan_out(selection.aoi, selection.year, lambda shard: shard.cached_records(selection, count))
+        if any(frame is None for frame in frames):
+            return None
+        return merge_records(frames, RECORD_COLUMNS) if frames else concat_typed([], RECORD_COLUMNS)
+
+    def load_partition(self, aoi, year, statistic):
+        """
+        :param aoi: string with AOI
+        :param year: year
+        :param statistic: string with statistic
+        :return: typed dataframe with all records of the AOI, year and statistic from all shards (not cached)
+        """
+        frames = self._fan_out(aoi, year, lambda shard: shard.load_partition(aoi, year, statistic))
+        return merge_records(frames, RECORD_COLUMNS) if frames else concat_typed([], RECORD_COLUMNS)
+
+    def explain_records(self, selection):
+        """
+        :param selection: queries.FilterSelection object
+        :return: string with query plans of the shards with data of the selection, None if there are none
+        """
+        plans = []
+        for shard in self.routing_index().get((selection.aoi, selection.year), []):
+            plan = shard.explain_records(selection)
+            if plan is not None:
+                plans.append("{}:\n{}".format(shard.key, plan))
+        return "\n\n".join(plans) or None
+
+    def load_geometries(self, aoi, year, fids):
+        """
+        :param aoi: string with AOI
+        :param year: year of fields
+        :param fids: list with FIDs
+        :return: dictionary with geometry value per FID from the shards with data of the AOI and year
+        """
+        geometries = {}
+        for shard_geometries in self._fan_out(aoi, year, lambda shard: shard.load_geometries(aoi, year, fids)):
+            geometries.update(shard_geometries)
+        return geometries
+
+
+# define function to open the backend for a path
+def open_backend(path, immutable=False, parquet_engine="pyarrow"):
+    """
+    Opens a sharded backend if the path is a directory of database files or a list of paths, a Parquet backend if
+    the path is a Parquet export directory, else the SQLite backend (default).
+
+    :param path: string with path to database file, Parquet export directory or directory of database files,
+        or paths separated by SHARD_SEPARATOR, or list of paths
+    :param immutable: if True, the SQLite database is opened as immutable snapshot (see db_pool.py)
+    :param parquet_engine: string with engine for Parquet exports ("pyarrow" or "duckdb")
+    :return: SQLiteBackend, ParquetBackend, DuckDBBackend or ShardedBackend object
+    """
+    paths = shard_paths(path)
+    if paths is not None:
+        return ShardedBackend([open_backend(shard_path, immutable, parquet_engine) for shard_path in paths])
+    if is_parquet_export(path):
+        if parquet_engine == "duckdb":
+            return DuckDBBackend(path)
+        return ParquetBackend(path)
+    return SQLiteBackend(get_pool(path, immutable=immutable))
@@ -0,0 +1,340 @@
+"""
+This script can be used to export the VV/VH/NDVI charts of the Radar Crop Monitor app for many filter combinations
+without Streamlit, e.g. for reports. By default, one chart per parameter is exported for every FID of every crop type,
+AOI and year (with --per-crop, one chart per crop type with all its FIDs).
+
+The charts are made with make_chart() of the app (see charts.py, which does not import Streamlit). The work is split
+into one task per AOI, year and statistic, which runs one query for all records of the AOI and year and splits them
+in memory by crop type, FID and parameter.
+The tasks run in a process pool. The export can be restarted: existing charts are not exported again, and tasks
+whose charts have all been exported with the same options are skipped without querying the database. Existing
+charts are replaced if the trendline or point reduction has changed since they were exported.
+
+Output files: <output_dir>/<aoi>/<year>/<statistic>/<crop_type>/fid_<fid>_<parameter>.<format>
+(<crop_type>_<parameter>.<format> with --per-crop)
+
+Usage: python batch_export.py <path_to_database> <output_dir> [--aois ...] [--years ...] [--crop-types ...]
+[--statistics ...] [--parameters ...] [--formats html json png] [--trendline LOESS] [--reduction LTTB]
+[--per-crop] [--workers N]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import altair as alt
+from altair.utils.html import spec_to_html
+from backends import open_backend
+from charts import CHART_TITLES, CHART_WIDTH, axis_label, make_chart, split_by_parameter
+from decimation import decimate_records
+from trendlines import get_trendline
+
+# output formats (PNG requires the package altair_saver)
+FORMATS = ["html", "json", "png"]
+
+# directory with the markers of the completed tasks inside the output directory
+DONE_DIR = "_done"
+
+# options of a task that determine its charts (tasks are exported again if one of them changes)
+OPTION_KEYS = ["crop_types", "parameters", "formats", "trendline", "reduction", "per_crop"]
+
+# options that change the content of the chart files (files exported with other values are replaced)
+CONTENT_KEYS = ["trendline", "reduction"]
+
+
+# define function to convert a filter value to a part of a file name
+def slug(value):
+    """
+    :param value: filter value
+    :return: string with letters, digits, "-" and "_" only
+    """
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", str(value)).strip("_")
+
+
+# define function to get the path of a chart file
+def chart_path(output_dir, aoi, year, statistic, crop_type, fid, param, file_format):
+    """
+    :param output_dir: string with path to output directory
+    :param aoi: string with AOI
+    :param year: year
+    :param statistic: string with statistic
+    :param crop_type: string with crop type
+    :param fid: FID of chart, None for a chart with all FIDs of the crop type
+    :param param: string with parameter (VV,VH,NDVI)
+    :param file_format: string with format ("html", "json" or "png")
+    :return: string with path of chart file
+    """
+    name = "fid_{}_{}".format(slug(fid), param) if fid is not None else "{}_{}".format(slug(crop_type), param)
+    return os.path.join(output_dir, slug(aoi), slug(year), slug(statistic), slug(crop_type),
+                        "{}.{}".format(name, file_format))
+
+
+# define function to get the path of the marker of a completed task
+def done_path(output_dir, aoi, year, statistic):
+    """
+    :return: string with path of the marker file of the task (AOI, year and statistic)
+    """
+    return os.path.join(output_dir, DONE_DIR, "{}_{}_{}.json".format(slug(aoi), slug(year), slug(statistic)))
+
+
+# define function to get the output options of a task
+def task_options(task):
+    """
+    :param task: task dictionary (see export_task())
+    :return: dictionary with the options of OPTION_KEYS (lists sorted, so their order does not matter)
+    """
+    return {key: sorted(task[key], key=str) if isinstance(task[key], list) else task[key] for key in OPTION_KEYS}
+
+
+# define function to read the marker of a task
+def read_marker(marker):
+    """
+    :param marker: string with path of the marker file (see done_path())
+    :return: dictionary with "options", "outputs" (None if the task has not been completed) and "replace", None
+        if the task has not been started
+    """
+    if not os.path.exists(marker):
+        return None
+    with open(marker) as marker_file:
+        return json.load(marker_file)
+
+
+# define function to write the marker of a task
+def write_marker(marker, content):
+    """
+    :param marker: string with path of the marker file (see done_path())
+    :param content: dictionary with "options", "outputs" and "replace" (see read_marker())
+    """
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker + ".part", "w") as marker_file:
+        json.dump(content, marker_file)
+    os.replace(marker + ".part", marker)
+
+
+# define function to save a chart
+def save_chart(chart, spec, path, file_format):
+    """
+    Saves a chart to a temporary file first and renames it, so interrupted exports leave no incomplete files.
+    HTML and JSON files are written from the specification, which is only built once for all formats.
+
+    :param chart: altair.Chart object
+    :param spec: dictionary with Vega-Lite specification of chart
+    :param path: string with path of chart file
+    :param file_format: string with format ("html", "json" or "png")
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".part"
+    if file_format == "png":
+        chart.save(temporary_path, format="png")
+    else:
+        with open(temporary_path, "w") as chart_file:
+            if file_format == "json":
+                json.dump(spec, chart_file)
+            else:
+                chart_file.write(spec_to_html(spec, "vega-lite", vega_version=alt.VEGA_VERSION,
+                                              vegalite_version=alt.VEGALITE_VERSION,
+                                              vegaembed_version=alt.VEGAEMBED_VERSION))
+    os.replace(temporary_path, path)
+
+
+# define function to export the charts of one task
+def export_task(task):
+    """
+    Exports the charts of one AOI, year and statistic. Runs in a worker process.
+
+    :param task: dictionary with "path", "output_dir", "aoi", "year", "statistic", "crop_types", "parameters",
+        "formats", "trendline", "reduction", "per_crop" and "parquet_engine"
+    :return: dictionary with task, number of rows, exported and skipped charts and seconds
+    """
+    start = time.perf_counter()
+    # existing charts are kept if they have been exported with the same trendline and point reduction (e.g. by an
+    # interrupted run), otherwise they are replaced (also if a run that replaced them has been interrupted)
+    marker = done_path(task["output_dir"], task["aoi"], task["year"], task["statistic"])
+    previous = read_marker(marker)
+    options = task_options(task)
+    replace = previous is not None and (
+        (previous.get("replace", False) and previous.get("outputs") is None)
+        or any(previous.get("options", {}).get(key) != options[key] for key in CONTENT_KEYS))
+    write_marker(marker, {"options": options, "outputs": None, "replace": replace})
+
+    backend = open_backend(task["path"], parquet_engine=task["parquet_engine"])
+    records = backend.load_partition(task["aoi"], task["year"], task["statistic"])
+    records = records[records["crop_type"].isin(task["crop_types"])]
+    records = records.assign(acquisition=records["acquisition"].map({"A": "ascending", "D": "descending"}))
+
+    group_columns = "crop_type" if task["per_crop"] else ["crop_type", "fid"]
+    outputs = []
+    exported = 0
+    skipped = 0
+    # the chart data is embedded completely, as in the app
+    with alt.data_transformers.enable("default", max_rows=None):
+        for key, group in records.groupby(group_columns, sort=False, observed=True):
+            crop_type, fid = (key, None) if task["per_crop"] else key
+            domain = [group["datetime"].min().value / 10 ** 6, group["datetime"].max().value / 10 ** 6]
+            for param, pol_records in split_by_parameter(group, task["parameters"]).items():
+                paths = [chart_path(task["output_dir"], task["aoi"], task["year"], task["statistic"], crop_type,
+                                    fid, param, file_format) for file_format in task["formats"]]
+                outputs += paths
+                if not replace and all(os.path.exists(path) for path in paths):
+                    skipped += len(paths)
+                    continue
+                trend = get_trendline(pol_records, task["trendline"], None, CHART_WIDTH)
+                pol_records, dropped = decimate_records(pol_records, CHART_WIDTH, task["reduction"],
+                                                        group_columns=("fid",))
+                selection = alt.selection_multi(fields=["fid"], bind="legend")
+                title = "{} ({}, {}, {}{})".format(CHART_TITLES[param], crop_type, task["aoi"], task["year"],
+                                                   "" if fid is None else ", FID {}".format(fid))
+                chart = make_chart(pol_records, axis_label(param, task["statistic"]), domain, selection, "fid",
+                                   None, title, task["trendline"], dropped, trend)
+                spec = chart.to_dict()
+                for path, file_format in zip(paths, task["formats"]):
+                    if replace or not os.path.exists(path):
+                        save_chart(chart, spec, path, file_format)
+                        exported += 1
+                    else:
+                        skipped += 1
+
+    # mark the task as completed, so a restarted export with the same options skips it without querying the database
+    write_marker(marker, {"options": options, "outputs": outputs, "replace": False, "rows": len(records)})
+    return {"aoi": task["aoi"], "year": task["year"], "statistic": task["statistic"], "rows": len(records),
+            "exported": exported, "skipped": skipped, "seconds": time.perf_counter() - start}
+
+
+# define function to check if a task has been completed by a previous export
+def task_done(task):
+    """
+    :param task: task dictionary (see export_task())
+    :return: True if the task has been completed with the same options (see OPTION_KEYS) and all charts listed in
+        its marker exist, else False
+    """
+    content = read_marker(done_path(task["output_dir"], task["aoi"], task["year"], task["statistic"]))
+    if content is None or content.get("outputs") is None or content.get("options") != task_options(task):
+        return False
+    return all(os.path.exists(path) for path in content["outputs"])
+
+
+# define function to map the years given by the user to the years of the database
+def match_years(years, catalog_years):
+    """
+    Maps the given years to the year values of the catalog, which are compared as strings (the years can be stored
+    as integers or as text in table "areaofinterest", and are given as strings on the command line).
+
+    :param years: list of years given by the user (None for all years)
+    :param catalog_years: list of years of the catalog (catalog.values["year"])
+    :return: list of the matching years as stored in the database (all years if years is None), list of the given
+        years that are not in the database
+    """
+    if years is None:
+        return list(catalog_years), []
+    stored = {str(year): year for year in catalog_years}
+    matched = [stored[str(year)] for year in years if str(year) in stored]
+    missing = [year for year in years if str(year) not in stored]
+    return matched, missing
+
+
+# define function to make the tasks of an export
+def make_tasks(path, output_dir, aois=None, years=None, crop_types=None, statistics=None, parameters=None,
+               formats=("html",), trendline="LOESS", reduction="LTTB", per_crop=False, parquet_engine="pyarrow"):
+    """
+    Makes one task per AOI, year and statistic of the grid of filter combinations (None for all values of a filter).
+
+    :return: list of task dictionaries (see export_task()), number of tasks skipped as completed, list of the given
+        years that are not in the database (see match_years())
+    """
+    catalog = open_backend(path, parquet_engine=parquet_engine).catalog()
+    values = catalog.values
+    years, missing_years = match_years(years, values["year"])
+    crop_types = list(crop_types or values["crop_type"])
+    parameters = [param for param in (parameters or values["parameter"]) if param in CHART_TITLES]
+    tasks = []
+    completed = 0
+    for aoi in aois or values["aoi"]:
+        for year in years:
+            # only AOI/year combinations with data for one of the crop types
+            if not any(catalog.dependent_values(aoi, year, crop_type)["fid"] for crop_type in crop_types):
+                continue
+            for statistic in statistics or values["statistic"]:
+                task = {"path": path, "output_dir": output_dir, "aoi": aoi, "year": year, "statistic": statistic,
+                        "crop_types": crop_types, "parameters": parameters, "formats": list(formats),
+                        "trendline": trendline, "reduction": reduction, "per_crop": per_crop,
+                        "parquet_engine": parquet_engine}
+                if task_done(task):
+                    completed += 1
+                    continue
+                tasks.append(task)
+    return tasks, completed, missing_years
+
+
+# define function to run the export from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments, runs the tasks in a process pool and prints the throughput.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    :return: exit status (1 if a task failed or none of the given years is in the database, else 0)
+    """
+    parser = argparse.ArgumentParser(description="Export the charts of the Radar Crop Monitor app for many filter "
+                                                 "combinations.")
+    parser.add_argument("path", help="path to database file or Parquet export directory")
+    parser.add_argument("output_dir", help="path to output directory")
+    parser.add_argument("--aois", nargs="+", help="AOIs (default: all)")
+    parser.add_argument("--years", nargs="+", help="years (default: all)")
+    parser.add_argument("--crop-types", nargs="+", help="crop types (default: all)")
+    parser.add_argument("--statistics", nargs="+", default=["mean"], help="statistics (default: mean)")
+    parser.add_argument("--parameters", nargs="+", help="parameters (default: VV, VH and NDVI)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["html"], help="output formats")
+    parser.add_argument("--trendline", choices=["None", "LOESS", "Rolling Mean"], default="LOESS")
+    parser.add_argument("--reduction", choices=["LTTB", "Min/Max", "None"], default="LTTB",
+                        help="point reduction method")
+    parser.add_argument("--per-crop", action="store_true", help="one chart per crop type with all its FIDs")
+    parser.add_argument("--parquet-engine", choices=["pyarrow", "duckdb"], default="pyarrow")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    if "png" in args.formats and importlib.util.find_spec("altair_saver") is None:
+        parser.error("PNG export requires the package altair_saver (pip install altair_saver)")
+
+    start = time.perf_counter()
+    tasks, completed, missing_years = make_tasks(args.path, args.output_dir, args.aois, args.years, args.crop_types,
+                                                 args.statistics, args.parameters, args.formats, args.trendline,
+                                                 args.reduction, args.per_crop, args.parquet_engine)
+    if missing_years:
+        print("Years not found in the database: {}".format(", ".join(missing_years)), file=sys.stderr)
+        if len(missing_years) == len(args.years):
+            return 1
+    print("{} tasks to export, {} tasks already completed".format(len(tasks), completed))
+
+    rows = exported = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(export_task, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                failed += 1
+                print("{} {} {}: failed ({})".format(task["aoi"], task["year"], task["statistic"], error),
+                      file=sys.stderr)
+                continue
+            rows += result["rows"]
+            exported += result["exported"]
+            skipped += result["skipped"]
+            print("{} {} {}: {} rows, {} charts exported, {} skipped ({:.1f} s)".format(
+                result["aoi"], result["year"], result["statistic"], result["rows"], result["exported"],
+                result["skipped"], result["seconds"]))
+
+    seconds = time.perf_counter() - start
+    print("Exported {} charts ({} skipped, {} tasks failed) from {} rows in {:.1f} s: {:.1f} charts/s, "
+          "{:.0f} rows/s".format(exported, skipped, failed, rows, seconds, exported / max(seconds, 1e-9),
+                                 rows / max(seconds, 1e-9)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+This script can be used to benchmark the path from the database query to the chart of the Radar Crop Monitor app
+outside Streamlit. Synthetic databases of different sizes are generated with synthetic_db.py and each stage of the
+app is timed separately:
+    - filter_values: queries of the filter values (filter catalog, see catalog.py)
+    - records_query: main query of the app (join of the three tables, see queries.py and loader.py)
+    - post_processing: date range, acquisition names, split by parameter, trendline and point reduction
+    - chart_spec: building the Vega-Lite specifications of the charts with make_chart()
+    - serialization: serializing the specifications (with data) to JSON
+The cold start of the app is timed as well: the imports of the path screen (main.py) and of the main page (app.py)
+in fresh Python interpreters.
+
+The results (median and minimum time per stage, row counts and specification size) are appended to a JSON file,
+so runs of different code versions can be compared. With --compare, the run is compared with the previous run of
+the same size in the file and the script exits with status 1 if a stage got slower than the tolerance or if the path
+screen takes longer than its target (instrumentation.PATH_SCREEN_TARGET).
+
+Usage: python benchmark.py [--sizes small medium large] [--repeat N] [--output FILE] [--workdir DIR]
+[--optimize] [--compare] [--tolerance F]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import altair as alt
+import pandas as pd
+from catalog import build_catalog
+from charts import CHART_WIDTH, make_chart, split_by_parameter
+from db_pool import read_only_uri
+from decimation import decimate_records
+from instrumentation import PATH_SCREEN_TARGET
+from loader import date_bounds, load_typed
+from optimize_db import optimize_database
+from queries import has_year_column, normalize_selection, records_sql
+from synthetic_db import generate_database
+from trendlines import get_trendline
+
+# sizes of the synthetic databases (parameters of synthetic_db.generate_database())
+BENCHMARK_SIZES = {
+    "small": {"aois": 1, "years": 1, "fids": 20, "acquisitions": 60, "products": 2, "statistics": 3},
+    "medium": {"aois": 2, "years": 2, "fids": 100, "acquisitions": 120, "products": 2, "statistics": 3},
+    "large": {"aois": 4, "years": 3, "fids": 200, "acquisitions": 150, "products": 2, "statistics": 6},
+}
+
+# modules whose import is timed at the cold start, with the code that runs before the import in the app (the
+# Streamlit server has imported Streamlit, the main page is imported after the path screen)
+STARTUP_IMPORTS = {"path_screen": ("main", "import streamlit"), "main_page": ("app", "import streamlit, main")}
+
+# default file with benchmark results
+RESULTS_FILE = "benchmark_results.json"
+
+
+# define function to time a function
+def time_stage(function, repeat):
+    """
+    :param function: function without arguments
+    :param repeat: number of runs
+    :return: dictionary with median and minimum time (seconds), result of last run
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times)}, result
+
+
+# define function to get the selection that is benchmarked
+def benchmark_selection(catalog):
+    """
+    Selects the first AOI and year and the crop type with the most FIDs, with all FIDs, products, acquisition modes
+    and parameters (the largest selection of a single chart page).
+
+    :param catalog: catalog.FilterCatalog object
+    :return: queries.FilterSelection object
+    """
+    aoi = catalog.values["aoi"][0]
+    year = catalog.values["year"][0]
+    crop_type = max(catalog.values["crop_type"],
+                    key=lambda crop: len(catalog.dependent_values(aoi, year, crop)["fid"]))
+    dependent = catalog.dependent_values(aoi, year, crop_type)
+    return normalize_selection(aoi, year, crop_type, catalog.values["statistic"][0], dependent["acquisition"],
+                               dependent["product"], catalog.values["parameter"], dependent["fid"])
+
+
+# define function to run the post-processing of the app
+def post_process(records, method="LOESS"):
+    """
+    Runs the post-processing of main_part() on the records: date range filter, acquisition names, split by
+    parameter, trendline and point reduction.
+
+    :param records: typed dataframe with records
+    :param method: string with trendline method
+    :return: list of (parameter, records, removed points, trendline) tuples
+    """
+    start_date, end_date = date_bounds(records)
+    records = records[(records["date"] >= pd.Timestamp(start_date)) & (records["date"] <= pd.Timestamp(end_date))]
+    records = records.assign(acquisition=records["acquisition"].map({"A": "ascending", "D": "descending"}))
+    charts = []
+    for param, pol_records in split_by_parameter(records, ("VV", "VH", "NDVI")).items():
+        trend = get_trendline(pol_records, method, None, CHART_WIDTH)
+        pol_records, dropped = decimate_records(pol_records, CHART_WIDTH, "LTTB", group_columns=("fid",))
+        charts.append((param, pol_records, dropped, trend))
+    return charts
+
+
+# define function to build the chart specifications
+def chart_specs(chart_data, domain):
+    """
+    :param chart_data: list of (parameter, records, removed points, trendline) tuples (see post_process())
+    :param domain: list with boundaries of x-axis (milliseconds)
+    :return: list of dictionaries with Vega-Lite specifications (with inline data)
+    """
+    specs = []
+    # the data of the charts is embedded completely, as in the app
+    with alt.data_transformers.enable("default", max_rows=None):
+        for param, pol_records, dropped, trend in chart_data:
+            selection = alt.selection_multi(fields=["fid"], bind="legend")
+            chart = make_chart(pol_records, "Value", domain, selection, "fid", None, param, "LOESS", dropped, trend)
+            specs.append(chart.to_dict())
+    return specs
+
+
+# define function to time the cold start of the app
+def benchmark_startup(repeat=5):
+    """
+    Times the imports of the path screen and of the main page (see STARTUP_IMPORTS), each in a fresh Python
+    interpreter.
+
+    :param repeat: number of runs per stage
+    :return: dictionary with median and minimum time (seconds) per stage
+    """
+    stages = {}
+    for stage, (module, preloaded) in STARTUP_IMPORTS.items():
+        code = "{}; import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)".format(
+            preloaded, module)
+        times = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                      cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+                 for _ in range(repeat)]
+        stages[stage] = {"median_s": statistics.median(times), "min_s": min(times)}
+    return stages
+
+
+# define function to get the current git commit
+def git_commit():
+    """
+    :return: string with abbreviated hash of the current git commit, None if not available
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# define function to benchmark one database size
+def benchmark_size(size, db_path, repeat=5, optimize=False, regenerate=False):
+    """
+    Generates the database of a size (if it does not exist yet) and times the stages of the app.
+
+    :param size: string with name of size (key of BENCHMARK_SIZES)
+    :param db_path: string with path to database file
+    :param repeat: number of runs per stage
+    :param optimize: if True, the database is optimized with optimize_db.py before the benchmark
+    :param regenerate: if True, the database is generated even if it exists
+    :return: dictionary with results
+    """
+    if regenerate or not os.path.exists(db_path):
+        generate_database(db_path, **BENCHMARK_SIZES[size])
+        if optimize:
+            optimize_database(db_path)
+
+    db = sqlite3.connect(read_only_uri(db_path), uri=True)
+    try:
+        total_rows = db.execute("SELECT count(*) FROM s1fieldstatistic;").fetchone()[0]
+        stages = {}
+        stages["filter_values"], catalog = time_stage(lambda: build_catalog(db), repeat)
+        selection = benchmark_selection(catalog)
+        sql_body, params = records_sql(selection, year_column=has_year_column(db))
+        stages["records_query"], records = time_stage(lambda: load_typed(db, sql_body, params), repeat)
+    finally:
+        db.close()
+
+    stages["post_processing"], chart_data = time_stage(lambda: post_process(records), repeat)
+    domain = [records["datetime"].min().value / 10 ** 6, records["datetime"].max().value / 10 ** 6]
+    stages["chart_spec"], specs = time_stage(lambda: chart_specs(chart_data, domain), repeat)
+    stages["serialization"], serialized = time_stage(lambda: [json.dumps(spec) for spec in specs], repeat)
+
+    return {"size": size, "parameters": BENCHMARK_SIZES[size], "optimized": optimize, "total_rows": total_rows,
+            "selected_rows": len(records), "chart_points": sum(len(data[1]) for data in chart_data),
+            "spec_bytes": sum(len(spec) for spec in serialized), "stages": stages}
+
+
+# define function to compare a run with the previous run of the same size
+def compare_results(result, previous_runs, tolerance):
+    """
+    :param result: dictionary with results of one size (see benchmark_size())
+    :param previous_runs: list with previous runs of the results file
+    :param tolerance: allowed relative increase of the median time of a stage (e.g. 0.25 for 25 %)
+    :return: list with strings describing the regressions
+    """
+    for run in reversed(previous_runs):
+        for previous in run["results"]:
+            if previous["size"] == result["size"] and previous["optimized"] == result["optimized"]:
+                regressions = []
+                for stage, timing in result["stages"].items():
+                    before = previous["stages"].get(stage)
+                    if before and timing["median_s"] > before["median_s"] * (1 + tolerance):
+                        regressions.append("{} {}: {:.4f} s -> {:.4f} s (commit {})".format(
+                            result["size"], stage, before["median_s"], timing["median_s"], run["commit"]))
+                return regressions
+    return []
+
+
+# define function to run the benchmark from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments, runs the benchmark and appends the results to the results file.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    :return: exit status (1 if a regression has been found with --compare, else 0)
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the query-to-chart path of the Radar Crop Monitor app.")
+    parser.add_argument("--sizes", nargs="+", choices=list(BENCHMARK_SIZES), default=["small", "medium"],
+                        help="database sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs per stage")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file to which the results are appended")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "rcm_benchmark"),
+                        help="directory of the generated databases")
+    parser.add_argument("--optimize", action="store_true", help="optimize the databases with optimize_db.py")
+    parser.add_argument("--regenerate", action="store_true", help="generate the databases even if they exist")
+    parser.add_argument("--compare", action="store_true", help="compare with the previous run in the output file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown of a stage for --compare (default 0.25)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    previous_runs = []
+    if os.path.exists(args.output):
+        with open(args.output) as results_file:
+            previous_runs = json.load(results_file)["runs"]
+
+    run = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "python": platform.python_version(),
+           "platform": platform.platform(), "sqlite": sqlite3.sqlite_version, "results": []}
+    regressions = []
+
+    run["startup"] = benchmark_startup(args.repeat)
+    print("startup")
+    for stage, timing in run["startup"].items():
+        print("    {:<16} {:8.4f} s (min {:.4f} s)".format(stage, timing["median_s"], timing["min_s"]))
+    if args.compare and run["startup"]["path_screen"]["median_s"] > PATH_SCREEN_TARGET:
+        regressions.append("startup path_screen: {:.4f} s (target {} s)".format(
+            run["startup"]["path_screen"]["median_s"], PATH_SCREEN_TARGET))
+
+    for size in args.sizes:
+        db_path = os.path.join(args.workdir, "rcm_{}{}.db".format(size, "_optimized" if args.optimize else ""))
+        result = benchmark_size(size, db_path, repeat=args.repeat, optimize=args.optimize,
+                                regenerate=args.regenerate)
+        run["results"].append(result)
+        print("{}: {} of {} rows selected, {} chart points, {} bytes".format(
+            size, result["selected_rows"], result["total_rows"], result["chart_points"], result["spec_bytes"]))
+        for stage, timing in result["stages"].items():
+            print("    {:<16} {:8.4f} s (min {:.4f} s)".format(stage, timing["median_s"], timing["min_s"]))
+        if args.compare:
+            regressions += compare_results(result, previous_runs, args.tolerance)
+
+    with open(args.output, "w") as results_file:
+        json.dump({"runs": previous_runs + [run]}, results_file, indent=2)
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print("    " + regression)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+This module provides the filter catalog of the Radar Crop Monitor app: the selectable values of the main and
+dependent filters, loaded once per database and shared by all app sessions of the server process.
+
+The catalog is only rebuilt when the database changes, which is detected by the modification time and size of the
+database file (and its WAL file) as well as by SQLite's "PRAGMA data_version" (see db_pool.ConnectionPool.version()).
+If rows have only been appended (see deltas.py), the catalog is updated with the values of the new rows instead.
+Besides the plain filter values, the catalog contains an index of the FIDs, products and acquisition modes
+that exist for each AOI/year/crop type combination, which is used for cascading the dependent filters, together
+with the number of records per statistic of each combination (used to estimate the size of query results).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import threading
+import pandas as pd
+from deltas import get_tracker
+from queries import rowid_filter
+
+# process-wide cache of filter catalogs (key: absolute database path), shared across app sessions
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+# define class that holds the filter values of one database
+class FilterCatalog:
+    """
+    Container for the filter values of one database and the index used for cascading dependent filters.
+
+    :param values: dictionary with lists of filter values (keys: "aoi", "year", "crop_type", "product",
+        "acquisition", "parameter", "statistic", "fid")
+    :param dependent_index: dictionary with (aoi, year, crop_type) tuples as keys and dictionaries with lists of
+        "fid", "product" and "acquisition" values (and optionally "rows", a dictionary with the number of records
+        per statistic) as values
+    :param version: token describing the database state the catalog was built from
+    """
+
+    def __init__(self, values, dependent_index, version):
+        self.values = values
+        self.dependent_index = dependent_index
+        self.version = version
+
+    def dependent_values(self, aoi, year, crop_type):
+        """
+        Returns the FIDs, products and acquisition modes that exist for an AOI/year/crop type combination.
+
+        :param aoi: string with AOI abbreviation
+        :param year: year as stored in table "areaofinterest"
+        :param crop_type: string with crop type
+        :return: dictionary with lists of "fid", "product" and "acquisition" values (empty lists if no data exists)
+        """
+        empty = {"fid": [], "product": [], "acquisition": []}
+        return self.dependent_index.get((aoi, year, crop_type), empty)
+
+    def row_count(self, aoi, year, crop_type, statistic):
+        """
+        Returns the number of records of an AOI/year/crop type combination and statistic (all FIDs, products,
+        acquisition modes and parameters), e.g. to estimate the memory of a superset before it is loaded.
+
+        :param aoi: string with AOI abbreviation
+        :param year: year as stored in table "areaofinterest"
+        :param crop_type: string with crop type
+        :param statistic: string with statistic
+        :return: number of records, None if the catalog has no record counts
+        """
+        rows = self.dependent_values(aoi, year, crop_type).get("rows")
+        return None if rows is None else rows.get(statistic, 0)
+
+
+# define function to create a catalog from dataframes with filter values
+def make_catalog(areas, crop_types, s1_values, combinations, version=None):
+    """
+    Creates a filter catalog from dataframes with the distinct values of the data tables.
+
+    :param areas: dataframe with columns "aoi", "year" and "fid" (fields)
+    :param crop_types: dataframe with column "crop_type"
+    :param s1_values: dataframe with columns "product", "acquisition", "parameter" and "statistic" (observations)
+    :param combinations: dataframe with columns "aoi", "year", "crop_type", "fid", "product" and "acquisition"
+        (all combinations for which observations exist, sorted by fid), optionally with columns "statistic" and
+        "row_count" (number of records of the combination and statistic)
+    :param version: token describing the data state (stored in the catalog)
+    :return: FilterCatalog object
+    """
+    values = {"aoi": areas["aoi"].drop_duplicates().tolist(),
+              "year": areas["year"].drop_duplicates().tolist(),
+              "fid": areas["fid"].drop_duplicates().tolist(),
+              "crop_type": crop_types["crop_type"].drop_duplicates().tolist(),
+              "product": s1_values["product"].drop_duplicates().tolist(),
+              "acquisition": s1_values["acquisition"].drop_duplicates().tolist(),
+              "parameter": s1_values["parameter"].drop_duplicates().tolist(),
+              "statistic": s1_values["statistic"].drop_duplicates().tolist()}
+
+    dependent_index = {}
+    for key, group in combinations.groupby(["aoi", "year", "crop_type"], sort=False):
+        dependent_index[key] = {"fid": group["fid"].drop_duplicates().tolist(),
+                                "product": group["product"].drop_duplicates().tolist(),
+                                "acquisition": group["acquisition"].drop_duplicates().tolist()}
+        if "row_count" in group.columns:
+            counts = group.groupby("statistic", sort=False, observed=True)["row_count"].sum()
+            dependent_index[key]["rows"] = {statistic: int(count) for statistic, count in counts.items()}
+
+    return FilterCatalog(values, dependent_index, version)
+
+
+# define function to combine the catalogs of several databases
+def union_catalogs(catalogs, version=None):
+    """
+    Combines the filter catalogs of several databases (e.g. the shards of a split archive) into one catalog.
+    The values of all catalogs are unioned (in the order in which they first occur), the record counts are summed.
+
+    :param catalogs: list of FilterCatalog objects
+    :param version: token describing the data state (stored in the catalog)
+    :return: FilterCatalog object
+    """
+    def union(lists):
+        return list(dict.fromkeys(value for values in lists for value in values))
+
+    values = {name: union(catalog.values[name] for catalog in catalogs)
+              for name in (catalogs[0].values if catalogs else [])}
+    dependent_index = {}
+    for key in union(catalog.dependent_index for catalog in catalogs):
+        entries = [catalog.dependent_index[key] for catalog in catalogs if key in catalog.dependent_index]
+        dependent_index[key] = {name: union(entry[name] for entry in entries) for name in entries[0] if name != "rows"}
+        if all("rows" in entry for entry in entries):
+            rows = {}
+            for entry in entries:
+                for statistic, count in entry["rows"].items():
+                    rows[statistic] = rows.get(statistic, 0) + count
+            dependent_index[key]["rows"] = rows
+    return FilterCatalog(values, dependent_index, version)
+
+
+# define function to query the filter values and the index for dependent filters from database
+def build_catalog(db, version=None, min_rowid=None, max_rowid=None):
+    """
+    Queries the filter values from the database. Compared to one "select distinct" query per filter,
+    table "s1fieldstatistic" is only scanned twice: once for the global product/acquisition/parameter/statistic values
+    and once for the index of FIDs, products and acquisition modes (and record counts) per AOI/year/crop type.
+
+    :param db: sqlite3.Connection object with connection to database
+    :param version: token describing the database state (stored in the catalog)
+    :param min_rowid: if not None, only the rows of table "s1fieldstatistic" with a larger rowid are read
+    :param max_rowid: if not None, only the rows of table "s1fieldstatistic" up to this rowid are read
+    :return: FilterCatalog object
+    """
+    rowid_sql, rowid_params = rowid_filter(min_rowid, max_rowid, table="")
+    rowid_where = " WHERE" + rowid_sql[4:] if rowid_sql else ""
+    areas = pd.read_sql_query("select distinct aoi, year, fid from areaofinterest;", db)
+    crop_types = pd.read_sql_query("select distinct crop_type from croplegend;", db)
+    s1_values = pd.read_sql_query("select distinct product, acquisition, polarization as parameter, statistic "
+                                  "from s1fieldstatistic" + rowid_where + ";", db, params=rowid_params)
+
+    # the join conditions are the same as in the main query of the app, so the index contains exactly the
+    # FIDs/products/acquisition modes for which the main query returns data
+    combinations = pd.read_sql_query("""SELECT DISTINCT
+        area.aoi,
+        area.year,
+        crop.crop_type,
+        area.fid,
+        s1.product,
+        s1.acquisition,
+        s1.statistic,
+        s1.row_count
+        FROM (SELECT aoi, mask_label, strftime('%Y', datetime) as year, product, acquisition, statistic,
+              count(*) as row_count
+              FROM s1fieldstatistic""" + rowid_where + """
+              GROUP BY aoi, mask_label, strftime('%Y', datetime), product, acquisition, statistic) as s1
+        INNER JOIN areaofinterest as area
+        ON (s1.mask_label = area.fid AND s1.year = area.year AND s1.aoi = area.aoi)
+        INNER JOIN croplegend as crop
+        ON (crop.crop_type_code = area.crop_type_code)
+        ORDER BY area.fid;""", db, params=rowid_params)
+
+    return make_catalog(areas, crop_types, s1_values, combinations, version)
+
+
+# define function to get a catalog from the process-wide cache
+def cached_catalog(key, version, build, update=None):
+    """
+    Returns the filter catalog of a data source from the process-wide cache.
+    The catalog is (re)built if it is not cached yet or if the data has changed since it was built.
+
+    :param key: string identifying the data source (e.g. absolute database path)
+    :param version: token describing the current state of the data source
+    :param build: function that takes the version token and returns a FilterCatalog object
+    :param update: function that takes the cached (outdated) catalog and the version token and returns the updated
+        FilterCatalog object, or None if the catalog has to be rebuilt (None: always rebuild)
+    :return: FilterCatalog object
+    """
+    with _catalogs_lock:
+        entry = _catalogs.get(key)
+        if entry is None:
+            entry = {"catalog": None, "lock": threading.Lock()}
+            _catalogs[key] = entry
+
+    # only one session builds the catalog, other sessions wait for it instead of querying the database as well
+    with entry["lock"]:
+        catalog = entry["catalog"]
+        if catalog is None or catalog.version != version:
+            updated = update(catalog, version) if catalog is not None and update is not None else None
+            catalog = updated if updated is not None else build(version)
+            entry["catalog"] = catalog
+    return catalog
+
+
+# define function to get the (cached) filter catalog of a database
+def get_catalog(pool):
+    """
+    Returns the filter catalog of a database from the process-wide cache (see cached_catalog()).
+    The version of the catalog is the epoch and maximum rowid of the database (see deltas.py): after rows have been
+    appended, only the values of the new rows are queried and added to the cached catalog.
+
+    :param pool: db_pool.ConnectionPool object of database
+    :return: FilterCatalog object
+    """
+    epoch, max_rowid = get_tracker(pool).current()
+
+    def build(version):
+        with pool.connection() as db:
+            return build_catalog(db, version, max_rowid=max_rowid)
+
+    def update(catalog, version):
+        cached_epoch, cached_max_rowid = catalog.version
+        if cached_epoch != epoch or cached_max_rowid > max_rowid:
+            return None
+        with pool.connection() as db:
+            new_values = build_catalog(db, version, min_rowid=cached_max_rowid, max_rowid=max_rowid)
+        return union_catalogs([catalog, new_values], version)
+
+    return cached_catalog(pool.db_path, (epoch, max_rowid), build, update)
+
+
+# define function to drop cached catalogs
+def clear_catalogs():
+    """
+    Removes all catalogs from the process-wide cache.
+    """
+    with _catalogs_lock:
+        _catalogs.clear()
@@ -0,0 +1,137 @@
+"""
+This module makes the VV/VH/NDVI charts of the Radar Crop Monitor app (scatterplot of the values of the selected
+fields with optional trendlines). It does not import Streamlit, so the charts can also be made outside the app
+(see batch_export.py and benchmark.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import altair as alt
+from derived import derived_label, is_derived
+
+# width of charts in pixels (also used to determine the number of points shown per chart, see decimation.py)
+CHART_WIDTH = 1000
+
+# titles of the charts per parameter
+CHART_TITLES = {"VV": "VV Polarisation", "VH": "VH Polarisation", "NDVI": "NDVI"}
+
+# columns of the records that are used by the charts (only these are passed to the chart datasets)
+CHART_COLUMNS = ["datetime", "value", "fid", "acquisition", "product"]
+
+
+# define function to get the y-axis label of a chart
+def axis_label(param, statistic, unit=None):
+    """
+    :param param: string with parameter (VV,VH,NDVI or derived parameter, see derived.py)
+    :param statistic: string with statistic selected by user (which can be in units or absolute values)
+    :param unit: string with unit of the parameters a derived ratio/difference is computed from
+        (see derived.pair_unit())
+    :return: string with y-axis label
+    """
+    if is_derived(param):
+        return derived_label(param, unit)
+    if statistic in ["mean", "median", "std", "mode_value_1"]:
+        return "NDVI value" if param == "NDVI" else "Backscatter [dB]"
+    return "Value"
+
+
+# define function to make charts
+def make_chart(pol_records, axis_label, domain, selection, color_column, sort, title, stat_button, dropped_points=0,
+               trend_records=None, add_selection=True, pooled_records=None):
+    """
+    Creates scatterplot and trendline diagrams of VV/VH/NDVI values from respective subset of dataframe "records".
+    X axis of scatterplot shows time, while Y axis shows values. Points in the scatterplot are colored
+    based on user selection.
+
+
+    Two types of trendlines can be shown, based on two different statistical methods:
+    Locally Estimated Scatterplot Smoothing (LOESS) and Rolling Mean (with 11 values per mean).
+    The trendline selected by user is precomputed on the server (see trendlines.py) and added to the scatterplot,
+    either as one pooled line (red) or as one line per FID. Like the points, the trendlines follow the selection in
+    the chart legend: lines per FID are grayed out if their legend value is not selected, and instead of the pooled
+    line, the lines pooled over the points of each selected legend value are shown while values are selected.
+
+    If points have been removed by the point reduction (see decimation.py), their number is shown below the title.
+    All layers of the chart use the same dataset pol_records (which is embedded only once in the chart).
+
+    :param pol_records: subset of dataframe "records" with one polarisation/value (VV,VH,NDVI)
+    :param axis_label: string with y-axis label
+    :param domain: numpy.ndarray with boundaries for x-axis (start and end date)
+    :param selection: altair.selection_multi object with values that will be colored (bound to user selection in
+        chart legend) 
+    :param color_column: dataframe column by which data points are colored in chart
+    :param sort: list with order of values in chart legend
+    :param title: string with chart title
+    :param stat_button: string with name of trendline selected by user
+    :param dropped_points: number of points removed from pol_records by point reduction
+    :param trend_records: dataframe with precomputed trendline(s) (columns "datetime", "trend" and optionally the
+        group columns, see trendlines.compute_trendline()): one pooled line, one line per FID and legend value, or
+        one line per legend value (if pooled_records is given)
+    :param add_selection: if True, the selection is defined in this chart (only one chart of a combined chart
+        may define the selection, the others use it)
+    :param pooled_records: dataframe with precomputed trendline over all points (columns "datetime" and "trend"),
+        shown instead of the lines per legend value of trend_records while no legend value is selected
+    :return: altair.Chart object displaying either VV/VH/NDVI values (and trend line if selected)
+    """
+    # add number of removed points to title
+    if dropped_points > 0:
+        title = alt.TitleParams(title, subtitle="{} points not shown due to point reduction, narrow the date range "
+                                                "to show all points".format(dropped_points))
+
+    # make the base chart (scatterplot with x=time, y=value)
+    value_chart = alt.Chart(pol_records).mark_circle().encode(
+        x=alt.X("datetime:T", axis=alt.Axis(title='Date', titleFontSize=22),
+                scale=alt.Scale(domain=list(domain))),
+        y=alt.Y("value", axis=alt.Axis(title=axis_label, titleFontSize=22)),
+        color=alt.condition(selection, color_column, alt.value("lightgray"), sort=sort,
+                            legend=alt.Legend(type='symbol')),
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
+        tooltip=("fid", "acquisition", "product")). \
+        properties(title=title, width=CHART_WIDTH, height=500)
+    if add_selection:
+        value_chart = value_chart.add_selection(selection)
+
+    # add precomputed trendline to scatterplot, if selected
+    # (lines per FID are colored like the points if points are colored by FID, otherwise all lines are red)
+    if stat_button in ("LOESS", "Rolling Mean") and trend_records is not None:
+        trend_chart = alt.Chart(trend_records).mark_line().encode(
+            x=alt.X("datetime:T", scale=alt.Scale(domain=list(domain))),
+            y=alt.Y("trend:Q", axis=alt.Axis(title=axis_label, titleFontSize=22)))
+        if color_column not in trend_records.columns:
+            trend_chart = trend_chart.encode(color=alt.value("red"))
+        elif pooled_records is None:
+            trend_color = "fid" if color_column == "fid" else alt.value("red")
+            trend_chart = trend_chart.encode(
+                detail=list(dict.fromkeys(["fid", color_column])),
+                color=alt.condition(selection, trend_color, alt.value("lightgray"), sort=sort),
+                opacity=alt.condition(selection, alt.value(1), alt.value(0.2)))
+        else:
+            # the lines of the selected legend values are shown if values are selected, the pooled line otherwise
+            store = selection.name + "_store"
+            trend_chart = trend_chart.encode(detail=color_column, color=alt.value("red")).transform_filter(
+                "length(data('{0}')) && vlSelectionTest('{0}', datum)".format(store))
+            trend_chart += alt.Chart(pooled_records).mark_line(color="red").encode(
+                x=alt.X("datetime:T", scale=alt.Scale(domain=list(domain))),
+                y=alt.Y("trend:Q", axis=alt.Axis(title=axis_label, titleFontSize=22))).transform_filter(
+                "!length(data('{}'))".format(store))
+        final_chart = value_chart + trend_chart
+    else:
+        final_chart = value_chart
+
+    return final_chart
+
+
+# define function to split the records by parameter
+def split_by_parameter(records, parameters):
+    """
+    Splits dataframe "records" by parameter in a single pass and keeps only the columns used by the charts.
+
+    :param records: dataframe with records
+    :param parameters: iterable with parameters that are shown (VV,VH,NDVI)
+    :return: dictionary with dataframe (columns CHART_COLUMNS) per parameter, only for parameters with data
+    """
+    parameter_records = {}
+    for param, pol_records in records.groupby("parameter", sort=False, observed=True)[CHART_COLUMNS]:
+        if param in parameters:
+            parameter_records[param] = pol_records
+    return parameter_records
@@ -0,0 +1,41 @@
+"""
+This module checks the paths of the data sources of the Radar Crop Monitor app (database files, Parquet exports
+created with export_parquet.py and archives split into several databases). It only uses the standard library, so the
+path screen of the app can validate a path before the data backends (pandas, pyarrow) are imported.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import glob
+import os
+
+# name of the file that marks a directory as Parquet export (written last, so it only exists for complete exports)
+EXPORT_MARKER = "_rcm_export.json"
+
+# separator of the paths in a list of shards (e.g. "rcm_2017.db;rcm_2018.db")
+SHARD_SEPARATOR = ";"
+
+
+# define function to check if a path is a Parquet export
+def is_parquet_export(path):
+    """
+    :param path: string with path to file or directory
+    :return: True if path is a directory with a complete Parquet export (see export_parquet.py), else False
+    """
+    return os.path.isfile(os.path.join(path, EXPORT_MARKER))
+
+
+# define function to get the shards of a sharded archive
+def shard_paths(path):
+    """
+    :param path: string with path to directory of database files or with paths separated by SHARD_SEPARATOR,
+        or list of paths (database files or Parquet export directories)
+    :return: list with paths of shards, None if path is a single database file or Parquet export
+    """
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    if SHARD_SEPARATOR in path:
+        return [part.strip() for part in path.split(SHARD_SEPARATOR) if part.strip()]
+    if os.path.isdir(path) and not is_parquet_export(path):
+        return sorted(glob.glob(os.path.join(path, "*.db")))
+    return None
@@ -0,0 +1,226 @@
+"""
+This module provides pooled, read-only SQLite connections that are shared by all sessions of the Radar Crop Monitor app.
+
+Connections are opened once with a "mode=ro" URI (optionally "immutable=1" for snapshot databases that are never
+written while the app is running), tuned with pragmas for read-heavy workloads and then handed out to one user at a
+time. The required tables of a database are looked up once per database file and only again when the file changes.
+Each pool also provides a version token of its database, which is used to invalidate the caches of the app.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# pragmas applied to every pooled connection
+# (256 MB memory-mapped I/O, 64 MB page cache per connection, temporary tables and indices in memory)
+DEFAULT_PRAGMAS = {"mmap_size": 268435456, "cache_size": -65536, "temp_store": "MEMORY", "query_only": 1}
+
+# tables of the project database that are needed by the app
+REQUIRED_TABLES = ["s1fieldstatistic", "areaofinterest", "croplegend"]
+
+# process-wide registry of connection pools (key: absolute database path and immutable flag)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# define function to get a token that changes whenever the database file changes
+def file_version(db_path):
+    """
+    Gets modification time and size of the database file and of its write-ahead log (if present).
+
+    :param db_path: string with path to database file
+    :return: tuple with modification times and sizes
+    """
+    version = ()
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            version += (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version += (None, None)
+    return version
+
+
+# define function to build the URI used for opening a database read-only
+def read_only_uri(db_path, immutable=False):
+    """
+    :param db_path: string with path to database file
+    :param immutable: if True, SQLite assumes that the file cannot change (no locking, no change detection)
+    :return: string with "file:" URI of database
+    """
+    uri = Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+
+# define class for a pool of read-only connections to one database
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only connections to one database.
+    Connections are created on demand up to max_size and are reused afterwards; if all connections are in use,
+    callers wait until a connection is returned.
+
+    :param db_path: string with path to database file
+    :param immutable: if True, the database is opened with "immutable=1" (only for snapshots that never change)
+    :param max_size: maximum number of open connections
+    :param pragmas: dictionary with pragmas applied to each connection (default: DEFAULT_PRAGMAS)
+    :param timeout: seconds to wait for a free connection before raising sqlite3.OperationalError
+    """
+
+    def __init__(self, db_path, immutable=False, max_size=8, pragmas=None, timeout=30):
+        self.db_path = os.path.abspath(db_path)
+        self.immutable = immutable
+        self.max_size = max_size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self._schema = None
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        self._counters = {"checkouts": 0, "waits": 0, "created": 0, "schema_reads": 0}
+
+    def _create_connection(self):
+        connection = sqlite3.connect(read_only_uri(self.db_path, self.immutable), uri=True,
+                                     check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute("PRAGMA {}={};".format(name, value))
+        return connection
+
+    def acquire(self):
+        """
+        Takes a connection from the pool (or opens a new one if the pool is not exhausted).
+
+        :return: sqlite3.Connection object with read-only connection to database
+        """
+        with self._condition:
+            self._counters["checkouts"] += 1
+            if not self._idle and self._open >= self.max_size:
+                self._counters["waits"] += 1
+                if not self._condition.wait_for(lambda: self._idle, timeout=self.timeout):
+                    raise sqlite3.OperationalError("No free database connection after {} s".format(self.timeout))
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            connection = self._create_connection()
+        except sqlite3.Error:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._counters["created"] += 1
+        return connection
+
+    def release(self, connection):
+        """
+        Returns a connection to the pool.
+
+        :param connection: sqlite3.Connection object taken from this pool with acquire()
+        """
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that takes a connection from the pool and returns it when the block is left.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def version(self):
+        """
+        Gets a token that changes whenever the database changes. It combines the file version with
+        "PRAGMA data_version" of a dedicated long-lived connection (the data version of a connection changes
+        when other connections commit, so it also detects changes that do not alter the file size or timestamp yet).
+
+        :return: tuple describing the current state of the database
+        """
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = self._create_connection()
+            data_version = self._watcher.execute("PRAGMA data_version;").fetchone()[0]
+        return file_version(self.db_path) + (data_version,)
+
+    def table_names(self):
+        """
+        Gets the names of the required tables (REQUIRED_TABLES) that exist in the database. Only these names are
+        looked up in "sqlite_master", once per database file version (i.e. again after the file was modified).
+
+        :return: list of table names (empty if file is not a valid database)
+        """
+        version = file_version(self.db_path)
+        schema = self._schema
+        if schema is None or schema[0] != version:
+            with self.connection() as db:
+                rows = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({});".format(
+                    ", ".join("?" * len(REQUIRED_TABLES))), REQUIRED_TABLES).fetchall()
+            schema = (version, [row[0] for row in rows])
+            self._schema = schema
+            with self._condition:
+                self._counters["schema_reads"] += 1
+        return schema[1]
+
+    def stats(self):
+        """
+        :return: dictionary with number of open/idle/busy connections and usage counters of the pool
+        """
+        with self._condition:
+            stats = {"db_path": self.db_path, "immutable": self.immutable, "max_size": self.max_size,
+                     "open": self._open, "idle": len(self._idle), "in_use": self._open - len(self._idle)}
+            stats.update(self._counters)
+        return stats
+
+    def close(self):
+        """
+        Closes all idle connections and the connection used for change detection.
+        """
+        with self._condition:
+            for connection in self._idle:
+                connection.close()
+            self._open -= len(self._idle)
+            self._idle = []
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+
+# define function to get the (shared) connection pool of a database
+def get_pool(db_path, immutable=False):
+    """
+    Returns the process-wide connection pool of a database, creating it on first use.
+
+    :param db_path: string with path to database file
+    :param immutable: if True, the database is opened with "immutable=1"
+    :return: ConnectionPool object
+    """
+    key = (os.path.abspath(db_path), immutable)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, immutable=immutable)
+            _pools[key] = pool
+    return pool
+
+
+# define function to get the stats of all connection pools
+def pool_stats():
+    """
+    :return: list of dictionaries with stats of all connection pools of the process
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -0,0 +1,124 @@
+"""
+This module contains functions to reduce the number of points of the time series before they are passed to the charts
+of the Radar Crop Monitor app. Every point of a chart is serialized into the Vega-Lite specification and rendered in
+the browser, so large selections are reduced to a point budget that depends on the chart width.
+
+Two methods are available (both are applied per series, i.e. per FID and parameter):
+    - LTTB (Largest-Triangle-Three-Buckets): keeps the points that preserve the visual shape of the series
+    - Min/Max: keeps the minimum and maximum value of each bucket (preserves the value range of the series)
+
+Since the reduction is applied after the date range selection, narrowing the date range restores full resolution.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import numpy as np
+import pandas as pd
+
+# number of points per pixel of chart width that are kept for all series of a chart together
+POINTS_PER_PIXEL = 4
+
+# minimum number of points that are kept per series
+MIN_POINTS_PER_SERIES = 20
+
+
+# define function to select points of a series with LTTB
+def lttb_indices(x, y, n_out):
+    """
+    Selects points of a series with the Largest-Triangle-Three-Buckets algorithm: the first and last point are kept,
+    the other points are split into n_out - 2 buckets and from each bucket the point is kept that forms the largest
+    triangle with the previously kept point and the average of the next bucket.
+
+    :param x: numpy.ndarray with x values (sorted ascending)
+    :param y: numpy.ndarray with y values
+    :param n_out: number of points to keep
+    :return: numpy.ndarray with sorted positions of kept points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype("float64")
+    y = y.astype("float64")
+    # bucket edges 1 + i * (n - 2) / (n_out - 2), in integer arithmetic (no rounding down of exact edges)
+    edges = 1 + (np.arange(n_out - 1) * (n - 2)) // (n_out - 2)
+    selected = np.empty(n_out, dtype="int64")
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # average point of next bucket (the last point for the last bucket)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.nanargmax(areas)) if not np.isnan(areas).all() else start
+        selected[bucket + 1] = previous
+    return selected
+
+
+# define function to select points of a series with min/max per bucket
+def minmax_indices(y, n_out):
+    """
+    Splits a series into n_out / 2 buckets of equal size and keeps the minimum and maximum point of each bucket.
+
+    :param y: numpy.ndarray with y values (in the order of the x values)
+    :param n_out: number of points to keep (at most)
+    :return: numpy.ndarray with sorted positions of kept points
+    """
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    buckets = (np.arange(n) * n_buckets) // n
+    # sort by bucket and value, so the first/last position of each bucket is its minimum/maximum
+    order = np.lexsort((y, buckets))
+    bounds = np.searchsorted(buckets, np.arange(n_buckets + 1))
+    return np.unique(np.concatenate([order[bounds[:-1]], order[bounds[1:] - 1]]))
+
+
+# define function to get the number of points kept per series of a chart
+def series_budget(chart_width, n_series):
+    """
+    :param chart_width: width of chart in pixels
+    :param n_series: number of series shown in chart
+    :return: maximum number of points per series
+    """
+    return max(MIN_POINTS_PER_SERIES, (chart_width * POINTS_PER_PIXEL) // max(n_series, 1))
+
+
+# define function to reduce the points of the series in a dataframe
+def decimate_records(pol_records, chart_width, method="LTTB", group_columns=("fid", "parameter")):
+    """
+    Reduces the points of each series (group of rows with the same FID and parameter) to the point budget of
+    the chart. Series with fewer points than the budget are kept completely.
+
+    :param pol_records: dataframe with columns "datetime", "value" and group columns, sorted by datetime per series
+    :param chart_width: width of chart in pixels
+    :param method: string with reduction method ("LTTB", "Min/Max" or "None")
+    :param group_columns: tuple with columns that identify a series
+    :return: reduced dataframe (rows in original order), number of removed points
+    """
+    if method == "None" or pol_records.empty:
+        return pol_records, 0
+
+    groups = pol_records.groupby(list(group_columns), sort=False, observed=True).indices
+    budget = series_budget(chart_width, len(groups))
+    if all(len(positions) <= budget for positions in groups.values()):
+        return pol_records, 0
+
+    x = pd.to_datetime(pol_records["datetime"]).values.astype("int64")
+    y = pol_records["value"].to_numpy(dtype="float64")
+    kept = []
+    for positions in groups.values():
+        if len(positions) <= budget:
+            kept.append(positions)
+        elif method == "Min/Max":
+            kept.append(positions[minmax_indices(y[positions], budget)])
+        else:
+            kept.append(positions[lttb_indices(x[positions], y[positions], budget)])
+    kept = np.sort(np.concatenate(kept))
+    return pol_records.iloc[kept], len(pol_records) - len(kept)
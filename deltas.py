@@ -0,0 +1,276 @@
+"""
+This module tracks the changes of a Radar Crop Monitor database, so the caches of the app (query results, see
+query_cache.py, and filter catalogs, see catalog.py) can be updated with the new rows only when acquisitions are
+appended to table "s1fieldstatistic", instead of being rebuilt after every ingest.
+
+When the database has changed (see db_pool.ConnectionPool.version()), its new state is compared with the previous
+one. The state consists of the maximum rowid and the row count of table "s1fieldstatistic" and a fingerprint of the
+small tables "areaofinterest" and "croplegend", and only the rows above the previous maximum rowid are read:
+    - append: only rows with a rowid above the previous maximum have been added (the row count has grown by their
+      number). The cached results of the AOIs/years with new rows are updated by querying only those rows (rowid
+      above the watermark of the cached result).
+    - full: rows have been deleted, or fields or crop types have been changed. All cached results of the database
+      are dropped (the epoch of the database is incremented).
+Caches use the epoch as version and the maximum rowid as watermark: results only contain rows up to their watermark.
+
+Rows that are updated in place (or values swapped between rows) do not change this state. They are detected by a
+verification in a background thread, which is started after every change of the database, so the app sessions do
+not wait for it: the checksum of the rows up to the previously verified rowid (sum of a hash of each row over its
+rowid and all columns of the query results) is compared with the checksum computed then. A mismatch is a full change.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import hashlib
+import threading
+import time
+import zlib
+
+# process-wide trackers (key: absolute database path), shared across app sessions
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+# columns of table "s1fieldstatistic" that are hashed for the checksum (all columns of the query results)
+CHECKSUM_COLUMNS = ["rowid", "aoi", "mask_label", "datetime", "polarization", "acquisition", "product", "statistic",
+                    "value", "unit"]
+
+# number of rowids whose rows are hashed by one query of the verification
+CHECKSUM_CHUNK_ROWS = 50000
+
+# pause of the verification after each chunk, relative to the time of the chunk (the row hashes are computed in
+# Python, so the verification would otherwise slow down the app sessions while it runs)
+VERIFY_PAUSE_SHARE = 1.0
+
+# query of the AOI/year combinations of the appended rows (a search of the rowid b-tree above the watermark)
+APPENDED_SQL = """SELECT aoi, strftime('%Y', datetime), count(*) FROM s1fieldstatistic
+    WHERE rowid > ? GROUP BY aoi, strftime('%Y', datetime);"""
+
+
+# define function to hash a row of table "s1fieldstatistic"
+def row_hash(*values):
+    """
+    Registered as SQL function "row_hash" by checksum_rows(). The CRC32 hashes fit into 32 bits, so their sum over a
+    table cannot overflow SQLite's 64-bit integers.
+
+    :param values: values of the columns in CHECKSUM_COLUMNS
+    :return: integer with CRC32 hash of the values
+    """
+    return zlib.crc32(repr(values).encode())
+
+
+# define function to compute the checksum of a rowid range of table "s1fieldstatistic"
+def checksum_rows(db, min_rowid, max_rowid, pause_share=0):
+    """
+    Sums the hashes of the rows with a rowid above min_rowid and up to max_rowid. The range is read in chunks of
+    CHECKSUM_CHUNK_ROWS rowids (each a search of the rowid b-tree), so other threads can run between the chunks.
+
+    :param db: sqlite3.Connection object with connection to database (the hash function is registered on it)
+    :param min_rowid: rowid after which rows are hashed
+    :param max_rowid: last rowid that is hashed
+    :param pause_share: pause after each chunk, relative to the time of the chunk (e.g. VERIFY_PAUSE_SHARE)
+    :return: integer with sum of the row hashes
+    """
+    db.create_function("row_hash", len(CHECKSUM_COLUMNS), row_hash)
+    sql = "SELECT ifnull(sum(row_hash({})), 0) FROM s1fieldstatistic WHERE rowid > ? AND rowid <= ?;".format(
+        ", ".join(CHECKSUM_COLUMNS))
+    checksum = 0
+    for start in range(min_rowid, max_rowid, CHECKSUM_CHUNK_ROWS):
+        chunk_start = time.perf_counter()
+        checksum += db.execute(sql, [start, min(start + CHECKSUM_CHUNK_ROWS, max_rowid)]).fetchone()[0]
+        if pause_share:
+            time.sleep((time.perf_counter() - chunk_start) * pause_share)
+    return checksum
+
+
+# define function to read the state of a database
+def read_state(db):
+    """
+    Reads the state of the database. Only the rowid b-tree (maximum rowid) or the smallest index (row count) of
+    table "s1fieldstatistic" and the small tables of the fields and crop types are read.
+
+    :param db: sqlite3.Connection object with connection to database
+    :return: dictionary with "max_rowid" and "rows" of table "s1fieldstatistic" and "fields" (fingerprint of tables
+        "areaofinterest" and "croplegend")
+    """
+    max_rowid, rows = db.execute("SELECT max(rowid), count(*) FROM s1fieldstatistic;").fetchone()
+    digest = hashlib.sha1()
+    for row in db.execute("SELECT aoi, year, fid, sl_nr, crop_type_code FROM areaofinterest ORDER BY rowid;"):
+        digest.update(repr(row).encode())
+    for row in db.execute("SELECT crop_type_code, crop_type FROM croplegend ORDER BY rowid;"):
+        digest.update(repr(row).encode())
+    return {"max_rowid": max_rowid or 0, "rows": rows, "fields": digest.hexdigest()}
+
+
+# define function to get the rows that have been appended after a rowid
+def appended_rows(db, min_rowid):
+    """
+    :param db: sqlite3.Connection object with connection to database
+    :param min_rowid: rowid after which rows are counted (only these rows are read, see APPENDED_SQL)
+    :return: list of (aoi, year string, row count) tuples of the rows with a rowid above min_rowid
+    """
+    return db.execute(APPENDED_SQL, [min_rowid]).fetchall()
+
+
+# define function to classify the change between two states of a database
+def classify_change(old, new, appended):
+    """
+    :param old: dictionary with previous state (see read_state()), None if there is none
+    :param new: dictionary with current state
+    :param appended: list with rows appended after the previous maximum rowid (see appended_rows())
+    :return: string "initial", "unchanged", "append" or "full" (rows updated in place are not detected here, see
+        DeltaTracker.verify())
+    """
+    if old is None:
+        return "initial"
+    if new == old:
+        return "unchanged"
+    appended_count = sum(row[2] for row in appended)
+    if new["fields"] != old["fields"] or appended_count == 0 or new["rows"] != old["rows"] + appended_count:
+        return "full"
+    return "append"
+
+
+# define class that tracks the changes of a database
+class DeltaTracker:
+    """
+    Tracks the state of a database and the rows appended since the last full change.
+
+    :param pool: db_pool.ConnectionPool object of database
+    :param pause_share: pause of the verification after each chunk of rows, relative to the time of the chunk
+    """
+
+    def __init__(self, pool, pause_share=VERIFY_PAUSE_SHARE):
+        self.pool = pool
+        self.pause_share = pause_share
+        self._lock = threading.Lock()
+        self._version = None
+        self._state = None
+        self._epoch = 0
+        # appended rowid ranges with the AOI/year combinations of their rows: (first rowid, last rowid, pairs)
+        self._segments = []
+        self._info = {}
+        # last verification: (epoch, maximum rowid, checksum of the rows up to it), thread and pending request
+        self._verified = None
+        self._verifier = None
+        self._verify_again = False
+
+    def current(self):
+        """
+        Checks if the database has changed and updates the state. After every change, the rows up to the previous
+        maximum rowid are verified in the background (see verify()).
+
+        :return: tuple with epoch (incremented by every full change) and maximum rowid of table "s1fieldstatistic"
+        """
+        version = self.pool.version()
+        with self._lock:
+            if version != self._version:
+                with self.pool.connection() as db:
+                    state = read_state(db)
+                    appended = appended_rows(db, self._state["max_rowid"]) if self._state else []
+                change = classify_change(self._state, state, appended)
+                if change == "full":
+                    self._full_change()
+                elif change == "append":
+                    pairs = {(aoi, year) for aoi, year, _ in appended}
+                    self._segments.append((self._state["max_rowid"], state["max_rowid"], pairs))
+                if change != "unchanged":
+                    self._info = {"refreshed": time.strftime("%Y-%m-%d %H:%M:%S"), "change": change,
+                                  "new_rows": sum(row[2] for row in appended) if change == "append" else None}
+                self._state = state
+                self._version = version
+                self._start_verify()
+            return self._epoch, self._state["max_rowid"]
+
+    def _full_change(self):
+        # drop the appended segments and start a new epoch (lock must be held)
+        self._epoch += 1
+        self._segments = []
+
+    def _start_verify(self):
+        # start the verification thread, or let the running one verify again (lock must be held)
+        if self._verifier is not None and self._verifier.is_alive():
+            self._verify_again = True
+            return
+        self._verifier = threading.Thread(target=self._verify_loop, name="rcm-verify", daemon=True)
+        self._verifier.start()
+
+    def _verify_loop(self):
+        while True:
+            self.verify()
+            with self._lock:
+                if not self._verify_again:
+                    self._verifier = None
+                    return
+                self._verify_again = False
+
+    def verify(self):
+        """
+        Checks that the rows up to the previously verified maximum rowid have not been changed, by comparing their
+        checksum with the checksum computed then (see checksum_rows()). If they have been changed, a full change is
+        recorded (new epoch). The rows are hashed without holding the lock of the tracker, so current() does not
+        wait for the verification.
+
+        :return: True if the verified rows are unchanged (or there was no previous verification), else False
+        """
+        with self._lock:
+            if self._state is None:
+                return True
+            epoch, max_rowid = self._epoch, self._state["max_rowid"]
+            # the checksum of a previous epoch is not comparable (the rows have been changed since)
+            previous = self._verified if self._verified is not None and self._verified[0] == epoch else None
+        version = self.pool.version()
+        with self.pool.connection() as db:
+            verified_rowid = previous[1] if previous is not None else 0
+            old_checksum = checksum_rows(db, 0, verified_rowid, self.pause_share)
+            checksum = old_checksum + checksum_rows(db, verified_rowid, max_rowid, self.pause_share)
+        unchanged = previous is None or old_checksum == previous[2]
+        # a checksum is only kept if the database has not been written while the rows were hashed (otherwise it
+        # could contain part of a change, which would then not be detected), the rows are verified again instead
+        consistent = self.pool.version() == version
+        with self._lock:
+            # if a full change has been found in the meantime, the rows of the new epoch are verified again
+            if self._epoch == epoch:
+                if not unchanged:
+                    self._full_change()
+                    self._info = {"refreshed": time.strftime("%Y-%m-%d %H:%M:%S"), "change": "full",
+                                  "new_rows": None}
+                if consistent:
+                    self._verified = (self._epoch, max_rowid, checksum)
+            if not consistent:
+                self._verify_again = True
+        return unchanged
+
+    def has_new_rows(self, aoi, year, watermark):
+        """
+        :param aoi: string with AOI
+        :param year: year
+        :param watermark: maximum rowid of a cached result
+        :return: True if rows of the AOI and year have been appended after the watermark, else False
+        """
+        with self._lock:
+            return any(last > watermark and (aoi, str(year)) in pairs for _, last, pairs in self._segments)
+
+    def info(self):
+        """
+        :return: dictionary with time of the last refresh ("refreshed"), kind of the last change ("initial", "append"
+            or "full") and number of appended rows ("new_rows", for appends)
+        """
+        with self._lock:
+            return dict(self._info)
+
+
+# define function to get the tracker of a database
+def get_tracker(pool):
+    """
+    Returns the process-wide tracker of a database, creating it on first use. There is one tracker per database
+    file (also if it is opened by several pools), since the caches of the app are keyed by the database path.
+
+    :param pool: db_pool.ConnectionPool object of database
+    :return: DeltaTracker object
+    """
+    with _trackers_lock:
+        tracker = _trackers.get(pool.db_path)
+        if tracker is None:
+            tracker = DeltaTracker(pool)
+            _trackers[pool.db_path] = tracker
+    return tracker
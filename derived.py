@@ -0,0 +1,232 @@
+"""
+This module computes the derived parameters of the Radar Crop Monitor app from the loaded records, so they can be
+shown like the parameters of the database without querying the data source again:
+    - VH/VV: cross-polarization ratio (linear ratio of the VH and VV backscatter)
+    - VV-VH: difference of the VV and VH backscatter (in the unit of the values, e.g. dB)
+    - <parameter> anomaly: z-score of the value of a field against the values of all fields of the same crop type
+      (peers) on the same date, acquisition mode and product
+
+The ratio and difference are only computed if all values of both parameters have the same unit (see pair_unit()):
+values in dB are converted to linear power for the ratio, values in another unit are taken as linear. If the unit
+is missing or differs between the values, the parameter is not computed (a ratio of dB values would not be a ratio
+of the backscatter, and a difference of values in different units has no meaning).
+
+For the ratio and difference, the records are pivoted once (one row per FID, time, acquisition mode and product, one
+column per parameter) and the metrics are computed on the NumPy arrays of the parameter columns. The anomalies are
+computed with per-group sums (numpy.bincount) over the records of the peers.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import numpy as np
+
+# keys of one observation of a field (the parameters of an observation are pivoted to columns)
+OBSERVATION_KEYS = ["fid", "datetime", "acquisition", "product"]
+
+# keys of the peer groups of the anomalies (acquisition times of the fields of one date differ slightly)
+PEER_KEYS = ["date", "acquisition", "product"]
+
+# columns of the derived records (columns used by the charts, see charts.CHART_COLUMNS)
+DERIVED_COLUMNS = ["datetime", "value", "fid", "acquisition", "product"]
+
+# derived parameters computed from two parameters of an observation: name -> (first, second parameter, title)
+PAIR_PARAMETERS = {"VH/VV": ("VH", "VV", "VH/VV Ratio"),
+                   "VV-VH": ("VV", "VH", "VV-VH Difference")}
+
+# suffix of the anomaly parameters (e.g. "VV anomaly")
+ANOMALY_SUFFIX = " anomaly"
+
+
+# define function to get the derived parameters that can be computed from the parameters of a database
+def derived_parameters(parameters):
+    """
+    :param parameters: list with parameters of the database
+    :return: list with names of the derived parameters (ratio/difference if both parameters exist, one anomaly per
+        parameter)
+    """
+    pairs = [name for name, (first, second, _) in PAIR_PARAMETERS.items()
+             if first in parameters and second in parameters]
+    return pairs + [parameter + ANOMALY_SUFFIX for parameter in parameters]
+
+
+# define function to check if a parameter is a derived parameter
+def is_derived(parameter):
+    """
+    :param parameter: string with parameter
+    :return: True if parameter is a derived parameter, else False
+    """
+    return parameter in PAIR_PARAMETERS or parameter.endswith(ANOMALY_SUFFIX)
+
+
+# define function to get the parameters of the database a selection of parameters is computed from
+def source_parameters(parameters):
+    """
+    :param parameters: iterable with selected parameters (parameters of the database and derived parameters)
+    :return: list with the parameters of the database that have to be loaded (in order of first use)
+    """
+    sources = []
+    for parameter in parameters:
+        if parameter in PAIR_PARAMETERS:
+            required = PAIR_PARAMETERS[parameter][:2]
+        elif parameter.endswith(ANOMALY_SUFFIX):
+            required = (parameter[:-len(ANOMALY_SUFFIX)],)
+        else:
+            required = (parameter,)
+        sources.extend(source for source in required if source not in sources)
+    return sources
+
+
+# define function to get the chart title of a derived parameter
+def derived_title(parameter):
+    """
+    :param parameter: string with derived parameter
+    :return: string with chart title
+    """
+    if parameter in PAIR_PARAMETERS:
+        return PAIR_PARAMETERS[parameter][2]
+    return "{} Anomaly (z-score)".format(parameter[:-len(ANOMALY_SUFFIX)])
+
+
+# define function to get the y-axis label of a derived parameter
+def derived_label(parameter, unit=None):
+    """
+    :param parameter: string with derived parameter
+    :param unit: string with unit of the parameters the ratio/difference is computed from (see pair_unit())
+    :return: string with y-axis label
+    """
+    if parameter == "VH/VV":
+        return "VH/VV ratio (linear)"
+    if parameter in PAIR_PARAMETERS:
+        return "Difference [{}]".format(unit) if unit else "Difference"
+    return "z-score"
+
+
+# define function to get the unit of the parameters of a ratio/difference parameter
+def pair_unit(records, name):
+    """
+    :param records: typed dataframe with records (see loader.py)
+    :param name: ratio/difference parameter (key of PAIR_PARAMETERS)
+    :return: string with the unit of all values of both parameters, None if the unit is missing (no column "unit"
+        or values without unit) or differs between the values
+    """
+    if "unit" not in records.columns:
+        return None
+    units = records.loc[records["parameter"].isin(PAIR_PARAMETERS[name][:2]), "unit"]
+    if units.isna().any():
+        return None
+    distinct = units.astype(str).unique()
+    return distinct[0] if len(distinct) == 1 else None
+
+
+# define function to pivot the parameters of the records to columns
+def pivot_parameters(records, parameters):
+    """
+    :param records: typed dataframe with records (see loader.py)
+    :param parameters: list with parameters that are pivoted
+    :return: dataframe with one row per observation (columns OBSERVATION_KEYS) and one value column per parameter
+        (NaN if the observation has no value of the parameter)
+    """
+    subset = records.loc[records["parameter"].isin(parameters), OBSERVATION_KEYS + ["parameter", "value"]]
+    subset = subset.astype({"parameter": str})
+    # several rows per observation and parameter (e.g. duplicate ingests) are averaged
+    pivoted = subset.pivot_table(index=OBSERVATION_KEYS, columns="parameter", values="value", aggfunc="mean",
+                                 observed=True)
+    return pivoted.reindex(columns=parameters).reset_index()
+
+
+# define function to compute the ratio and difference parameters
+def pair_records(records, names):
+    """
+    :param records: typed dataframe with records (see loader.py)
+    :param names: list with ratio/difference parameters (keys of PAIR_PARAMETERS)
+    :return: dictionary with dataframe (columns DERIVED_COLUMNS) per parameter, only for parameters with data and
+        one unit of their values (see pair_unit())
+    """
+    units = {name: pair_unit(records, name) for name in names}
+    names = [name for name in names if units[name] is not None]
+    if not names:
+        return {}
+    pivoted = pivot_parameters(records, source_parameters(names))
+
+    derived = {}
+    for name in names:
+        first_name, second_name, _ = PAIR_PARAMETERS[name]
+        # values in dB are converted to linear power for the ratio
+        in_db = units[name] == "dB"
+        first = pivoted[first_name].to_numpy(dtype="float64")
+        second = pivoted[second_name].to_numpy(dtype="float64")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if name == "VH/VV":
+                values = np.power(10.0, (first - second) / 10) if in_db else first / second
+            else:
+                values = first - second
+        valid = np.isfinite(values)
+        if valid.any():
+            frame = pivoted.loc[valid, OBSERVATION_KEYS].assign(value=values[valid].astype("float32"))
+            derived[name] = frame[DERIVED_COLUMNS].reset_index(drop=True)
+    return derived
+
+
+# define function to compute the z-scores of the values against their peer groups
+def peer_zscores(peers, parameter):
+    """
+    :param peers: typed dataframe with records of all fields of the crop type
+    :param parameter: string with parameter of the database
+    :return: dataframe with columns "fid", "datetime", "product" and "value" (z-score) of the observations of the
+        parameter (NaN if the peer group has less than two values or no spread)
+    """
+    subset = peers.loc[peers["parameter"] == parameter, ["fid", "datetime", "value"] + PEER_KEYS]
+    groups = subset.groupby(PEER_KEYS, observed=True, sort=False).ngroup().to_numpy()
+    values = subset["value"].to_numpy(dtype="float64")
+    counts = np.bincount(groups).astype("float64")
+    means = np.bincount(groups, weights=values) / counts
+    squares = np.bincount(groups, weights=(values - means[groups]) ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stds = np.sqrt(squares / (counts - 1))
+        zscores = (values - means[groups]) / stds[groups]
+    zscores[~np.isfinite(zscores)] = np.nan
+    return subset[["fid", "datetime", "product"]].assign(value=zscores.astype("float32"))
+
+
+# define function to compute the anomaly parameters
+def anomaly_records(records, peers, names):
+    """
+    :param records: typed dataframe with records of the selected fields
+    :param peers: typed dataframe with records of all fields of the crop type (e.g. the prefetched superset of the
+        selection, see prefetch.py), or records if they are not available
+    :param names: list with anomaly parameters (e.g. "VV anomaly")
+    :return: dictionary with dataframe (columns DERIVED_COLUMNS) per parameter, only for parameters with data
+    """
+    derived = {}
+    for name in names:
+        parameter = name[:-len(ANOMALY_SUFFIX)]
+        zscores = peer_zscores(peers, parameter).astype({"product": str})
+        selected = records.loc[records["parameter"] == parameter, ["fid", "datetime", "acquisition", "product"]]
+        # the z-scores of the peers are assigned to the observations of the selected fields (in their order)
+        frame = selected.astype({"product": str}).merge(zscores, how="inner", on=["fid", "datetime", "product"])
+        frame = frame[frame["value"].notna()]
+        if not frame.empty:
+            frame["product"] = frame["product"].astype("category")
+            derived[name] = frame[DERIVED_COLUMNS].reset_index(drop=True)
+    return derived
+
+
+# define function to compute the derived parameters of the records
+def derived_records(records, parameters, peers=None):
+    """
+    :param records: typed dataframe with records (see loader.py)
+    :param parameters: iterable with selected parameters (parameters that are not derived are skipped)
+    :param peers: typed dataframe with records of all fields of the crop type for the anomalies (default: records)
+    :return: dictionary with dataframe (columns DERIVED_COLUMNS) per derived parameter, only for parameters with
+        data
+    """
+    pairs = [parameter for parameter in parameters if parameter in PAIR_PARAMETERS]
+    anomalies = [parameter for parameter in parameters if parameter.endswith(ANOMALY_SUFFIX)]
+    derived = {}
+    if records.empty:
+        return derived
+    if pairs:
+        derived.update(pair_records(records, pairs))
+    if anomalies:
+        derived.update(anomaly_records(records, records if peers is None else peers, anomalies))
+    return derived
@@ -42,7 +42,7 @@ templates_path = ['_templates']
 # This pattern also affects html_static_path and html_extra_path.
 exclude_patterns = []
 
-autodoc_mock_imports = ["altair", "streamlit", "pandas", "sqlite3"]
+autodoc_mock_imports = ["altair", "streamlit", "pandas", "sqlite3", "pyarrow", "duckdb"]
 
 
 # -- Options for HTML output -------------------------------------------------
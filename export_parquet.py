@@ -0,0 +1,179 @@
+"""
+This script can be used to export a Radar Crop Monitor database to a columnar Parquet snapshot, which can be opened
+in the web app instead of the SQLite database (enter the path of the export directory in the app).
+
+Table "s1fieldstatistic" is exported joined with tables "areaofinterest" and "croplegend" (i.e. with the columns of the
+main query of the app), partitioned by aoi and year (directory "records/aoi=<aoi>/year=<year>"). The small tables
+"areaofinterest" (with the field geometries for the field map) and "croplegend" are exported as single files.
+Each aoi/year partition is read from the database in chunks, so memory usage does not depend on the database size.
+
+Usage: python export_parquet.py <path_to_database> <export_directory> [--chunk-size N]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_paths import EXPORT_MARKER
+from db_pool import read_only_uri
+from queries import has_year_column, records_select_sql
+
+# directory of the partitioned records dataset inside the export directory
+RECORDS_DIR = "records"
+
+
+# source columns of the exported query columns (see queries.records_select_sql()), their declared types are used for
+# the Parquet schema
+SOURCE_COLUMNS = {"mask_label": ("s1fieldstatistic", "mask_label"), "unit": ("s1fieldstatistic", "unit"),
+                  "parameter": ("s1fieldstatistic", "polarization"),
+                  "acquisition": ("s1fieldstatistic", "acquisition"), "product": ("s1fieldstatistic", "product"),
+                  "statistic": ("s1fieldstatistic", "statistic"), "fid": ("areaofinterest", "fid"),
+                  "sl_nr": ("areaofinterest", "sl_nr"), "crop_type_code": ("areaofinterest", "crop_type_code"),
+                  "crop_type": ("croplegend", "crop_type")}
+
+# arrow types of the SQLite type affinities (checked in this order, see https://www.sqlite.org/datatype3.html)
+AFFINITY_TYPES = [("INT", pa.int64()), ("CHAR", pa.string()), ("CLOB", pa.string()), ("TEXT", pa.string()),
+                  ("REAL", pa.float64()), ("FLOA", pa.float64()), ("DOUB", pa.float64())]
+
+
+# define function to get the arrow types of the query columns from the declared column types of the database
+def declared_types(db):
+    """
+    :param db: sqlite3 connection object
+    :return: dictionary with query column names as keys and pyarrow.DataType objects as values (only columns with
+        an integer, text or real type affinity, plus "value" and "datetime")
+    """
+    declared = {}
+    for table in {table for table, _ in SOURCE_COLUMNS.values()}:
+        for row in db.execute("PRAGMA table_info({});".format(table)):
+            declared[(table, row[1])] = (row[2] or "").upper()
+    types = {"value": pa.float64(), "datetime": pa.timestamp("ns")}
+    for column, source in SOURCE_COLUMNS.items():
+        for pattern, data_type in AFFINITY_TYPES:
+            if pattern in declared.get(source, ""):
+                types[column] = data_type
+                break
+    return types
+
+
+# define function to convert a chunk of the query result to an arrow table
+def records_table(chunk):
+    """
+    Converts a chunk of the main query result to an arrow table with the datetime strings converted to timestamps.
+    The partition columns aoi and year are dropped, since they are stored in the directory names.
+    (String columns do not need to be encoded here, Parquet stores them dictionary encoded by default.)
+
+    :param chunk: dataframe with query result
+    :return: pyarrow.Table (cast it to the schema of the partition, see partition_schema())
+    """
+    chunk = chunk.drop(columns=["aoi", "year"])
+    chunk["datetime"] = pd.to_datetime(chunk["datetime"])
+    return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+# define function to get the schema of a partition
+def partition_schema(table, types):
+    """
+    Builds the schema all chunks of a partition are cast to, so chunks with columns that only contain NULL values
+    (inferred as null type) or missing values (integers inferred as float) can be written with the same writer.
+
+    :param table: pyarrow.Table of the first chunk of the partition (see records_table())
+    :param types: dictionary with arrow types of the query columns (see declared_types())
+    :return: pyarrow.Schema with the declared types, the types of table for the other columns (string for columns
+        of the null type)
+    """
+    fields = []
+    for field in table.schema:
+        data_type = types.get(field.name, field.type)
+        fields.append(pa.field(field.name, pa.string() if pa.types.is_null(data_type) else data_type))
+    return pa.schema(fields)
+
+
+# define function to export the database to a Parquet snapshot
+def export_parquet(db_path, export_dir, chunk_size=500000):
+    """
+    Exports the joined records of the database to Parquet, partitioned by aoi and year, together with the tables
+    "areaofinterest" and "croplegend". An existing export in the directory is replaced.
+
+    :param db_path: string with path to database file
+    :param export_dir: string with path to export directory (created if it does not exist)
+    :param chunk_size: number of rows read from the database at once
+    :return: dictionary with number of exported rows and partitions
+    """
+    db = sqlite3.connect(read_only_uri(db_path), uri=True)
+    try:
+        marker_path = os.path.join(export_dir, EXPORT_MARKER)
+        if os.path.exists(marker_path):
+            os.remove(marker_path)
+        records_dir = os.path.join(export_dir, RECORDS_DIR)
+        if os.path.isdir(records_dir):
+            shutil.rmtree(records_dir)
+        os.makedirs(records_dir)
+
+        areas = pd.read_sql_query("SELECT * FROM areaofinterest;", db)
+        pq.write_table(pa.Table.from_pandas(areas, preserve_index=False),
+                       os.path.join(export_dir, "areaofinterest.parquet"))
+        crop_legend = pd.read_sql_query("SELECT * FROM croplegend;", db)
+        pq.write_table(pa.Table.from_pandas(crop_legend, preserve_index=False),
+                       os.path.join(export_dir, "croplegend.parquet"))
+
+        sql_body = records_select_sql(has_year_column(db), extra_columns=["s1.statistic"]) + """
+            WHERE s1.aoi = ? AND area.year = ?
+            ORDER BY s1.mask_label, s1.datetime ASC;"""
+        types = declared_types(db)
+        partitions = areas[["aoi", "year"]].drop_duplicates().itertuples(index=False)
+        row_count = 0
+        partition_count = 0
+        for aoi, year in partitions:
+            writer = None
+            for chunk in pd.read_sql(sql_body, db, params=[aoi, year], chunksize=chunk_size):
+                table = records_table(chunk)
+                if writer is None:
+                    partition_dir = os.path.join(records_dir, "aoi={}".format(aoi), "year={}".format(year))
+                    os.makedirs(partition_dir, exist_ok=True)
+                    schema = partition_schema(table, types)
+                    writer = pq.ParquetWriter(os.path.join(partition_dir, "part-0.parquet"), schema)
+                writer.write_table(table.cast(schema))
+                row_count += len(chunk)
+            if writer is not None:
+                writer.close()
+                partition_count += 1
+
+        year_type = "string" if pd.api.types.is_string_dtype(areas["year"]) else "int64"
+        metadata = {"source": os.path.abspath(db_path), "created": time.time(), "year_type": year_type,
+                    "rows": row_count, "partitions": partition_count}
+        with open(marker_path, "w") as marker_file:
+            json.dump(metadata, marker_file)
+        return metadata
+    finally:
+        db.close()
+
+
+# define function to run the export from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments and exports the database.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description="Export a Radar Crop Monitor database to a Parquet snapshot.")
+    parser.add_argument("db_path", help="path to database file")
+    parser.add_argument("export_dir", help="path to export directory")
+    parser.add_argument("--chunk-size", type=int, default=500000, help="number of rows read at once")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    metadata = export_parquet(args.db_path, args.export_dir, chunk_size=args.chunk_size)
+    print("Exported {} rows in {} partitions to {} ({:.1f} s)".format(
+        metadata["rows"], metadata["partitions"], args.export_dir, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
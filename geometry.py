@@ -0,0 +1,255 @@
+"""
+This module provides the field geometries of the Radar Crop Monitor app for the field map.
+
+Geometries are not part of the time series records, they are loaded separately per FID (only when the field map
+is shown), simplified with the Douglas-Peucker algorithm and cached per data source, so they are parsed only once
+for all app sessions. The geometries are parsed without GIS dependencies, supported formats are:
+    - WKT/EWKT strings (e.g. "POLYGON ((...))", "SRID=4326;MULTIPOLYGON (((...)))")
+    - WKB/EWKB blobs, also as hex string, and GeoPackage geometry blobs
+Polygons and multipolygons are supported (Z/M coordinates are ignored), other geometry types are skipped.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+# tolerance of the simplification, as fraction of the diagonal of the bounding box of a field
+SIMPLIFY_TOLERANCE = 0.005
+
+# maximum number of simplified field geometries in the process-wide cache
+GEOMETRY_CACHE_SIZE = 10000
+
+# process-wide cache of simplified field geometries, shared across app sessions
+_geometries = OrderedDict()
+_geometries_lock = threading.Lock()
+
+# regular expressions for parsing WKT
+_WKT_TYPE = re.compile(r"^\s*(?:SRID=\d+\s*;\s*)?([A-Za-z]+)(?:\s+(?:Z|M|ZM))?\s*(.*)$", re.DOTALL)
+_WKT_TOKEN = re.compile(r"\(|\)|[^(),]+")
+_HEX = re.compile(r"^[0-9A-Fa-f]+$")
+
+
+# define function to parse the nested parentheses of a WKT geometry into nested lists of coordinate strings
+def _wkt_nested(text):
+    stack = [[]]
+    for token in _WKT_TOKEN.findall(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            group = stack.pop()
+            stack[-1].append(group)
+        elif token.strip():
+            stack[-1].append(token.strip())
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError("invalid WKT geometry")
+    return stack[0][0]
+
+
+# define function to convert a list of WKT coordinate strings to a ring
+def _wkt_ring(points):
+    return [tuple(float(value) for value in point.split()[:2]) for point in points]
+
+
+# define function to parse a WKT geometry
+def parse_wkt(text):
+    """
+    :param text: string with (E)WKT polygon or multipolygon
+    :return: list of polygons (each a list of rings, each a list of (x, y) tuples)
+    """
+    match = _WKT_TYPE.match(text)
+    if match is None:
+        raise ValueError("invalid WKT geometry")
+    geometry_type, body = match.group(1).upper(), match.group(2).strip()
+    if body.upper() == "EMPTY":
+        return []
+    if geometry_type == "POLYGON":
+        return [[_wkt_ring(ring) for ring in _wkt_nested(body)]]
+    if geometry_type == "MULTIPOLYGON":
+        return [[_wkt_ring(ring) for ring in polygon] for polygon in _wkt_nested(body)]
+    raise ValueError("unsupported geometry type {}".format(geometry_type))
+
+
+# define function to parse a WKB geometry
+def parse_wkb(blob, offset=0):
+    """
+    :param blob: bytes with (E)WKB polygon or multipolygon
+    :param offset: position of the geometry in blob
+    :return: list of polygons (each a list of rings, each a list of (x, y) tuples), position after the geometry
+    """
+    byte_order = "<" if blob[offset] == 1 else ">"
+    geometry_type = struct.unpack_from(byte_order + "I", blob, offset + 1)[0]
+    offset += 5
+    # EWKB flags for Z/M coordinates and SRID, ISO WKB types 1000/2000/3000 + type for Z/M/ZM coordinates
+    dimensions = 2 + bool(geometry_type & 0x80000000) + bool(geometry_type & 0x40000000)
+    if geometry_type & 0x20000000:
+        offset += 4
+    geometry_type &= 0x0FFFFFFF
+    dimensions += {1: 1, 2: 1, 3: 2}.get(geometry_type // 1000, 0)
+    geometry_type %= 1000
+
+    if geometry_type == 3:
+        n_rings = struct.unpack_from(byte_order + "I", blob, offset)[0]
+        offset += 4
+        polygon = []
+        for _ in range(n_rings):
+            n_points = struct.unpack_from(byte_order + "I", blob, offset)[0]
+            offset += 4
+            values = struct.unpack_from(byte_order + "{}d".format(n_points * dimensions), blob, offset)
+            offset += 8 * n_points * dimensions
+            polygon.append(list(zip(values[0::dimensions], values[1::dimensions])))
+        # empty polygons (without rings) are skipped like empty WKT geometries
+        return ([polygon] if polygon else []), offset
+    if geometry_type == 6:
+        n_polygons = struct.unpack_from(byte_order + "I", blob, offset)[0]
+        offset += 4
+        polygons = []
+        for _ in range(n_polygons):
+            polygon, offset = parse_wkb(blob, offset)
+            polygons += polygon
+        return polygons, offset
+    raise ValueError("unsupported geometry type {}".format(geometry_type))
+
+
+# define function to parse a geometry value of the database
+def parse_geometry(value):
+    """
+    :param value: geometry as WKT/EWKT string, WKB/EWKB blob or hex string, or GeoPackage blob
+    :return: list of polygons (each a list of rings, each a list of (x, y) tuples, empty for empty geometries),
+        None if value is empty
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not _HEX.match(value):
+            return parse_wkt(value)
+        value = bytes.fromhex(value)
+    blob = bytes(value)
+    if not blob:
+        return None
+    offset = 0
+    if blob[:2] == b"GP":
+        # GeoPackage header: magic, version, flags, SRID and envelope (size depends on flags)
+        if blob[3] & 0x10:
+            # flag of empty geometries
+            return []
+        offset = 8 + (0, 32, 48, 48, 64)[(blob[3] >> 1) & 0x07]
+    return parse_wkb(blob, offset)[0]
+
+
+# define function to simplify a line with the Douglas-Peucker algorithm
+def simplify_ring(ring, tolerance):
+    """
+    Removes the points of a ring that deviate less than the tolerance from the simplified line.
+    The first and last point are always kept, rings are not simplified to less than 4 points.
+
+    :param ring: list of (x, y) tuples
+    :param tolerance: maximum distance of removed points to the simplified line
+    :return: list of (x, y) tuples
+    """
+    if len(ring) <= 4 or tolerance <= 0:
+        return ring
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = ring[first], ring[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx * dx + dy * dy) ** 0.5
+        max_distance, max_index = 0, None
+        for index in range(first + 1, last):
+            x, y = ring[index]
+            if length > 0:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                # closed ring: distance to the start point
+                distance = ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+            if distance > max_distance:
+                max_distance, max_index = distance, index
+        if max_index is not None and max_distance > tolerance:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+    simplified = [point for point, kept in zip(ring, keep) if kept]
+    return simplified if len(simplified) >= 4 else ring
+
+
+# define function to simplify polygons
+def simplify_polygons(polygons, relative_tolerance=SIMPLIFY_TOLERANCE):
+    """
+    :param polygons: list of polygons (each a list of rings, each a list of (x, y) tuples)
+    :param relative_tolerance: tolerance as fraction of the diagonal of the bounding box of all polygons
+    :return: list of simplified polygons
+    """
+    points = [point for polygon in polygons for ring in polygon for point in ring]
+    if not points:
+        return polygons
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    tolerance = relative_tolerance * ((max(xs) - min(xs)) ** 2 + (max(ys) - min(ys)) ** 2) ** 0.5
+    return [[simplify_ring(ring, tolerance) for ring in polygon] for polygon in polygons]
+
+
+# define function to convert a field geometry to a GeoJSON feature
+def field_feature(fid, polygons):
+    """
+    :param fid: FID of field
+    :param polygons: list of polygons (each a list of rings, each a list of (x, y) tuples)
+    :return: dictionary with GeoJSON feature (MultiPolygon) with property "fid"
+    """
+    coordinates = [[[list(point) for point in ring] for ring in polygon] for polygon in polygons]
+    return {"type": "Feature", "geometry": {"type": "MultiPolygon", "coordinates": coordinates},
+            "properties": {"fid": fid}}
+
+
+# define function to get the simplified geometries of fields (from cache or data source)
+def field_features(backend, aoi, year, fids, relative_tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Returns the simplified geometries of the fields as GeoJSON features. Geometries that are not cached yet are
+    loaded from the backend with one query, fields without (supported) geometry are skipped.
+
+    :param backend: data backend with methods version() and load_geometries() (see backends.py)
+    :param aoi: string with AOI
+    :param year: year of fields
+    :param fids: iterable with FIDs
+    :param relative_tolerance: tolerance of simplification as fraction of the diagonal of the field
+    :return: list of dictionaries with GeoJSON features
+    """
+    version = backend.version()
+    keys = {fid: (backend.key, version, aoi, year, fid, relative_tolerance) for fid in fids}
+    features = {}
+    with _geometries_lock:
+        for fid, key in keys.items():
+            if key in _geometries:
+                _geometries.move_to_end(key)
+                features[fid] = _geometries[key]
+
+    missing = [fid for fid in keys if fid not in features]
+    if missing:
+        loaded = {}
+        for fid, value in backend.load_geometries(aoi, year, missing).items():
+            try:
+                polygons = parse_geometry(value)
+            except (ValueError, IndexError, struct.error):
+                polygons = None
+            loaded[fid] = field_feature(fid, simplify_polygons(polygons, relative_tolerance)) if polygons else None
+        with _geometries_lock:
+            for fid in missing:
+                # fields without geometry are cached as well, so they are not queried again
+                features[fid] = _geometries[keys[fid]] = loaded.get(fid)
+            while len(_geometries) > GEOMETRY_CACHE_SIZE:
+                _geometries.popitem(last=False)
+    return [features[fid] for fid in keys if features[fid] is not None]
+
+
+# define function to clear the geometry cache
+def clear_geometries():
+    """
+    Removes all geometries from the process-wide cache.
+    """
+    with _geometries_lock:
+        _geometries.clear()
@@ -0,0 +1,172 @@
+"""
+This module provides the instrumentation of the Radar Crop Monitor app, which shows where the time of an app run
+is spent (database connection, filter values, main query, dataframe conversion, chart building and display).
+
+For each stage, the wall time and (where available) the number of rows, the memory of the dataframe, the size of
+the chart specification and the query plan of the executed SQL are recorded. Every stage is emitted as structured
+log line (one JSON object per line, logger "rcm_plot") and the stages of the current app run can be shown in the
+debug panel of the sidebar. Details that are expensive to compute (specification size, query plan) are only
+recorded if the debug panel is shown, in stages of their own, so they do not add to the time of the measured
+stages. Altair and pandas are only imported when a chart specification is measured or the stages are shown, so the
+path screen of the app can use the profiler without loading them.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+# logger of the app (the level can be set with environment variable RCM_LOG_LEVEL, e.g. "WARNING" to disable
+# the stage log lines)
+logger = logging.getLogger("rcm_plot")
+
+# target of the time of the script run up to the path screen (in seconds, see main.py and benchmark.py)
+PATH_SCREEN_TARGET = 1.0
+
+
+# define function to set up the logger of the app
+def setup_logging():
+    """
+    Adds a handler that writes the log lines of the app to stderr (only once per process). An invalid level in
+    RCM_LOG_LEVEL is logged as warning and replaced by INFO.
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        # the log lines are JSON objects, so they can be parsed line by line
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+        level = os.environ.get("RCM_LOG_LEVEL", "INFO").upper()
+        try:
+            logger.setLevel(level)
+        except ValueError:
+            logger.setLevel(logging.INFO)
+            logger.warning(json.dumps({"stage": "setup_logging",
+                                       "error": "invalid RCM_LOG_LEVEL {!r}, using INFO".format(level)}))
+
+
+# define function to get the name of a dataset in a chart specification
+def dataset_name(values):
+    """
+    :param values: list with records of a dataset (see altair.utils.data.to_values())
+    :return: string with name of the dataset in the "datasets" of a chart specification (hash of the records, as
+        given by Altair)
+    """
+    return "data-" + hashlib.md5(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+# define function to get the size of a chart specification
+def spec_size(chart):
+    """
+    The chart is serialized with the first row of each of its dataframes only, and the datasets of the specification
+    are then replaced by all rows of the dataframes, so the data transformer of Altair (global state shared by the app
+    sessions and the prefetch thread, with a row limit) does not need to be changed.
+
+    :param chart: altair.Chart object
+    :return: size of the JSON specification of the chart, including its data (in bytes)
+    """
+    import altair as alt
+    import pandas as pd
+    from altair.utils.data import to_values
+    chart = chart.copy(deep=True)
+    charts = [chart]
+    datasets = {}
+    first_rows = set()
+    while charts:
+        item = charts.pop()
+        data = getattr(item, "data", None)
+        if isinstance(data, pd.DataFrame):
+            values = to_values(data)["values"]
+            datasets[dataset_name(values)] = values
+            item.data = data.head(1)
+            first_rows.add(dataset_name(to_values(item.data)["values"]))
+        for key in ("layer", "hconcat", "vconcat", "concat"):
+            if isinstance(getattr(item, key, None), list):
+                charts.extend(getattr(item, key))
+        if isinstance(getattr(item, "spec", None), alt.TopLevelMixin):
+            charts.append(item.spec)
+    spec = chart.to_dict()
+    # the names of the datasets have the same length, so the references to them do not change the size
+    datasets.update((name, values) for name, values in spec.pop("datasets", {}).items() if name not in first_rows)
+    if datasets:
+        spec["datasets"] = datasets
+    return len(json.dumps(spec))
+
+
+# define class that records the stages of an app run
+class Profiler:
+    """
+    Records wall time and details of the stages of one app run.
+
+    :param detailed: if True, expensive details (specification size, query plans) are recorded as well
+    """
+
+    def __init__(self, detailed=False):
+        self.detailed = detailed
+        self.run_id = uuid.uuid4().hex[:8]
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **details):
+        """
+        Measures the wall time of the code in the with-block. Details can be added to the yielded dictionary
+        (e.g. "rows", "memory_bytes", "spec_bytes" or "plan").
+
+        :param name: string with name of stage
+        :param details: initial details of stage
+        :return: dictionary with details of stage
+        """
+        record = {"stage": name}
+        record.update(details)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            self.stages.append(record)
+            logger.info(json.dumps(dict(record, run=self.run_id, time=time.strftime("%Y-%m-%dT%H:%M:%S")),
+                                   default=str))
+
+    def add_frame(self, record, frame):
+        """
+        Adds the number of rows and the memory of a dataframe to the details of a stage.
+
+        :param record: dictionary with details of stage
+        :param frame: dataframe
+        """
+        record["rows"] = len(frame)
+        record["memory_bytes"] = int(frame.memory_usage(deep=True, index=True).sum())
+
+    def add_chart(self, name, chart):
+        """
+        Records the size of the chart specification as detail "spec_bytes" of a stage of its own (only if detailed
+        is True), so the serialization of the chart is not included in the time of the stage that built it.
+
+        :param name: string with name of stage (e.g. "chart_spec:VV")
+        :param chart: altair.Chart object
+        """
+        if self.detailed:
+            with self.stage(name) as record:
+                record["spec_bytes"] = spec_size(chart)
+
+    def table(self):
+        """
+        :return: dataframe with one row per stage (without query plans)
+        """
+        import pandas as pd
+        rows = [{key: value for key, value in record.items() if key != "plan"} for record in self.stages]
+        table = pd.DataFrame(rows)
+        if not table.empty:
+            table = table.set_index("stage")
+        return table
+
+    def plans(self):
+        """
+        :return: list of (stage, query plan) tuples of the stages with query plan
+        """
+        return [(record["stage"], record["plan"]) for record in self.stages if record.get("plan")]
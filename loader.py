@@ -0,0 +1,157 @@
+"""
+This module converts the records of the main query of the Radar Crop Monitor app into a compact, schema-typed
+dataframe:
+    - categoricals for the columns with few distinct values (parameter, product, acquisition, unit, aoi, crop_type)
+    - float32 values and the smallest integer type for FIDs and codes
+    - native datetime64 columns "datetime" and "date" (derived vectorized from the datetime strings)
+
+Query results are read from the cursor in chunks and typed chunk by chunk, so only one chunk of Python objects
+exists at a time instead of the complete result.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import time
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# columns that are stored as categoricals
+CATEGORY_COLUMNS = ["parameter", "product", "acquisition", "unit", "aoi", "crop_type"]
+
+# columns that are stored as float32
+FLOAT_COLUMNS = ["value"]
+
+# columns that are stored with the smallest possible integer type (if they only contain integers)
+INTEGER_COLUMNS = ["mask_label", "fid", "year", "sl_nr", "crop_type_code"]
+
+# number of rows that are fetched from the cursor and typed at once
+CHUNK_SIZE = 100000
+
+
+# define function to convert a dataframe with records to the typed schema
+def typed_records(frame):
+    """
+    Converts the columns of a records dataframe (as returned by the main query or a Parquet backend) to the
+    typed schema. Column "date" (datetime64, time set to midnight) is derived from column "datetime",
+    string columns "date"/"time" of older query results are replaced.
+
+    :param frame: dataframe with records
+    :return: dataframe with typed columns
+    """
+    typed = frame.drop(columns=["date", "time"], errors="ignore")
+    if "datetime" in typed.columns:
+        # the cache of to_datetime() parses each distinct datetime string only once
+        typed["datetime"] = pd.to_datetime(typed["datetime"], cache=True)
+        typed["date"] = typed["datetime"].dt.normalize()
+    for column in CATEGORY_COLUMNS:
+        if column in typed.columns:
+            typed[column] = typed[column].astype("category")
+    for column in FLOAT_COLUMNS:
+        if column in typed.columns:
+            typed[column] = typed[column].astype("float32")
+    for column in INTEGER_COLUMNS:
+        # columns with NULL values stay float, columns with text (e.g. text FIDs) are not converted
+        if column in typed.columns and pd.api.types.is_numeric_dtype(typed[column]):
+            typed[column] = pd.to_numeric(typed[column], downcast="integer")
+    return typed
+
+
+# define function to concatenate typed chunks
+def concat_typed(chunks, columns=None):
+    """
+    Concatenates typed record chunks. Categorical columns are combined with union_categoricals(), so they stay
+    categorical even if the chunks have different categories (or categories of different dtypes, e.g. from SQLite
+    and Parquet sources).
+
+    :param chunks: list of typed dataframes
+    :param columns: list with column names of result (used if chunks is empty)
+    :return: typed dataframe
+    """
+    if not chunks:
+        return typed_records(pd.DataFrame(columns=columns))
+    if len(chunks) == 1:
+        return chunks[0]
+    combined = {}
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            parts = [chunk[column] for chunk in chunks]
+            if len({part.cat.categories.dtype for part in parts}) > 1:
+                parts = [part.cat.rename_categories(part.cat.categories.astype(object)) for part in parts]
+            combined[column] = pd.Series(union_categoricals(parts))
+        else:
+            combined[column] = pd.concat([chunk[column] for chunk in chunks], ignore_index=True)
+    return pd.DataFrame(combined)
+
+
+# define function to merge record frames that are each ordered like the main query
+def merge_records(frames, columns=None):
+    """
+    :param frames: list of typed dataframes with records (e.g. of several shards, or a cached result and the records
+        appended to the database since)
+    :param columns: list with column names of result (used if all frames are empty)
+    :return: typed dataframe with all records, in the order of the main query (by FID and time)
+    """
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    records = concat_typed(frames, columns)
+    return records.sort_values(["mask_label", "datetime"], kind="stable", ignore_index=True)
+
+
+# define function to load the typed records of a query
+def load_typed(db, sql_body, params=(), chunk_size=CHUNK_SIZE, timings=None):
+    """
+    Executes a query and loads the result as typed dataframe, chunk by chunk.
+
+    :param db: sqlite3.Connection object with connection to database
+    :param sql_body: string with SQL query
+    :param params: list with query parameters
+    :param chunk_size: number of rows fetched and typed at once
+    :param timings: dictionary to which the time of the query ("query_seconds") and of the conversion to the typed
+        dataframe ("convert_seconds") is added, or None
+    :return: typed dataframe
+    """
+    query_seconds = 0
+    convert_seconds = 0
+    start = time.perf_counter()
+    cursor = db.execute(sql_body, params)
+    columns = [description[0] for description in cursor.description]
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        fetched = time.perf_counter()
+        query_seconds += fetched - start
+        if not rows:
+            break
+        chunks.append(typed_records(pd.DataFrame.from_records(rows, columns=columns)))
+        start = time.perf_counter()
+        convert_seconds += start - fetched
+    records = concat_typed(chunks, columns)
+    if timings is not None:
+        timings["query_seconds"] = round(query_seconds, 6)
+        timings["convert_seconds"] = round(convert_seconds + time.perf_counter() - fetched, 6)
+    return records
+
+
+# define function to get the memory usage of a dataframe per column
+def memory_report(frame):
+    """
+    :param frame: dataframe
+    :return: dataframe with dtype and memory usage (bytes) per column, and a row with the total memory usage
+    """
+    usage = frame.memory_usage(deep=True, index=True)
+    report = pd.DataFrame({"dtype": [str(frame.index.dtype)] + [str(dtype) for dtype in frame.dtypes],
+                           "bytes": usage.values}, index=usage.index)
+    report.loc["total"] = ["", int(usage.sum())]
+    return report
+
+
+# define function to get the first and last date of the records
+def date_bounds(frame):
+    """
+    :param frame: typed dataframe with column "date"
+    :return: tuple with first and last date (datetime.date objects), (None, None) if the dataframe is empty
+    """
+    if frame.empty:
+        return None, None
+    return frame["date"].min().date(), frame["date"].max().date()
@@ -2,16 +2,38 @@
 This script can be used to run a Streamlit web app that displays time series of Radar backscatter
 and NDVI values from a database. It was developed to work with a specific database from the Radar Crop Monitor project.
 
+The script only imports the modules needed for the path screen, so the screen is shown quickly after the server
+has started. The main page of the app (app.py, with pandas, Altair and the data backends) is imported in a background
+thread while the user enters the path. The time of the script run up to the path screen is logged as stage
+"path_screen_script" on the first run of each session (with a warning if it exceeds PATH_SCREEN_TARGET).
+It covers the imports and the script up to the path input, not the start of the server or the rendering in the
+browser.
+
 Authors: Markus Adam, Laura Walder
 |  Date created: 13/10/2021
 |  Date last modified: 27/02/2022
 |  Python version: 3.8  |
 """
 # import packages
-import streamlit as st
-import pandas as pd
+import time
+# start of the script run (the time of the script run up to the path screen is measured from here)
+SCRIPT_START = time.perf_counter()
+import importlib
+import json
 import sqlite3
-import altair as alt
+import sys
+import threading
+import streamlit as st
+from data_paths import is_parquet_export, shard_paths
+from db_pool import REQUIRED_TABLES
+from instrumentation import PATH_SCREEN_TARGET, Profiler, logger, setup_logging
+
+# modules of the main page that are imported in the background while the path screen is shown
+PAGE_MODULES = ["app"]
+
+# name of the thread importing the page modules (Streamlit runs this script again on every interaction, so the
+# running import is found by its thread name instead of a variable of the script)
+WARM_UP_THREAD = "rcm-warm-up"
 
 # Permanent database path can be defined in set_permanent_db_path() to avoid path query within the
 # app on every app start.
@@ -24,6 +46,8 @@ def set_permanent_db_path():
     Defines a string that can be used to set a permanent path to the database.
     The default value "Enter path here" leads to path query in the web app.
     If the default is replaced with valid database path, the path query will be avoided (main app page opens directly).
+    An archive split into several databases can be opened with the path of the directory containing the database
+    files or with the database paths separated by ";" (see backends.ShardedBackend).
 
     :return: string with default or database path
     """
@@ -31,378 +55,121 @@ def set_permanent_db_path():
     return permanent_db_path
 
 
-# define function for establishing connection to database
-def db_connect(db_path):
+# define function to set whether the database is opened as immutable snapshot
+def set_immutable_db():
     """
-    Tries connecting to database & gets dataframe of all table names (which will be empty if database path is invalid),
-    prints error if connection is unsuccessful.
+    Defines whether the database is opened in SQLite's immutable mode.
+    This is only safe for snapshot databases that are not modified while the app is running,
+    but avoids all file locking and change detection overhead.
 
-    :param db_path: string with path to database file
-    :return: sqlite3.Connection object with connection to database, dataframe with database table names
+    :return: boolean, False by default
     """
-    try:
-        database = sqlite3.connect(db_path)
-        table_names = pd.read_sql_query("SELECT * FROM sqlite_master WHERE type='table'", database)
-        return database, table_names
-    except sqlite3.Error as error:
-        connection_error = "Error while connecting to database:" + str(error)
-        st.error(connection_error)
+    immutable_db = False
+    return immutable_db
 
 
-# define function to replace filter value abbreviations with full words, and vice versa
-def replace_strings(string_list, string_dict):
+# define function to set the engine used for Parquet snapshots
+def set_parquet_engine():
     """
-    Uses a dictionary to convert a list of strings in two ways:
-        - searching if keys from dictionary are in list and replacing them with corresponding values
-        - searching if values from dictionary are in list and replacing them with corresponding keys
-
-    Direction of conversion is chosen automatically depending on whether keys or values from dictionary are in list.
+    Defines the engine used to read Parquet snapshots created with export_parquet.py
+    (only relevant if the path of an export directory is entered instead of a database path).
+    "pyarrow" is the default, "duckdb" requires the optional package duckdb.
 
-    :param string_list: list of strings
-    :param string_dict: dictionary where keys and values are strings
-    :return: potentially updated list of strings
+    :return: string with engine name
     """
+    parquet_engine = "pyarrow"
+    return parquet_engine
 
-    updated_string_list = string_list.copy()
-
-    # search for dict keys in input list and replace them with corresponding values
-    for string in string_dict.keys():
-        if string in updated_string_list:
-            updated_string_list = [w.replace(string, string_dict.get(string)) for w in updated_string_list]
 
-    # if keys have been found and replaced, new list differs from input list
-    if updated_string_list != string_list:
-        return updated_string_list
-
-    # if no change occurred (= no keys to replace found), search for values and replace them with corresponding keys
-    else:
-        for string in string_dict.values():
-            if string in updated_string_list:
-                matching_key_list = [key for key, value in string_dict.items() if value == string]
-                matching_key = matching_key_list[0]
-                updated_string_list = [w.replace(string, matching_key) for w in updated_string_list]
-        return updated_string_list
-
-
-# define function to add placeholder to multiselection tuple if len == 1 (prevents syntax error in sql query)
-def placeholders(multiselections):
+# define function to check if a path can be opened by the app
+def is_valid_path(path):
     """
-    Adds a string ("placeholder") to a tuple if its length is 1.
-    This is necessary because tuples with length 1 lead to a syntax error when included in a SQL query.
-
-    :param multiselections: tuple with user-selected multiselection filter values
-    :return: tuple with filter values and optional placeholder
+    :param path: string with path entered by user or set in set_permanent_db_path()
+    :return: True if path is a database file (ending ".db"), a Parquet export directory or a directory/list of
+        database files, else False
     """
-    if len(multiselections) == 1:
-        multiselections = multiselections + ("placeholder",)
-        return multiselections
-    else:
-        return multiselections
+    return path.endswith(".db") or is_parquet_export(path) or bool(shard_paths(path))
 
 
-# define function to make charts
-def make_chart(pol_records, axis_label, domain, selection, color_column, sort, title, stat_button):
+# define function to import the modules of the main page
+def import_page_modules():
     """
-    Creates scatterplot and trendline diagrams of VV/VH/NDVI values from respective subset of dataframe "records".
-    X axis of scatterplot shows time, while Y axis shows values. Points in the scatterplot are colored
-    based on user selection.
-
-
-    Two types of trendlines are created based on two different statistical methods:
-    Locally Estimated Scatterplot Smoothing (LOESS) and Rolling Mean (with 10 values per mean).
-    One of these trendlines is added to the scatterplot if selected by user.
-
-    :param pol_records: subset of dataframe "records" with one polarisation/value (VV,VH,NDVI)
-    :param axis_label: string with y-axis label
-    :param domain: numpy.ndarray with boundaries for x-axis (start and end date)
-    :param selection: altair.selection_multi object with values that will be colored (bound to user selection in chart legend) 
-    :param color_column: dataframe column by which data points are colored in chart
-    :param sort: list with order of values in chart legend
-    :param title: string with chart title
-    :param stat_button: string with name of trendline selected by user
-    :return: altair.Chart object displaying either VV/VH/NDVI values (and trend line if selected)
+    Imports the modules of the main page (PAGE_MODULES) and logs the time of the import. Errors are only logged, they
+    are raised again when the main page is imported by the script.
     """
-    # make the base chart (scatterplot with x=time, y=value)
-    value_chart = alt.Chart(pol_records).mark_circle().encode(
-        x=alt.X("datetime:T", axis=alt.Axis(title='Date', titleFontSize=22),
-                scale=alt.Scale(domain=list(domain))),
-        y=alt.Y("value", axis=alt.Axis(title=axis_label, titleFontSize=22)),
-        color=alt.condition(selection, color_column, alt.value("lightgray"), sort=sort,
-                            legend=alt.Legend(type='symbol')),
-        opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
-        tooltip=("fid", "acquisition", "product")).add_selection(selection). \
-        properties(title=title, width=1000, height=500)
-
-    # make LOESS trendline chart
-    loess_chart = alt.Chart(pol_records).encode(
-        x=alt.X("datetime:T", axis=alt.Axis(title='Date', titleFontSize=22),
-                scale=alt.Scale(domain=list(domain))),
-        y=alt.Y("value", axis=alt.Axis(title=axis_label, titleFontSize=22))).transform_filter(selection). \
-        transform_loess("datetime", "value").mark_line(color="red")
-
-    # make Rolling Mean trendline chart (mean of 10 values)
-    mean_chart = alt.Chart(pol_records).mark_line(color="red").transform_filter(selection). \
-        transform_window(rolling_mean="mean(value)", frame=[-5, 5]).encode(x='datetime:T', y='rolling_mean:Q')
-
-    # add trendline to scatterplot, if selected
-    if stat_button == "LOESS":
-        final_chart = value_chart + loess_chart
-    elif stat_button == "Rolling Mean":
-        final_chart = value_chart + mean_chart
-    else:
-        final_chart = value_chart
-
-    return final_chart
+    start = time.perf_counter()
+    try:
+        for name in PAGE_MODULES:
+            importlib.import_module(name)
+        logger.info(json.dumps({"stage": "warm_up", "seconds": round(time.perf_counter() - start, 6)}))
+    except Exception as error:
+        logger.warning(json.dumps({"stage": "warm_up", "error": str(error)}))
 
 
-# define function to display chart if data for corresponding parameter is available
-def display_chart(vv_vh_ndvi, records, chart):
+# define function to start the import of the modules of the main page in the background
+def warm_up_page():
     """
-    Displays chart in app if the corresponding parameter was selected by user
-    and if data with this parameter is available in the "records" dataframe.
-    Returns warning if parameter was selected but is not available.
-
-    :param vv_vh_ndvi: string with parameter (VV,VH,NDVI)
-    :param records: dataframe with data that will be displayed
-    :param chart: altair.Chart object displaying values with vv_vh_ndvi parameter
-    :return: warning if no data is available for selected parameter
+    Starts import_page_modules() in a background thread, unless the modules have been imported already or are being
+    imported, so the main page is loaded while the user enters the path.
     """
-
-    # if data with parameter is available:
-    if records["parameter"].str.contains(vv_vh_ndvi).any():
-        st.altair_chart(chart.configure_title(fontSize=28).configure_legend(titleFontSize=20, labelFontSize=18))
-    # if selection has been made, but no data with parameter available:
-    elif records.empty is False:
-        param_warning = "No data available for parameter {}".format(vv_vh_ndvi)
-        return st.warning(param_warning)
+    if all(name in sys.modules for name in PAGE_MODULES):
+        return
+    if any(thread.name == WARM_UP_THREAD for thread in threading.enumerate()):
+        return
+    threading.Thread(target=import_page_modules, name=WARM_UP_THREAD, daemon=True).start()
 
 
-# define function for deploying main page of app
-def main_part(db):
+# define function to log the time of the script run up to the path screen
+def log_script_time():
     """
-    Deploys the main page of the app and its functionalities. This mainly includes:
-        - setting app title and description
-        - getting and displaying available data filter values from database, then getting filter selections from user
-        - querying data as dataframe from database, based on filter values selected by user
-        - making and displaying charts based on queried dataframe
-
-    :param db: sqlite3.Connection object with connection to database
-    :return: no return in script, but deploys streamlit app functionalities (filters, charts)
+    Logs the time from the start of the script run (SCRIPT_START) to the path screen as stage "path_screen_script",
+    with a warning if it exceeds PATH_SCREEN_TARGET. Streamlit runs the script again on every interaction, so the
+    time is only logged on the first run of each session (flag in st.session_state). In the first session of the
+    server process, the time includes the imports of the path screen; later sessions find them imported already.
     """
-    # print app title and description
-    st.title('Radar Crop Monitor App')
-    st.markdown('This app can be used to display SAR parameters and NDVI values for crop monitoring.')
-    st.markdown("Please select the main and dependent filter first. Note that displaying the data may take some time.")
-    st.markdown('#')
-
-    # print titles for data filters in app
-    st.sidebar.title("Filter")
-    st.sidebar.markdown("#")
-    st.sidebar.header('Main Filter')
-
-    # define dict of filter values that need to be converted from abbreviations to full words
-    string_dict = {"DEMM": "Demmin", "FRIEN": "Frienstedt", "MRKN": "Markneukirchen",
-                   "A": "Ascending", "D": "Descending"}
-
-    # query unique values from specific table columns of db to use as selectable values for main and dependent filters
-    # abbreviated values (in aoi/acquisition) are converted to full words with replace_strings()
-    aoi_names = pd.read_sql_query('select distinct aoi from areaofinterest;', db)
-    aoi_names = aoi_names["aoi"].tolist()
-    aoi_names = replace_strings(aoi_names, string_dict)
-    years = pd.read_sql_query("select distinct year from areaofinterest;", db)
-    crop_types = pd.read_sql_query("select distinct crop_type from croplegend;", db)
-    products = pd.read_sql_query("select distinct product from s1fieldstatistic;", db)
-    acq_types = pd.read_sql_query("select distinct acquisition from s1fieldstatistic;", db)
-    acq_types = acq_types["acquisition"].tolist()
-    acq_types = replace_strings(acq_types, string_dict)
-    parameter = pd.read_sql_query("select distinct polarization from s1fieldstatistic;", db)
-    stats = pd.read_sql_query("select distinct statistic from s1fieldstatistic;", db)
-    fid = pd.read_sql_query("select distinct fid from areaofinterest;", db)
-
-    # get single value selections of main filters from user
-    # full words (in aoi) are converted back to abbreviations for sql query
-    aoi_selection = [st.sidebar.selectbox("AOI", aoi_names)]
-    aoi_selection = replace_strings(aoi_selection, string_dict)
-    aoi_selection = aoi_selection[0]
-    year_selection = st.sidebar.selectbox("Year", years)
-    crop_selection = st.sidebar.selectbox("Crop Type", crop_types)
-    stat_selection = st.sidebar.selectbox("Statistic", stats)
-
-    # print title for dependent filters in app
-    st.sidebar.markdown('#')
-    st.sidebar.header('Dependent Filter')
-
-    # get tuples of multiselections (dependent filters) from user
-    # full words (in acquisition) are converted back to abbreviations for sql query
-    acq_selection = st.sidebar.multiselect("Acquisition Mode", acq_types)
-    acq_selection = replace_strings(acq_selection, string_dict)
-    acq_selection = tuple(acq_selection)
-    product_selection = tuple(st.sidebar.multiselect("Product", products))
-    param_selection = tuple(st.sidebar.multiselect("Parameter", parameter))
-    fid_selection = tuple(st.sidebar.multiselect("FID", fid))
-
-    # print data source and contributors in app
-    st.sidebar.markdown("#")
-    st.sidebar.markdown("Data Source: ESA Copernicus-Data")
-    st.sidebar.markdown("Contributors: Markus Adam, Laura Walder")
-
-    # define list of multiselection tuples
-    dependent_selections = [acq_selection, product_selection, param_selection, fid_selection]
-
-    # apply placeholder function to multiselection tuples
-    acq_selection = placeholders(acq_selection)
-    param_selection = placeholders(param_selection)
-    product_selection = placeholders(product_selection)
-    fid_selection = placeholders(fid_selection)
-
-    # define sql body for query, with filter selections as variables
-    sql_body = f"""SELECT 
-        round(s1.value, 2) as value, 
-        s1.mask_label, 
-        s1.unit, 
-        s1.aoi, 
-        s1.datetime, 
-        strftime('%Y-%m-%d', s1.datetime) as date,
-        strftime('%H:%M:%S', s1.datetime) as time,
-        s1.polarization as parameter, 
-        s1.acquisition, 
-        s1.product,
-        area.fid, 
-        area.year, 
-        area.sl_nr, 
-        area.crop_type_code, 
-        area.crop_type,
-        area.field_geom
-        FROM s1fieldstatistic as s1
-        INNER JOIN (SELECT 
-        areaofinterest.fid, 
-        areaofinterest.year, 
-        areaofinterest.aoi,
-        areaofinterest.sl_nr, 
-        areaofinterest.crop_type_code, 
-        crop.crop_type,
-        areaofinterest.field_geom
-        FROM areaofinterest
-        INNER JOIN croplegend as crop 
-        ON (crop.crop_type_code = areaofinterest.crop_type_code)) area
-        ON (s1.mask_label = area.fid AND strftime('%Y', s1.datetime)=area.year AND s1.aoi = area.aoi)
-        WHERE 
-        s1.aoi="{aoi_selection}"
-        AND area.crop_type="{crop_selection}"
-        AND area.year="{year_selection}"
-        AND s1.product IN {repr(product_selection)}
-        AND s1.acquisition IN {repr(acq_selection)}
-        AND s1.polarization IN {repr(param_selection)}
-        AND area.fid IN {repr(fid_selection)}
-        AND s1.statistic = "{stat_selection}"
-        ORDER BY s1.mask_label, s1.datetime  ASC; """
-
-    # apply sql query and load resulting table as dataframe
-    records = pd.read_sql(sql_body, db)
-
-    # print warning when no filter is selected and error when invalid filter combination (with no data) is selected
-    if records.empty:
-        if any(len(x) == 0 for x in dependent_selections):
-            st.warning("No selection has been made. Please select filter combination.")
-        else:
-            st.error("No data is available for this filter combination. Please select other filter combinations.")
-
-    # create time slider for date range selection (start and end date of x-axis of charts)
-    # as well as selections for trendlines in chart (LOESS/Rolling Mean)
-    # and for data point coloring variable (FID/Acquisition Mode)
-
-    # convert datetime string column to datetime
-    records["datetime"] = pd.to_datetime(records['datetime']).apply(lambda x: x.date())
+    if st.session_state.get("path_screen_logged"):
+        return
+    st.session_state["path_screen_logged"] = True
+    seconds = round(time.perf_counter() - SCRIPT_START, 6)
+    logger.info(json.dumps({"stage": "path_screen_script", "seconds": seconds}))
+    if seconds > PATH_SCREEN_TARGET:
+        logger.warning(json.dumps({"stage": "path_screen_script", "seconds": seconds,
+                                   "target_seconds": PATH_SCREEN_TARGET}))
 
-    # get earliest and latest date from dataframe as boundaries for slider
-    start_date = records["datetime"].min()
-    end_date = records["datetime"].max()
 
-    st.markdown("#")
-
-    # define expander box which will contain time slider and radiobuttons for trendline and coloring selection
-    with st.expander("Additional filter", expanded=True):
-
-        # define slider values from user selection and filter dataframe based on these values
-        try:
-            st.subheader("Select date range")
-            slider_1, slider_2 = st.slider('', value=(start_date, end_date), format="DD.MM.YY")
-            records = records[(records['datetime'] >= slider_1) & (records['datetime'] <= slider_2)]
-        except KeyError:
-            st.warning("Date range slider is only available after a valid filter combination has been selected")
-
-        st.markdown("#")
-
-        # make columns for trendline/coloring selection buttons
-        col1, col2 = st.columns(2)
-
-        # make button for selection of trendline type
-        col1.subheader("Select trendline")
-        stat_button = col1.radio("", ("None", "LOESS", "Rolling Mean"))
-
-        # make button for selection of coloring column
-        col2.subheader("Select data point coloring")
-        color_button = col2.radio("", ("by FID", "by Acquisiton Mode"))
-
-    st.markdown("#")
-
-    # create charts (scatterplots and trendlines) for VV, VH and NDVI values
-
-    # remap acquisition values from abbreviations (A/D) to full words (ascending/descending)
-    records["acquisition"] = records["acquisition"].map({"A": "ascending", "D": "descending"})
-
-    # set dataframe column by which points are colored in charts (acquisition or fid, based on user selection)
-    if color_button == "by FID":
-        color_selection = alt.selection_multi(fields=['fid'], bind='legend')
-        color_column = "fid"
-        sort = None
-    else:
-        color_selection = alt.selection_multi(fields=['acquisition'], bind='legend')
-        color_column = "acquisition"
-        sort = ["D"]
+# define function to get the required tables that are missing in a database
+def missing_tables(table_names):
+    """
+    :param table_names: list with table names of database (see db_connect())
+    :return: list with the names of the required tables (db_pool.REQUIRED_TABLES) that are not in table_names
+    """
+    return [name for name in REQUIRED_TABLES if name not in table_names]
 
-    # get earliest and latest date again from potentially time-filtered dataframe
-    start_date = records["datetime"].min()
-    end_date = records["datetime"].max()
 
-    # set domain containing earliest and latest date in dataframe, used as boundaries for x-axis of charts
-    domain_pd = pd.to_datetime([start_date, end_date]).view("int64") / 10 ** 6
+# define function for establishing connection to database
+def db_connect(db_path):
+    """
+    Opens the data backend of the path & gets list of the required tables that exist in the database (which will be
+    empty if database path is invalid), prints error if connection is unsuccessful.
+    For database files, the backend uses the shared pool of read-only connections to database (shared by all app
+    sessions, only the required tables are looked up, once per database file). For Parquet export directories, the
+    backend reads the Parquet snapshot with the engine set in set_parquet_engine(). For directories or lists of
+    database files, the backend combines the databases (shards), the table names are those that exist in all shards.
+    The data backends (pandas, pyarrow) are imported on the first call.
 
-    # set y-axis label based on user-selected statistic (which can be in units or absolute values)
-    if stat_selection in ["mean", "median", "std", "mode_value_1"]:
-        y_axis_label_db = "Backscatter [dB]"
-        y_axis_label_ndvi = "NDVI value"
-    else:
-        y_axis_label_db = "Value"
-        y_axis_label_ndvi = "Value"
-
-    # set chart titles
-    vv_title = "VV Polarisation"
-    vh_title = "VH Polarisation"
-    ndvi_title = "NDVI"
-
-    # go through selected parameters, create dataframe subset with parameter
-    # and make/display corresponding charts, if data is available
-    for param in param_selection:
-        if param == "VV":
-            vv_records = records[records["parameter"] == "VV"]
-            vv_chart = make_chart(vv_records, y_axis_label_db, domain_pd, color_selection,
-                                  color_column, sort, vv_title, stat_button)
-            display_chart("VV", records, vv_chart)
-        if param == "VH":
-            vh_records = records[records["parameter"] == "VH"]
-            vh_chart = make_chart(vh_records, y_axis_label_db, domain_pd, color_selection,
-                                  color_column, sort, vh_title, stat_button)
-            display_chart("VH", records, vh_chart)
-        if param == "NDVI":
-            ndvi_records = records[records["parameter"] == "NDVI"]
-            ndvi_chart = make_chart(ndvi_records, y_axis_label_ndvi, domain_pd, color_selection,
-                                    color_column, sort, ndvi_title,
-                                    stat_button)
-            display_chart("NDVI", records, ndvi_chart)
-
-    # close connection to db
-    db.close()
+    :param db_path: string with path to database file, Parquet export directory or directory/list of database files
+    :return: backends.SQLiteBackend/ParquetBackend/DuckDBBackend/ShardedBackend object, list with database table
+        names
+    """
+    from backends import open_backend
+    try:
+        database = open_backend(db_path, immutable=set_immutable_db(), parquet_engine=set_parquet_engine())
+        table_names = database.table_names()
+        return database, table_names
+    except (sqlite3.Error, OSError, ValueError, ImportError) as error:
+        connection_error = "Error while connecting to database:" + str(error)
+        st.error(connection_error)
+        return None, []
 
 
 # define function to get path to database from user, check if path is valid and deploy main app page
@@ -411,11 +178,18 @@ def db_path_query():
     First checks if permanent database path has been set in set_permanent_db_path().
     If yes, it checks if this path is valid and tries connecting to database with db_connect().
     If no, it queries path from user in the app and tries connection with the entered path.
-    Path validity is checked by checking path ending (must be ".db") and
-    table_names (which is empty if path is invalid).
+    Path validity is checked by checking path ending (must be ".db", or the path of a Parquet export directory
+    created with export_parquet.py, or a directory/";"-separated list of database files) and by checking that the
+    required tables exist (see missing_tables()).
     After connection with valid path is established, the main web app page/functionality
-    is deployed by executing main_part().
+    is deployed by executing app.main_part().
+    The stages of the app run are recorded with an instrumentation.Profiler object (see app.main_part()), the time
+    of the script run up to the path screen is logged separately (see log_script_time()).
     """
+    # set up structured log lines of the app stages and start recording the stages of this app run
+    setup_logging()
+    profiler = Profiler()
+
     # get permanent database path (or default string)
     permanent_db_path = set_permanent_db_path()
 
@@ -425,25 +199,39 @@ def db_path_query():
         st.set_page_config(layout="wide")
         text_input_container = st.empty()
         path = text_input_container.text_input("Please enter path to database (including file name): ")
-        if path != "" and path.endswith(".db") is False:
+
+        # log the time of the script run up to the path screen (first run of the session) and load the main page in
+        # the background while the user enters the path
+        log_script_time()
+        warm_up_page()
+
+        if path != "" and is_valid_path(path) is False:
             st.error("Entered path does not contain a valid database")
-        elif path.endswith(".db"):
-            database, table_names = db_connect(path)
-            if table_names.empty:
-                st.error("Entered path does not contain a valid database")
+        elif is_valid_path(path):
+            with profiler.stage("db_connect") as stage:
+                database, table_names = db_connect(path)
+                stage["tables"] = len(table_names)
+            if missing_tables(table_names):
+                st.error("Entered path does not contain a valid database (missing tables: {})".format(
+                    ", ".join(missing_tables(table_names))))
             else:
+                from app import main_part
                 text_input_container.empty()
-                main_part(database)
+                main_part(database, profiler)
 
     # if path has been set in script: check path validity and deploy main_part()
     else:
-        if permanent_db_path.endswith(".db"):
-            database, table_names = db_connect(permanent_db_path)
-            if table_names.empty:
-                st.error("Permanent database path does not contain a valid database")
+        if is_valid_path(permanent_db_path):
+            with profiler.stage("db_connect") as stage:
+                database, table_names = db_connect(permanent_db_path)
+                stage["tables"] = len(table_names)
+            if missing_tables(table_names):
+                st.error("Permanent database path does not contain a valid database (missing tables: {})".format(
+                    ", ".join(missing_tables(table_names))))
             else:
+                from app import main_part
                 st.set_page_config(layout="wide")
-                main_part(database)
+                main_part(database, profiler)
         else:
             st.error("Permanent database path does not contain a valid database")
 
@@ -0,0 +1,168 @@
+"""
+This script can be used to optimize a Radar Crop Monitor database for the queries of the web app.
+It can be run from the command line or from the app ("Database maintenance" in the sidebar).
+
+The optimization consists of:
+    - adding a year column to table "s1fieldstatistic" (generated column if supported by SQLite, else a
+      materialized column that is kept up to date by triggers), so the join with table "areaofinterest" does not
+      need strftime() on every row
+    - creating covering indexes that match the filter order of the main query of the app
+    - running ANALYZE, so the query planner can choose the indexes
+
+The query plan of the main query is printed before and after the optimization.
+
+Usage: python optimize_db.py <path_to_database> [--materialized] [--dry-run]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import sqlite3
+from queries import explain_query_plan, has_year_column, normalize_selection, records_sql
+
+# indexes created by the optimization (name, table, columns)
+# the index on s1fieldstatistic starts with the equality filters of the main query (aoi, statistic, joined year
+# and fid), followed by the IN filters and contains all selected columns, so the table itself is not read
+INDEXES = [("idx_s1fieldstatistic_filter", "s1fieldstatistic",
+            ["aoi", "statistic", "year", "mask_label", "polarization", "product", "acquisition", "datetime",
+             "value", "unit"]),
+           ("idx_areaofinterest_filter", "areaofinterest",
+            ["aoi", "year", "crop_type_code", "fid"]),
+           ("idx_croplegend_crop_type", "croplegend",
+            ["crop_type", "crop_type_code"])]
+
+
+# define function to get declared type of the year column in table "areaofinterest"
+def year_column_type(db):
+    """
+    The year column of table "s1fieldstatistic" gets the same type as the year column of table "areaofinterest",
+    so both sides of the join have the same type affinity.
+
+    :param db: sqlite3.Connection object with connection to database
+    :return: string with declared type (e.g. "INTEGER", may be empty)
+    """
+    for column in db.execute("PRAGMA table_info(areaofinterest);").fetchall():
+        if column[1] == "year":
+            return column[2]
+    return ""
+
+
+# define function to add the year column to table "s1fieldstatistic"
+def add_year_column(db, materialized=False):
+    """
+    Adds column "year" to table "s1fieldstatistic", if it does not exist yet.
+    A virtual generated column is used if SQLite supports it (version 3.31 or newer) and materialized is False.
+    Otherwise, a regular column is filled from column "datetime" and kept up to date with triggers.
+
+    :param db: sqlite3.Connection object with writable connection to database
+    :param materialized: if True, always use a regular column (readable by SQLite versions before 3.31)
+    :return: string describing the action taken
+    """
+    if has_year_column(db):
+        return "Column s1fieldstatistic.year already exists"
+
+    column_type = year_column_type(db)
+    if not materialized and sqlite3.sqlite_version_info >= (3, 31, 0):
+        db.execute("ALTER TABLE s1fieldstatistic ADD COLUMN year {} "
+                   "GENERATED ALWAYS AS (strftime('%Y', datetime)) VIRTUAL;".format(column_type))
+        return "Added generated column s1fieldstatistic.year"
+
+    db.execute("ALTER TABLE s1fieldstatistic ADD COLUMN year {};".format(column_type))
+    db.execute("UPDATE s1fieldstatistic SET year = strftime('%Y', datetime);")
+    for event in ("INSERT", "UPDATE OF datetime"):
+        trigger_name = "s1fieldstatistic_year_" + event.split()[0].lower()
+        db.execute("""CREATE TRIGGER IF NOT EXISTS {} AFTER {} ON s1fieldstatistic
+            BEGIN
+            UPDATE s1fieldstatistic SET year = strftime('%Y', NEW.datetime) WHERE rowid = NEW.rowid;
+            END;""".format(trigger_name, event))
+    return "Added materialized column s1fieldstatistic.year (kept up to date by triggers)"
+
+
+# define function to create the indexes used by the main query
+def create_indexes(db):
+    """
+    :param db: sqlite3.Connection object with writable connection to database
+    :return: list of strings describing the actions taken
+    """
+    actions = []
+    for name, table, columns in INDEXES:
+        db.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({});".format(name, table, ", ".join(columns)))
+        actions.append("Created index {} on {}({})".format(name, table, ", ".join(columns)))
+    return actions
+
+
+# define function to get the query plan of the main query of the app
+def explain_records_query(db):
+    """
+    Runs EXPLAIN QUERY PLAN for the main query of the app, with filter values taken from the database.
+
+    :param db: sqlite3.Connection object with connection to database
+    :return: string with query plan (one line per plan step, indented by depth)
+    """
+    area = db.execute("""SELECT area.aoi, area.year, crop.crop_type, area.fid FROM areaofinterest as area
+        INNER JOIN croplegend as crop ON (crop.crop_type_code = area.crop_type_code) LIMIT 1;""").fetchone()
+    s1 = db.execute("SELECT statistic, acquisition, product, polarization FROM s1fieldstatistic LIMIT 1;").fetchone()
+    if area is None or s1 is None:
+        return "(no data in database)"
+
+    aoi, year, crop_type, fid = area
+    statistic, acquisition, product, polarization = s1
+    selection = normalize_selection(aoi, year, crop_type, statistic, [acquisition], [product],
+                                    [polarization], [fid])
+    sql_body, params = records_sql(selection, year_column=has_year_column(db))
+    return explain_query_plan(db, sql_body, params)
+
+
+# define function to optimize database
+def optimize_database(db_path, materialized=False, dry_run=False):
+    """
+    Adds the year column and the indexes to the database, runs ANALYZE and gets the query plans of the main query
+    of the app before and after.
+
+    :param db_path: string with path to database file
+    :param materialized: if True, a regular instead of a generated year column is added (see add_year_column())
+    :param dry_run: if True, only the current query plan is returned and the database is not modified
+    :return: dictionary with query plans ("before", "after") and list of actions taken ("actions")
+    """
+    db = sqlite3.connect(db_path)
+    try:
+        result = {"before": explain_records_query(db), "after": None, "actions": []}
+        if dry_run:
+            return result
+        with db:
+            result["actions"].append(add_year_column(db, materialized))
+            result["actions"].extend(create_indexes(db))
+        db.execute("ANALYZE;")
+        result["actions"].append("Ran ANALYZE")
+        result["after"] = explain_records_query(db)
+        return result
+    finally:
+        db.close()
+
+
+# define function to run the optimization from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments, optimizes the database and prints the query plans.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description="Optimize a Radar Crop Monitor database for the web app.")
+    parser.add_argument("db_path", help="path to database file")
+    parser.add_argument("--materialized", action="store_true",
+                        help="add a regular instead of a generated year column (for SQLite versions before 3.31)")
+    parser.add_argument("--dry-run", action="store_true", help="only print the current query plan")
+    args = parser.parse_args(argv)
+
+    result = optimize_database(args.db_path, materialized=args.materialized, dry_run=args.dry_run)
+    print("Query plan before optimization:")
+    print(result["before"])
+    for action in result["actions"]:
+        print(action)
+    if result["after"] is not None:
+        print("Query plan after optimization:")
+        print(result["after"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+This module provides the background prefetch of the Radar Crop Monitor app.
+
+Users typically choose the main filters (AOI, year, crop type, statistic) first and then toggle the dependent
+filters (acquisition modes, products, parameters, FIDs) one at a time. As soon as the main filters are chosen, the
+records of all dependent filter values of this combination (the superset) are loaded in a background thread into
+the process-wide result cache (see query_cache.py). Selections of the dependent filters are then answered by
+filtering the superset in memory instead of querying the data source again.
+
+The number of background threads is bounded, prefetches that have not started yet are dropped when the session
+that requested them chooses other main filters (unless other sessions wait for them as well), and supersets whose
+memory (estimated from the record counts of the filter catalog) exceeds half of the memory limit of the result cache
+are not prefetched. The checks whether a superset is cached are not counted as hits or misses of the result cache,
+so each prefetched superset counts as one miss (when it is loaded).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from instrumentation import logger
+from queries import normalize_selection
+from query_cache import result_cache
+
+# number of background threads loading supersets
+PREFETCH_WORKERS = 2
+
+# estimated memory of one record in the typed schema of the loaded records (see loader.py), in bytes
+RECORD_BYTES = 40
+
+# maximum share of the memory limit of the result cache that a prefetched superset may use (estimated)
+MAX_CACHE_SHARE = 0.5
+
+
+# define function to get the superset of a filter selection
+def superset_selection(selection, dependent_values, parameters):
+    """
+    :param selection: queries.FilterSelection object
+    :param dependent_values: dictionary with lists of "fid", "product" and "acquisition" values of the main filter
+        combination (see catalog.FilterCatalog.dependent_values())
+    :param parameters: list with all parameters
+    :return: queries.FilterSelection object with the main filters of selection and all dependent filter values
+    """
+    return normalize_selection(selection.aoi, selection.year, selection.crop_type, selection.statistic,
+                               dependent_values["acquisition"], dependent_values["product"], parameters,
+                               dependent_values["fid"])
+
+
+# define function to filter the records of a superset to a selection
+def filter_records(records, selection):
+    """
+    :param records: typed dataframe with records of the superset of selection
+    :param selection: queries.FilterSelection object
+    :return: typed dataframe with the records of selection (same rows, order and columns as the query result)
+    """
+    mask = (records["acquisition"].isin(selection.acquisition) & records["product"].isin(selection.product)
+            & records["parameter"].isin(selection.parameter) & records["fid"].isin(selection.fid))
+    subset = records[mask].reset_index(drop=True)
+    for column in subset.columns:
+        if isinstance(subset[column].dtype, pd.CategoricalDtype):
+            subset[column] = subset[column].cat.remove_unused_categories()
+    return subset
+
+
+# define class for the background prefetch of supersets
+class Prefetcher:
+    """
+    Loads the supersets of filter selections in a bounded thread pool into the result cache.
+
+    :param max_workers: number of background threads
+    :param max_bytes: maximum estimated memory of a prefetched superset (None: MAX_CACHE_SHARE of the memory limit
+        of the process-wide result cache)
+    """
+
+    def __init__(self, max_workers=PREFETCH_WORKERS, max_bytes=None):
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rcm-prefetch")
+        self._futures = {}
+        # sessions waiting for each pending superset and the superset last requested by each session
+        self._requesters = {}
+        self._session_keys = {}
+        # supersets that are not prefetched because of their estimated memory (each is counted once)
+        self._too_large = set()
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "dropped": 0, "too_large": 0, "failed": 0, "answered": 0}
+
+    def _load(self, backend, superset):
+        try:
+            backend.load_records(superset)
+        except Exception as error:
+            with self._lock:
+                self._counters["failed"] += 1
+            logger.warning(json.dumps({"stage": "prefetch", "error": str(error)}))
+
+    def prefetch(self, backend, superset, session=None, rows=None):
+        """
+        Starts loading a superset in the background, unless it is cached, already being loaded or too large.
+        The prefetch previously requested by the same session is dropped if it has not started yet and no other
+        session has requested it as well.
+
+        :param backend: data backend (see backends.py)
+        :param superset: queries.FilterSelection object with superset (see superset_selection())
+        :param session: hashable id of the app session (e.g. stored in st.session_state), None if the prefetch
+            does not belong to a session (it is then never dropped)
+        :param rows: number of records of the superset (see catalog.FilterCatalog.row_count()), None if unknown
+        """
+        if not superset.fid:
+            return
+        key = (backend.key, superset)
+        if not self.fits(rows):
+            with self._lock:
+                if key not in self._too_large:
+                    self._too_large.add(key)
+                    self._counters["too_large"] += 1
+            return
+        if backend.cached_records(superset, count=False) is not None:
+            return
+        with self._lock:
+            for other_key, future in list(self._futures.items()):
+                if future.done():
+                    self._forget(other_key)
+            previous_key = self._session_keys.get(session) if session is not None else None
+            if previous_key is not None and previous_key != key and previous_key in self._futures:
+                # the user has chosen other main filters before this prefetch started
+                requesters = self._requesters[previous_key]
+                requesters.discard(session)
+                if not requesters and self._futures[previous_key].cancel():
+                    self._counters["dropped"] += 1
+                    self._forget(previous_key)
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self._load, backend, superset)
+                self._requesters[key] = set()
+                self._counters["submitted"] += 1
+            if session is not None:
+                self._requesters[key].add(session)
+                self._session_keys[session] = key
+
+    def fits(self, rows):
+        """
+        :param rows: number of records of a superset (see catalog.FilterCatalog.row_count()), None if unknown
+        :return: True if the estimated memory of the superset is within the limit of prefetched supersets (or its
+            number of records is unknown), else False
+        """
+        max_bytes = self.max_bytes if self.max_bytes is not None else result_cache.max_bytes * MAX_CACHE_SHARE
+        return rows is None or rows * RECORD_BYTES <= max_bytes
+
+    def load(self, backend, superset):
+        """
+        Returns the records of a superset, e.g. when they are needed at once (the peers of the anomalies, see
+        derived.py). A running prefetch of the superset is waited for, a prefetch that has not started yet is
+        dropped and the superset is loaded in the calling thread instead.
+
+        :param backend: data backend (see backends.py)
+        :param superset: queries.FilterSelection object with superset (see superset_selection())
+        :return: typed dataframe with records of superset
+        """
+        key = (backend.key, superset)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and future.cancel():
+                self._counters["dropped"] += 1
+                self._forget(key)
+                future = None
+        if future is not None:
+            future.result()
+        records = backend.cached_records(superset, count=False)
+        return records if records is not None else backend.load_records(superset)
+
+    def _forget(self, key):
+        # remove a finished or dropped prefetch and the sessions waiting for it (lock must be held)
+        del self._futures[key]
+        for session in self._requesters.pop(key, ()):
+            if self._session_keys.get(session) == key:
+                del self._session_keys[session]
+
+    def lookup(self, backend, superset, selection):
+        """
+        Answers a selection from its cached superset (does not wait for a superset that is being loaded). Rows that
+        have been appended to the database since the superset was loaded are merged into it first
+        (see query_cache.cached_records()). The lookup is counted as "answered" by the prefetcher instead of as hit
+        or miss of the result cache.
+
+        :param backend: data backend (see backends.py)
+        :param superset: queries.FilterSelection object with superset of selection
+        :param selection: queries.FilterSelection object
+        :return: typed dataframe with records of selection, None if the superset is not cached
+        """
+        records = backend.cached_records(superset, count=False)
+        if records is None:
+            return None
+        with self._lock:
+            self._counters["answered"] += 1
+        return filter_records(records, selection)
+
+    def stats(self):
+        """
+        :return: dictionary with number of running/pending prefetches and usage counters
+        """
+        with self._lock:
+            stats = {"workers": self.max_workers,
+                     "in_flight": sum(not future.done() for future in self._futures.values())}
+            stats.update(self._counters)
+        return stats
+
+
+# process-wide prefetcher, shared across app sessions
+prefetcher = Prefetcher()
@@ -0,0 +1,221 @@
+"""
+This module contains the SQL queries of the Radar Crop Monitor app, so that they can be shared by the app
+and by the database tools (e.g. optimize_db.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+from collections import namedtuple
+
+# main and dependent filter selections of the app
+# (single values for aoi, year, crop_type and statistic, sorted tuples of unique values for the multiselections)
+FilterSelection = namedtuple("FilterSelection", ["aoi", "year", "crop_type", "statistic",
+                                                 "acquisition", "product", "parameter", "fid"])
+
+
+# define function to normalize the filter selections of the app
+def normalize_selection(aoi_selection, year_selection, crop_selection, stat_selection,
+                        acq_selection, product_selection, param_selection, fid_selection):
+    """
+    Converts the filter selections to a FilterSelection object. The multiselections are converted to sorted tuples
+    of unique values, so the same selection in a different order leads to the same (hashable) object.
+
+    :param aoi_selection: string with selected AOI (abbreviation)
+    :param year_selection: selected year
+    :param crop_selection: string with selected crop type
+    :param stat_selection: string with selected statistic
+    :param acq_selection: iterable with selected acquisition modes (abbreviations)
+    :param product_selection: iterable with selected products
+    :param param_selection: iterable with selected parameters
+    :param fid_selection: iterable with selected FIDs
+    :return: FilterSelection object
+    """
+    def sorted_tuple(values):
+        return tuple(sorted(set(values), key=str))
+
+    return FilterSelection(aoi_selection, year_selection, crop_selection, stat_selection,
+                           sorted_tuple(acq_selection), sorted_tuple(product_selection),
+                           sorted_tuple(param_selection), sorted_tuple(fid_selection))
+
+
+# define function to check if table "s1fieldstatistic" has a (generated or materialized) year column
+def has_year_column(db):
+    """
+    Checks if column "year" has been added to table "s1fieldstatistic" by optimize_db.py.
+    "PRAGMA table_xinfo" is used because "PRAGMA table_info" does not list generated columns.
+
+    :param db: sqlite3.Connection object with connection to database
+    :return: True if column exists, else False
+    """
+    columns = db.execute("PRAGMA table_xinfo(s1fieldstatistic);").fetchall()
+    # unknown pragmas are ignored by SQLite versions before 3.26 (which cannot have generated columns)
+    if not columns:
+        columns = db.execute("PRAGMA table_info(s1fieldstatistic);").fetchall()
+    return any(column[1] == "year" for column in columns)
+
+
+# define function to get the expression for the year of an observation in table "s1fieldstatistic"
+def year_expression(year_column):
+    """
+    :param year_column: True if table "s1fieldstatistic" has an (indexed) year column
+    :return: string with SQL expression (indexed column or strftime() call on datetime)
+    """
+    if year_column:
+        return "s1.year"
+    return "strftime('%Y', s1.datetime)"
+
+
+# define function to build a list of "?" parameters for an IN filter
+def in_list(values):
+    """
+    :param values: tuple with filter values
+    :return: string with one "?" per value in parentheses (an empty list is valid in SQLite and matches no rows)
+    """
+    return "(" + ", ".join("?" * len(values)) + ")"
+
+
+# define function to build the filter of a rowid range of table "s1fieldstatistic"
+def rowid_filter(min_rowid=None, max_rowid=None, table="s1."):
+    """
+    :param min_rowid: if not None, only rows with a larger rowid are selected
+    :param max_rowid: if not None, only rows up to this rowid are selected
+    :param table: prefix of the rowid column (alias of table "s1fieldstatistic" in the query)
+    :return: string with SQL conditions (each starting with " AND "), list with query parameters
+    """
+    conditions = []
+    params = []
+    if min_rowid is not None:
+        conditions.append(" AND {}rowid > ?".format(table))
+        params.append(min_rowid)
+    if max_rowid is not None:
+        conditions.append(" AND {}rowid <= ?".format(table))
+        params.append(max_rowid)
+    return "".join(conditions), params
+
+
+# define function to build the select and join part of the main query
+def records_select_sql(year_column=False, extra_columns=()):
+    """
+    Builds the SELECT ... FROM ... JOIN part of the main query, which joins table "s1fieldstatistic" with tables
+    "areaofinterest" and "croplegend". The WHERE clause is added by the callers.
+
+    :param year_column: True if table "s1fieldstatistic" has an (indexed) year column, see has_year_column()
+    :param extra_columns: iterable with additional column expressions to select (e.g. "s1.statistic")
+    :return: string with SQL
+    """
+    extra = "".join(",\n        " + column for column in extra_columns)
+    return f"""SELECT
+        round(s1.value, 2) as value,
+        s1.mask_label,
+        s1.unit,
+        s1.aoi,
+        s1.datetime,
+        s1.polarization as parameter,
+        s1.acquisition,
+        s1.product,
+        area.fid,
+        area.year,
+        area.sl_nr,
+        area.crop_type_code,
+        area.crop_type{extra}
+        FROM s1fieldstatistic as s1
+        INNER JOIN (SELECT
+        areaofinterest.fid,
+        areaofinterest.year,
+        areaofinterest.aoi,
+        areaofinterest.sl_nr,
+        areaofinterest.crop_type_code,
+        crop.crop_type
+        FROM areaofinterest
+        INNER JOIN croplegend as crop
+        ON (crop.crop_type_code = areaofinterest.crop_type_code)) area
+        ON (s1.mask_label = area.fid AND {year_expression(year_column)}=area.year AND s1.aoi = area.aoi)"""
+
+
+# define function to build the main query of the app
+def records_sql(selection, year_column=False, min_rowid=None, max_rowid=None):
+    """
+    Builds the parameterized SQL query that joins table "s1fieldstatistic" with tables "areaofinterest"
+    and "croplegend" and filters it by the main and dependent filter selections.
+    The filter values are passed as parameters, so the statement text only depends on the number of selected values
+    and prepared statements are reused by sqlite3's statement cache.
+
+    :param selection: FilterSelection object with main and dependent filter selections
+    :param year_column: True if table "s1fieldstatistic" has an (indexed) year column, see has_year_column()
+    :param min_rowid: if not None, only rows of table "s1fieldstatistic" with a larger rowid are selected
+    :param max_rowid: if not None, only rows of table "s1fieldstatistic" up to this rowid are selected
+    :return: string with SQL query, list with query parameters
+    """
+    rowid_sql, rowid_params = rowid_filter(min_rowid, max_rowid)
+    sql_body = records_select_sql(year_column) + f"""
+        WHERE
+        s1.aoi = ?
+        AND area.crop_type = ?
+        AND area.year = ?
+        AND s1.product IN {in_list(selection.product)}
+        AND s1.acquisition IN {in_list(selection.acquisition)}
+        AND s1.polarization IN {in_list(selection.parameter)}
+        AND area.fid IN {in_list(selection.fid)}
+        AND s1.statistic = ?{rowid_sql}
+        ORDER BY s1.mask_label, s1.datetime  ASC; """
+    params = ([selection.aoi, selection.crop_type, selection.year] + list(selection.product)
+              + list(selection.acquisition) + list(selection.parameter) + list(selection.fid)
+              + [selection.statistic] + rowid_params)
+    return sql_body, params
+
+
+# define function to build the query of all records of an AOI/year
+def partition_sql(year_column=False):
+    """
+    Builds the parameterized SQL query for all records of an AOI, year and statistic (parameters: aoi, year and
+    statistic), e.g. to split them in memory instead of querying each filter combination.
+
+    :param year_column: True if table "s1fieldstatistic" has an (indexed) year column, see has_year_column()
+    :return: string with SQL query
+    """
+    return records_select_sql(year_column) + """
+        WHERE s1.aoi = ? AND area.year = ? AND s1.statistic = ?
+        ORDER BY s1.mask_label, s1.datetime ASC;"""
+
+
+# define function to build the query of the records summarized in the summary tables
+def summary_source_sql(year_column=False):
+    """
+    Builds the parameterized SQL query for the records of an AOI, year and statistic from a date on (parameters:
+    aoi, year, statistic and first date as "YYYY-MM-DD" string), see summaries.py.
+
+    :param year_column: True if table "s1fieldstatistic" has an (indexed) year column, see has_year_column()
+    :return: string with SQL query
+    """
+    return records_select_sql(year_column) + """
+        WHERE s1.aoi = ? AND area.year = ? AND s1.statistic = ? AND s1.datetime >= ?;"""
+
+
+# define function to build the query of the field geometries
+def geometries_sql(fids):
+    """
+    Builds the parameterized SQL query for the geometries of fields (parameters: aoi, year and the FIDs).
+    Geometries are not part of the main query, since they do not change over time.
+
+    :param fids: tuple with FIDs
+    :return: string with SQL query
+    """
+    return f"SELECT fid, field_geom FROM areaofinterest WHERE aoi = ? AND year = ? AND fid IN {in_list(fids)};"
+
+
+# define function to get the query plan of a query
+def explain_query_plan(db, sql_body, params=()):
+    """
+    :param db: sqlite3.Connection object with connection to database
+    :param sql_body: string with SQL query
+    :param params: list with query parameters
+    :return: string with query plan (one line per plan step, indented by depth)
+    """
+    # each plan row contains id, parent id, unused column and description of the plan step
+    plan = db.execute("EXPLAIN QUERY PLAN " + sql_body, params).fetchall()
+    depth = {0: -1}
+    lines = []
+    for step_id, parent_id, _, detail in plan:
+        depth[step_id] = depth.get(parent_id, -1) + 1
+        lines.append("  " * depth[step_id] + detail)
+    return "\n".join(lines)
@@ -0,0 +1,212 @@
+"""
+This module provides a process-wide cache for the results of the main query of the Radar Crop Monitor app.
+
+Results are cached per database and normalized filter selection (see queries.FilterSelection), so changing
+only the date range, the trendline or the data point coloring in the app does not query the database again.
+The least recently used results are evicted when the total memory of the cached dataframes exceeds a limit.
+Results of SQLite databases are stored with the maximum rowid they contain (watermark): when acquisitions have been
+appended to the database, only the new rows of a cached result are queried and merged into it (see deltas.py).
+All results of a database are dropped when rows have been deleted or changed.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import threading
+from collections import OrderedDict
+from deltas import get_tracker
+from loader import load_typed, merge_records
+from queries import has_year_column, records_sql
+
+# default memory limit of the result cache (in bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+# define class for a memory-bounded LRU cache of dataframes
+class ResultCache:
+    """
+    Thread-safe least-recently-used cache of dataframes, bounded by the total memory of the cached dataframes.
+
+    :param max_bytes: maximum total memory of cached dataframes (dataframes larger than this are not cached)
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "delta_updates": 0}
+
+    def _remove(self, key):
+        frame, nbytes, watermark = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def _check_version(self, db_path, version):
+        # drop all results of a database if it has changed since they were cached
+        if self._versions.get(db_path) != version:
+            stale_keys = [key for key in self._entries if key[0] == db_path]
+            for key in stale_keys:
+                self._remove(key)
+            if stale_keys:
+                self._counters["invalidations"] += 1
+            self._versions[db_path] = version
+
+    def get_entry(self, db_path, selection, version, copy=True, count=True):
+        """
+        :param db_path: string with path to database file
+        :param selection: queries.FilterSelection object
+        :param version: version token of database (see db_pool.ConnectionPool.version(), or the epoch of
+            deltas.DeltaTracker.current() for results with watermark)
+        :param copy: if False, the cached dataframe itself is returned (it must not be modified by the caller)
+        :param count: if False, the lookup is not counted as hit or miss (e.g. checks of the prefetcher whether a
+            superset is cached, which are repeated on every app run)
+        :return: tuple with copy of cached dataframe and its watermark, or None if no valid result is cached
+        """
+        key = (db_path, selection)
+        with self._lock:
+            self._check_version(db_path, version)
+            if key not in self._entries:
+                if count:
+                    self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self._counters["hits"] += 1
+            frame, nbytes, watermark = self._entries[key]
+        # callers modify the returned dataframe, so the cached one is copied
+        return frame.copy() if copy else frame, watermark
+
+    def get(self, db_path, selection, version, copy=True, count=True):
+        """
+        :return: copy of cached dataframe, or None if no valid result is cached (see get_entry())
+        """
+        entry = self.get_entry(db_path, selection, version, copy, count)
+        return entry[0] if entry is not None else None
+
+    def set_watermark(self, db_path, selection, watermark):
+        """
+        Raises the watermark of a cached result (after the rows appended up to the new watermark have been found
+        not to belong to the result).
+
+        :param db_path: string with path to database file
+        :param selection: queries.FilterSelection object
+        :param watermark: new watermark
+        """
+        key = (db_path, selection)
+        with self._lock:
+            if key in self._entries and self._entries[key][2] < watermark:
+                frame, nbytes, _ = self._entries[key]
+                self._entries[key] = (frame, nbytes, watermark)
+
+    def put(self, db_path, selection, version, frame, watermark=None):
+        """
+        Caches a dataframe and evicts the least recently used dataframes until the memory limit is met.
+
+        :param db_path: string with path to database file
+        :param selection: queries.FilterSelection object
+        :param version: version token of database the dataframe was queried from
+        :param frame: dataframe with query result
+        :param watermark: maximum rowid of table "s1fieldstatistic" the query result contains, or None
+        """
+        nbytes = int(frame.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        key = (db_path, selection)
+        with self._lock:
+            self._check_version(db_path, version)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (frame.copy(), nbytes, watermark)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def count(self, counter):
+        """
+        :param counter: name of usage counter that is incremented (e.g. "delta_updates")
+        """
+        with self._lock:
+            self._counters[counter] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: dictionary with number of entries, memory usage and hit/miss counters of the cache
+        """
+        with self._lock:
+            stats = {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+            stats.update(self._counters)
+        return stats
+
+
+# process-wide result cache, shared across app sessions
+result_cache = ResultCache()
+
+
+# define function to get the cached records of a filter selection, updated with the appended rows
+def cached_records(pool, selection, cache=result_cache, copy=True, timings=None, count=True):
+    """
+    Returns the cached result of the main query for a filter selection. If rows of the AOI and year of the selection
+    have been appended to the database since the result was cached, only the rows above the watermark of the result
+    are queried and merged into it (and the updated result is cached).
+
+    :param pool: db_pool.ConnectionPool object of database
+    :param selection: queries.FilterSelection object with main and dependent filter selections
+    :param cache: ResultCache object (default: process-wide cache)
+    :param copy: if False, the cached dataframe itself is returned (it must not be modified by the caller)
+    :param timings: dictionary to which the number of queried new rows ("delta_rows") is added, or None
+    :param count: if False, the lookup is not counted as cache hit or miss (see ResultCache.get_entry())
+    :return: typed dataframe with query result, or None if the result of the selection is not cached
+    """
+    tracker = get_tracker(pool)
+    epoch, max_rowid = tracker.current()
+    entry = cache.get_entry(pool.db_path, selection, epoch, copy=False, count=count)
+    if entry is None:
+        return None
+    records, watermark = entry
+    if watermark is not None and watermark < max_rowid:
+        if tracker.has_new_rows(selection.aoi, selection.year, watermark):
+            with pool.connection() as db:
+                sql_body, params = records_sql(selection, year_column=has_year_column(db), min_rowid=watermark,
+                                               max_rowid=max_rowid)
+                new_records = load_typed(db, sql_body, params)
+            records = merge_records([records, new_records], list(records.columns))
+            cache.put(pool.db_path, selection, epoch, records, max_rowid)
+            cache.count("delta_updates")
+            if timings is not None:
+                timings["delta_rows"] = len(new_records)
+        else:
+            cache.set_watermark(pool.db_path, selection, max_rowid)
+    return records.copy() if copy else records
+
+
+# define function to load the records of a filter selection (from cache or database)
+def load_records(pool, selection, cache=result_cache, timings=None):
+    """
+    Returns the result of the main query for a filter selection. The result is taken from the cache if the same
+    (normalized) selection has been queried before and no rows have been deleted or changed since (appended rows
+    are merged into the cached result, see cached_records()).
+
+    :param pool: db_pool.ConnectionPool object of database
+    :param selection: queries.FilterSelection object with main and dependent filter selections
+    :param cache: ResultCache object (default: process-wide cache)
+    :param timings: dictionary to which "cached" (True if the result was taken from the cache) and the timings of
+        the query are added (see loader.load_typed()), or None
+    :return: typed dataframe with query result (see loader.py)
+    """
+    records = cached_records(pool, selection, cache, timings=timings)
+    if timings is not None:
+        timings["cached"] = records is not None
+    if records is None:
+        epoch, max_rowid = get_tracker(pool).current()
+        with pool.connection() as db:
+            sql_body, params = records_sql(selection, year_column=has_year_column(db), max_rowid=max_rowid)
+            records = load_typed(db, sql_body, params, timings=timings)
+        cache.put(pool.db_path, selection, epoch, records, max_rowid)
+    return records
@@ -0,0 +1,187 @@
+"""
+This module provides the streaming load of the main query of the Radar Crop Monitor app.
+
+The query runs in a background thread and its result is read from the cursor in chunks, which are typed
+(see loader.py) and handed to the app one by one, so the app can show the progress and update the charts while the
+query is still running. Only a few chunks wait for the app at a time (the query pauses until the app has taken
+them), so the memory of the raw query rows is bounded by the chunk size until the typed chunks are concatenated.
+
+A running query can be cancelled, e.g. when the user changes the filters: the query is aborted with the interrupt
+of its SQLite connection, and the connection is returned to the pool. Complete results are put into the
+process-wide result cache (see query_cache.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import queue
+import sqlite3
+import threading
+import time
+import pandas as pd
+from deltas import get_tracker
+from loader import concat_typed, typed_records
+from queries import has_year_column, records_sql
+from query_cache import cached_records, result_cache
+
+# number of rows that are fetched from the cursor and typed at once (smaller than loader.CHUNK_SIZE, so the first
+# chunk arrives early)
+STREAM_CHUNK_SIZE = 20000
+
+# number of typed chunks that may wait for the app before the query pauses
+QUEUE_SIZE = 2
+
+# seconds chunks() waits for a chunk before it yields None (so the app can update while the query runs)
+POLL_SECONDS = 0.2
+
+# marker for the end of the stream
+_DONE = object()
+
+
+# define class for a streamed query of the records of a filter selection
+class StreamingQuery:
+    """
+    Loads the records of a filter selection chunk by chunk in a background thread.
+    The chunks are read with chunks(), the complete result is available in attribute "records" afterwards.
+
+    :param pool: db_pool.ConnectionPool object of database
+    :param selection: queries.FilterSelection object with main and dependent filter selections
+    :param chunk_size: number of rows fetched and typed at once
+    :param cache: query_cache.ResultCache object (default: process-wide cache)
+    """
+
+    def __init__(self, pool, selection, chunk_size=STREAM_CHUNK_SIZE, cache=result_cache):
+        self.pool = pool
+        self.selection = selection
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.cached = False
+        self.cancelled = False
+        self.records = None
+        self.rows = 0
+        self.columns = None
+        self.query_seconds = 0
+        self._fids = set()
+        self._chunks = []
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._cancel = threading.Event()
+        self._connection = None
+        self._connection_lock = threading.Lock()
+        self._epoch = None
+        self._watermark = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the query in a background thread. If the result of the selection is cached, no query is run and
+        chunks() yields the cached result (updated with the appended rows, see query_cache.cached_records()) as one
+        chunk.
+
+        :return: self
+        """
+        self._epoch, self._watermark = get_tracker(self.pool).current()
+        records = cached_records(self.pool, self.selection, self.cache)
+        if records is not None:
+            self.cached = True
+            self.columns = list(records.columns)
+            self._queue.put(records)
+            self._queue.put(_DONE)
+        else:
+            self._thread = threading.Thread(target=self._run, name="rcm-streaming-query", daemon=True)
+            self._thread.start()
+        return self
+
+    def _put(self, item):
+        # wait until the app has taken a chunk, unless the query has been cancelled
+        while not self._cancel.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            with self.pool.connection() as db:
+                with self._connection_lock:
+                    if self._cancel.is_set():
+                        return
+                    self._connection = db
+                try:
+                    sql_body, params = records_sql(self.selection, year_column=has_year_column(db),
+                                                   max_rowid=self._watermark)
+                    cursor = db.execute(sql_body, params)
+                    self.columns = [description[0] for description in cursor.description]
+                    while not self._cancel.is_set():
+                        rows = cursor.fetchmany(self.chunk_size)
+                        if not rows:
+                            break
+                        self._put(typed_records(pd.DataFrame.from_records(rows, columns=self.columns)))
+                    cursor.close()
+                finally:
+                    # the connection must not be interrupted any more once it is back in the pool
+                    with self._connection_lock:
+                        self._connection = None
+        except sqlite3.OperationalError as error:
+            # an interrupted query raises "interrupted", which is expected after cancel()
+            if not self._cancel.is_set():
+                self._put(error)
+        except Exception as error:
+            self._put(error)
+        finally:
+            self.query_seconds = round(time.perf_counter() - start, 6)
+            self._put(_DONE)
+
+    def chunks(self, poll_seconds=POLL_SECONDS):
+        """
+        Yields the typed chunks of the result as they arrive. While no chunk is available, None is yielded every
+        poll_seconds. When the stream has ended, the concatenated result is stored in attribute "records" and
+        put into the result cache (if the query has not been cancelled).
+
+        :param poll_seconds: seconds to wait for a chunk before None is yielded
+        :return: generator of typed dataframes (or None)
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=poll_seconds)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            self.rows += len(item)
+            if "fid" in item.columns:
+                self._fids.update(item["fid"].unique())
+            self._chunks.append(item)
+            yield item
+        self.records = concat_typed(self._chunks, self.columns)
+        self._chunks = []
+        if not self.cached and not self.cancelled:
+            self.cache.put(self.pool.db_path, self.selection, self._epoch, self.records, self._watermark)
+
+    def progress(self):
+        """
+        Estimates the progress from the FIDs that have been loaded (the records are ordered by FID).
+
+        :return: fraction of the selected FIDs that have been loaded completely (1.0 after the stream has ended)
+        """
+        if self.records is not None:
+            return 1.0
+        if not self.selection.fid:
+            return 0.0
+        return min(max(len(self._fids) - 1, 0) / len(self.selection.fid), 1.0)
+
+    def cancel(self):
+        """
+        Cancels the query: a running SQLite statement is interrupted and the background thread ends without
+        putting the result into the cache. Does nothing if the stream has already ended.
+        """
+        if self.records is not None:
+            return
+        self.cancelled = True
+        self._cancel.set()
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.interrupt()
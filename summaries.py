@@ -0,0 +1,179 @@
+"""
+This script can be used to build the summary tables of the crop overview of the Radar Crop Monitor app.
+It can be run from the command line or from the app ("Database maintenance" in the sidebar).
+
+For every AOI, year, crop type, statistic, parameter, acquisition mode, product and date, table "crop_summary"
+contains the number of fields and the mean, median and percentiles (10 %, 25 %, 75 %, 90 %) of the values of all
+fields of the crop type. The table is stored in a side database next to the project database
+(<database>.summary.sqlite), so the project database is only read. The overview mode of the app reads the table
+by its primary key, which takes milliseconds instead of aggregating the observations of all fields.
+
+The summary table is refreshed incrementally: per AOI and year, only the dates from the last summarized date on are
+recomputed (including the last date, whose observations may have been ingested partly). A full rebuild (--full) is
+needed after observations of earlier dates, fields or crop types have been changed.
+
+Usage: python summaries.py <path_to_database> [--summary-db PATH] [--full]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import os
+import sqlite3
+import time
+import pandas as pd
+from db_pool import read_only_uri
+from loader import load_typed
+from queries import has_year_column, in_list, summary_source_sql
+
+# file name suffix of the summary database (replaces the extension of the project database, and does not end with
+# ".db", so summary databases are not taken for shards of an archive)
+SUMMARY_SUFFIX = ".summary.sqlite"
+
+# percentiles of the summary table (column name, quantile)
+PERCENTILES = {"p10": 0.1, "p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+# columns of table "crop_summary"
+SUMMARY_COLUMNS = ["aoi", "year", "crop_type", "statistic", "parameter", "acquisition", "product", "date",
+                   "fields", "mean", "p10", "p25", "median", "p75", "p90"]
+
+# SQL statements of the schema of the summary database
+# (year has no declared type, so it keeps the type of column "year" of table "areaofinterest")
+SUMMARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crop_summary (aoi TEXT, year, crop_type TEXT, statistic TEXT, parameter TEXT,
+                                         acquisition TEXT, product TEXT, date TEXT, fields INTEGER, mean REAL,
+                                         p10 REAL, p25 REAL, median REAL, p75 REAL, p90 REAL,
+                                         PRIMARY KEY (aoi, year, crop_type, statistic, parameter, acquisition,
+                                                      product, date)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summary_state (aoi TEXT, year, last_date TEXT, refreshed TEXT, PRIMARY KEY (aoi, year));
+"""
+
+
+# define function to get the path of the summary database of a database
+def summary_path(db_path):
+    """
+    :param db_path: string with path to database file
+    :return: string with path to summary database file
+    """
+    return os.path.splitext(os.path.abspath(db_path))[0] + SUMMARY_SUFFIX
+
+
+# define function to summarize the records of an AOI, year and statistic
+def summarize_records(records):
+    """
+    :param records: typed dataframe with records (see loader.py)
+    :return: dataframe with number of fields, mean and percentiles of the values per crop type, parameter,
+        acquisition mode, product and date
+    """
+    keys = ["crop_type", "parameter", "acquisition", "product", "date"]
+    groups = records.groupby(keys, observed=True)
+    values = groups["value"]
+    summary = pd.DataFrame({"fields": groups["fid"].nunique(), "mean": values.mean()})
+    for column, quantile in PERCENTILES.items():
+        summary[column] = values.quantile(quantile)
+    return summary.astype({column: "float64" for column in ["mean"] + list(PERCENTILES)}).round(4).reset_index()
+
+
+# define function to refresh the summary tables
+def refresh_summaries(db_path, summary_db_path=None, full=False):
+    """
+    Summarizes the records of the dates that have been added since the last refresh (per AOI and year) and writes
+    them to the summary database (which is created if it does not exist).
+
+    :param db_path: string with path to database file (opened read-only)
+    :param summary_db_path: string with path to summary database file (default: see summary_path())
+    :param full: if True, the summary tables are rebuilt completely
+    :return: dictionary with path of summary database, refreshed AOI/year combinations, number of written rows and
+        seconds
+    """
+    start = time.perf_counter()
+    summary_db_path = summary_db_path or summary_path(db_path)
+    source = sqlite3.connect(read_only_uri(db_path), uri=True)
+    summary_db = sqlite3.connect(summary_db_path)
+    result = {"summary_db": summary_db_path, "refreshed": [], "rows": 0}
+    try:
+        summary_db.executescript(SUMMARY_SCHEMA)
+        if full:
+            with summary_db:
+                summary_db.execute("DELETE FROM crop_summary;")
+                summary_db.execute("DELETE FROM summary_state;")
+        state = {(aoi, year): last_date for aoi, year, last_date
+                 in summary_db.execute("SELECT aoi, year, last_date FROM summary_state;")}
+
+        sql_body = summary_source_sql(has_year_column(source))
+        pairs = source.execute("SELECT DISTINCT aoi, year FROM areaofinterest ORDER BY aoi, year;").fetchall()
+        statistics = [row[0] for row in source.execute("SELECT DISTINCT statistic FROM s1fieldstatistic;")]
+        for aoi, year in pairs:
+            # recompute the dates from the last summarized date on (all dates if the AOI/year is new)
+            first_date = state.get((aoi, year)) or ""
+            summaries = []
+            for statistic in statistics:
+                records = load_typed(source, sql_body, [aoi, year, statistic, first_date])
+                if not records.empty:
+                    summaries.append(summarize_records(records).assign(aoi=aoi, year=year, statistic=statistic))
+            if not summaries:
+                continue
+
+            summary = pd.concat(summaries, ignore_index=True)
+            summary["date"] = summary["date"].dt.strftime("%Y-%m-%d")
+            rows = list(zip(*(summary[column].tolist() for column in SUMMARY_COLUMNS)))
+            with summary_db:
+                summary_db.execute("DELETE FROM crop_summary WHERE aoi = ? AND year = ? AND date >= ?;",
+                                   [aoi, year, first_date])
+                summary_db.executemany("INSERT INTO crop_summary VALUES ({});".format(
+                    ", ".join("?" * len(SUMMARY_COLUMNS))), rows)
+                summary_db.execute("INSERT OR REPLACE INTO summary_state VALUES (?, ?, ?, ?);",
+                                   [aoi, year, summary["date"].max(), time.strftime("%Y-%m-%d %H:%M:%S")])
+            result["refreshed"].append((aoi, year))
+            result["rows"] += len(rows)
+    finally:
+        source.close()
+        summary_db.close()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# define function to load the crop overview of a filter selection from the summary table
+def load_overview(db, selection):
+    """
+    :param db: sqlite3.Connection object with connection to summary database
+    :param selection: queries.FilterSelection object (the FID selection is not used)
+    :return: dataframe with columns "date" (datetime64), "parameter", "acquisition", "product", "fields", "mean"
+        and the percentile columns, ordered by parameter, acquisition mode, product and date
+    """
+    sql_body = f"""SELECT date, parameter, acquisition, product, fields, mean, p10, p25, median, p75, p90
+        FROM crop_summary
+        WHERE aoi = ? AND year = ? AND crop_type = ? AND statistic = ?
+        AND parameter IN {in_list(selection.parameter)}
+        AND acquisition IN {in_list(selection.acquisition)}
+        AND product IN {in_list(selection.product)}
+        ORDER BY parameter, acquisition, product, date;"""
+    params = ([selection.aoi, selection.year, selection.crop_type, selection.statistic] + list(selection.parameter)
+              + list(selection.acquisition) + list(selection.product))
+    overview = pd.read_sql_query(sql_body, db, params=params)
+    overview["date"] = pd.to_datetime(overview["date"])
+    return overview
+
+
+# define function to run the refresh from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments and refreshes the summary tables.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description="Build or refresh the summary tables of the crop overview of the "
+                                                 "Radar Crop Monitor app.")
+    parser.add_argument("db_path", help="path to database file")
+    parser.add_argument("--summary-db", help="path to summary database (default: <database>{})".format(
+        SUMMARY_SUFFIX))
+    parser.add_argument("--full", action="store_true", help="rebuild the summary tables completely")
+    args = parser.parse_args(argv)
+
+    result = refresh_summaries(args.db_path, args.summary_db, full=args.full)
+    print("Refreshed {} AOI/year combinations ({} rows) in {} ({:.1f} s)".format(
+        len(result["refreshed"]), result["rows"], result["summary_db"], result["seconds"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+This script can be used to generate synthetic Radar Crop Monitor databases for testing and benchmarking the web app
+(see benchmark.py). The databases have the schema of the project database (tables "s1fieldstatistic",
+"areaofinterest" and "croplegend") and a configurable size:
+    - number of AOIs, years and FIDs per AOI and year
+    - number of acquisitions per year (alternating ascending/descending)
+    - number of products (Sentinel-1 products with VV and VH values, Sentinel-2 products with NDVI values)
+    - number of statistics
+The values follow a seasonal curve with noise, the field geometries are WKT polygons in UTM coordinates.
+The generated data only depends on the parameters and the seed, so databases of the same size are comparable.
+
+Usage: python synthetic_db.py <path_to_database> [--aois N] [--years N] [--fids N] [--acquisitions N]
+[--products N] [--statistics N] [--vertices N] [--seed N]
+
+|  Python version: 3.8  |
+"""
+# import packages
+import argparse
+import datetime
+import math
+import os
+import random
+import sqlite3
+import time
+
+# AOI abbreviations (further AOIs are numbered)
+AOIS = ["FRIEN", "DEMM", "MRKN", "GRAB"]
+
+# crop types of table "croplegend" (code, name)
+CROP_TYPES = [(1, "Winter Wheat"), (2, "Maize"), (3, "Rape"), (4, "Winter Barley"), (5, "Sugar Beet"),
+              (6, "Grassland")]
+
+# products with their parameters (Sentinel-1 backscatter in dB, Sentinel-2 NDVI)
+PRODUCTS = [("GRD", ("VV", "VH")), ("S2MSI2A", ("NDVI",)), ("SLC", ("VV", "VH")), ("S2MSI1C", ("NDVI",))]
+
+# statistics of table "s1fieldstatistic" (further statistics are numbered)
+STATISTICS = ["mean", "median", "std", "min", "max", "mode_value_1"]
+
+# number of rows inserted at once
+INSERT_BATCH_SIZE = 50000
+
+# SQL statements of the schema
+SCHEMA = """
+CREATE TABLE croplegend (crop_type_code INTEGER, crop_type TEXT);
+CREATE TABLE areaofinterest (aoi TEXT, year INTEGER, fid INTEGER, sl_nr INTEGER, crop_type_code INTEGER,
+                             field_geom TEXT);
+CREATE TABLE s1fieldstatistic (aoi TEXT, mask_label INTEGER, datetime TEXT, polarization TEXT, acquisition TEXT,
+                               product TEXT, statistic TEXT, value REAL, unit TEXT);
+"""
+
+
+# define function to get the n first names of a list (numbered names if the list is too short)
+def _names(names, n, prefix):
+    return [names[i] if i < len(names) else "{}{}".format(prefix, i + 1) for i in range(n)]
+
+
+# define function to get the n first products (numbered copies of the products if the list is too short)
+def _products(n):
+    products = []
+    for i in range(n):
+        name, parameters = PRODUCTS[i % len(PRODUCTS)]
+        products.append((name if i < len(PRODUCTS) else "{}_{}".format(name, i + 1), parameters))
+    return products
+
+
+# define function to make a field geometry
+def field_geometry(rng, vertices):
+    """
+    :param rng: random.Random object
+    :param vertices: number of vertices of the polygon (without the closing vertex)
+    :return: string with WKT polygon (irregular ellipse of about 200 x 100 m in UTM coordinates)
+    """
+    x0 = rng.uniform(300000, 700000)
+    y0 = rng.uniform(5300000, 6000000)
+    points = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = rng.uniform(0.9, 1.1)
+        points.append((round(x0 + 100 * radius * math.cos(angle), 2), round(y0 + 50 * radius * math.sin(angle), 2)))
+    points.append(points[0])
+    return "POLYGON (({}))".format(", ".join("{} {}".format(x, y) for x, y in points))
+
+
+# define function to make the value of an observation
+def observation_value(rng, parameter, day_of_year, offset):
+    """
+    :param rng: random.Random object
+    :param parameter: string with parameter (VV, VH or NDVI)
+    :param day_of_year: day of year of the acquisition
+    :param offset: field specific offset of the seasonal curve
+    :return: value (dB for VV/VH, NDVI value for NDVI)
+    """
+    season = math.sin(2 * math.pi * (day_of_year - 80) / 365)
+    if parameter == "NDVI":
+        return round(min(1, max(-1, 0.45 + 0.35 * season + offset / 10 + rng.gauss(0, 0.05))), 4)
+    base = -11 if parameter == "VV" else -17
+    return round(base + 3 * season + offset + rng.gauss(0, 1), 4)
+
+
+# define function to generate the rows of table "s1fieldstatistic"
+def observation_rows(rng, aoi, year, fids, acquisitions, products, statistics):
+    """
+    :param rng: random.Random object
+    :param aoi: string with AOI
+    :param year: year
+    :param fids: list with FIDs
+    :param acquisitions: number of acquisitions per year
+    :param products: list of (product, parameters) tuples
+    :param statistics: list with statistics
+    :return: generator of row tuples
+    """
+    start = datetime.datetime(year, 1, 1, 5, 30)
+    for fid in fids:
+        offset = rng.uniform(-1.5, 1.5)
+        for i in range(acquisitions):
+            acquired = start + datetime.timedelta(days=365 * i / acquisitions, minutes=rng.randint(0, 60))
+            timestamp = acquired.strftime("%Y-%m-%d %H:%M:%S")
+            acquisition = "A" if i % 2 == 0 else "D"
+            for product, parameters in products:
+                for parameter in parameters:
+                    value = observation_value(rng, parameter, acquired.timetuple().tm_yday, offset)
+                    unit = "NDVI" if parameter == "NDVI" else "dB"
+                    for statistic in statistics:
+                        # other statistics than the mean deviate slightly from it
+                        statistic_value = value if statistic == "mean" else round(value + rng.gauss(0, 0.2), 4)
+                        yield (aoi, fid, timestamp, parameter, acquisition, product, statistic, statistic_value,
+                               unit)
+
+
+# define function to generate a synthetic database
+def generate_database(db_path, aois=2, years=2, fids=50, acquisitions=60, products=2, statistics=3, vertices=40,
+                      first_year=2017, seed=0):
+    """
+    Generates a synthetic database. An existing file at db_path is replaced.
+
+    :param db_path: string with path to database file
+    :param aois: number of AOIs
+    :param years: number of years (starting with first_year)
+    :param fids: number of FIDs per AOI and year
+    :param acquisitions: number of acquisitions per year
+    :param products: number of products (see PRODUCTS)
+    :param statistics: number of statistics (see STATISTICS)
+    :param vertices: number of vertices of the field geometries
+    :param first_year: first year
+    :param seed: seed of random number generator
+    :return: dictionary with parameters and number of rows of table "s1fieldstatistic"
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = random.Random(seed)
+    product_list = _products(products)
+    statistic_list = _names(STATISTICS, statistics, "statistic_")
+
+    db = sqlite3.connect(db_path)
+    try:
+        # the database is written once, so journal and syncs are not needed
+        db.execute("PRAGMA journal_mode = OFF;")
+        db.execute("PRAGMA synchronous = OFF;")
+        db.executescript(SCHEMA)
+        db.executemany("INSERT INTO croplegend VALUES (?, ?);", CROP_TYPES)
+
+        row_count = 0
+        for aoi in _names(AOIS, aois, "AOI"):
+            for year in range(first_year, first_year + years):
+                fid_list = list(range(1, fids + 1))
+                db.executemany("INSERT INTO areaofinterest VALUES (?, ?, ?, ?, ?, ?);",
+                               [(aoi, year, fid, fid, CROP_TYPES[fid % len(CROP_TYPES)][0],
+                                 field_geometry(rng, vertices)) for fid in fid_list])
+                batch = []
+                for row in observation_rows(rng, aoi, year, fid_list, acquisitions, product_list, statistic_list):
+                    batch.append(row)
+                    if len(batch) == INSERT_BATCH_SIZE:
+                        db.executemany("INSERT INTO s1fieldstatistic VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", batch)
+                        row_count += len(batch)
+                        batch = []
+                db.executemany("INSERT INTO s1fieldstatistic VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", batch)
+                row_count += len(batch)
+        db.commit()
+    finally:
+        db.close()
+
+    return {"aois": aois, "years": years, "fids": fids, "acquisitions": acquisitions, "products": products,
+            "statistics": statistics, "vertices": vertices, "first_year": first_year, "seed": seed,
+            "rows": row_count}
+
+
+# define function to run the generator from the command line
+def main(argv=None):
+    """
+    Parses the command line arguments and generates the database.
+
+    :param argv: list of command line arguments (default: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic Radar Crop Monitor database.")
+    parser.add_argument("db_path", help="path to database file (replaced if it exists)")
+    parser.add_argument("--aois", type=int, default=2, help="number of AOIs")
+    parser.add_argument("--years", type=int, default=2, help="number of years")
+    parser.add_argument("--fids", type=int, default=50, help="number of FIDs per AOI and year")
+    parser.add_argument("--acquisitions", type=int, default=60, help="number of acquisitions per year")
+    parser.add_argument("--products", type=int, default=2, help="number of products")
+    parser.add_argument("--statistics", type=int, default=3, help="number of statistics")
+    parser.add_argument("--vertices", type=int, default=40, help="number of vertices of the field geometries")
+    parser.add_argument("--first-year", type=int, default=2017, help="first year")
+    parser.add_argument("--seed", type=int, default=0, help="seed of random number generator")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    result = generate_database(args.db_path, aois=args.aois, years=args.years, fids=args.fids,
+                               acquisitions=args.acquisitions, products=args.products, statistics=args.statistics,
+                               vertices=args.vertices, first_year=args.first_year, seed=args.seed)
+    print("Generated {} with {} rows ({:.1f} s)".format(args.db_path, result["rows"], time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Tests of the data backends (backends.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import pytest
+from backends import ParquetBackend, SQLiteBackend
+from db_pool import get_pool
+from export_parquet import export_parquet
+from queries import normalize_selection
+from synthetic_db import generate_database
+
+
+# define function to generate a small database and its Parquet export
+@pytest.fixture
+def backends(tmp_path):
+    """
+    :param tmp_path: pytest tmp_path fixture
+    :return: tuple with SQLiteBackend and ParquetBackend object of the same data
+    """
+    db_path = str(tmp_path / "rcm.db")
+    generate_database(db_path, aois=1, years=1, fids=4, acquisitions=6, products=1, statistics=1, vertices=4)
+    export_dir = str(tmp_path / "export")
+    export_parquet(db_path, export_dir)
+    return SQLiteBackend(get_pool(db_path)), ParquetBackend(export_dir)
+
+
+def test_parquet_records_match_sqlite_records(backends):
+    sqlite_backend, parquet_backend = backends
+    catalog = sqlite_backend.catalog()
+    aoi, year, crop_type = next(iter(catalog.dependent_index))
+    dependent_values = catalog.dependent_values(aoi, year, crop_type)
+    full = (dependent_values["acquisition"], dependent_values["product"], catalog.values["parameter"],
+            dependent_values["fid"])
+    # the app starts with empty multiselects, each of them selects no records
+    for empty in range(len(full) + 1):
+        multiselections = [() if index == empty else values for index, values in enumerate(full)]
+        selection = normalize_selection(aoi, int(year), crop_type, catalog.values["statistic"][0], *multiselections)
+        expected = sqlite_backend.load_records(selection)
+        records = parquet_backend.read_records(selection)
+        assert list(records.columns) == list(expected.columns)
+        assert len(records) == len(expected) and (len(records) == 0) == (empty < len(full))
+        for column in ("value", "fid", "parameter", "datetime"):
+            assert records[column].tolist() == expected[column].tolist()
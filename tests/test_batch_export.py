@@ -0,0 +1,27 @@
+"""
+Tests of the batch export (batch_export.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+from batch_export import make_tasks, match_years
+from synthetic_db import generate_database
+
+
+def test_years_are_matched_with_the_stored_years():
+    # years from the command line are strings, the database may store them as integers or as text
+    assert match_years(["2017", "2019"], [2017, 2018]) == ([2017], ["2019"])
+    assert match_years(["2018"], ["2017", "2018"]) == (["2018"], [])
+    assert match_years([2017], ["2017"]) == (["2017"], [])
+    assert match_years(None, [2017, 2018]) == ([2017, 2018], [])
+
+
+def test_tasks_are_made_for_the_found_years_only(tmp_path):
+    db_path = str(tmp_path / "rcm.db")
+    generate_database(db_path, aois=1, years=1, fids=4, acquisitions=6, products=1, statistics=1, vertices=4)
+    tasks, completed, missing_years = make_tasks(db_path, str(tmp_path / "export"))
+    year = tasks[0]["year"]
+    tasks_of_year, _, missing = make_tasks(db_path, str(tmp_path / "export"), years=[str(year), "1999"])
+    assert [task["year"] for task in tasks_of_year] == [task["year"] for task in tasks]
+    assert missing == ["1999"]
+    assert completed == 0 and missing_years == []
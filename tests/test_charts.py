@@ -0,0 +1,17 @@
+"""
+Tests of the charts of the app (charts.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import os
+import subprocess
+import sys
+
+
+def test_headless_tools_do_not_import_streamlit():
+    # the batch export and the benchmark make the charts of the app without Streamlit
+    code = "import sys, batch_export, benchmark; print(sorted({'streamlit', 'app', 'main'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    assert output.strip() == "[]"
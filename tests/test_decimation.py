@@ -0,0 +1,108 @@
+"""
+Tests of the point reduction of the charts (decimation.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import numpy as np
+import pandas as pd
+import pytest
+from decimation import decimate_records, lttb_indices, minmax_indices, series_budget
+
+
+# define function to select points with the reference implementation of LTTB (Steinarsson 2013)
+def reference_lttb(x, y, n_out):
+    """
+    :param x: list with x values (sorted ascending)
+    :param y: list with y values
+    :param n_out: number of points to keep
+    :return: list with positions of kept points
+    """
+    n = len(x)
+    selected = [0]
+    previous = 0
+    for bucket in range(n_out - 2):
+        # bucket edges floor(i * every) + 1 with every = (n - 2) / (n_out - 2)
+        start, end, next_end = (((bucket + step) * (n - 2)) // (n_out - 2) + 1 for step in range(3))
+        next_end = min(next_end, n)
+        next_x = sum(x[end:next_end]) / (next_end - end)
+        next_y = sum(y[end:next_end]) / (next_end - end)
+        areas = [abs((x[previous] - next_x) * (y[index] - y[previous])
+                     - (x[previous] - x[index]) * (next_y - y[previous])) for index in range(start, end)]
+        previous = start + areas.index(max(areas))
+        selected.append(previous)
+    return selected + [n - 1]
+
+
+@pytest.mark.parametrize("n, n_out", [(100, 10), (1000, 37), (101, 3), (50, 49)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.5, 2.0, n))
+    y = rng.normal(size=n).cumsum()
+    selected = lttb_indices(x, y, n_out)
+    assert selected.tolist() == reference_lttb(x.tolist(), y.tolist(), n_out)
+
+
+def test_lttb_keeps_end_points_and_one_point_per_bucket():
+    x = np.arange(500, dtype="float64")
+    y = np.sin(x / 20)
+    selected = lttb_indices(x, y, 52)
+    assert len(selected) == 52
+    assert selected[0] == 0 and selected[-1] == 499
+    assert (np.diff(selected) > 0).all()
+    edges = 1 + (np.arange(51) * 498) // 50
+    assert ((selected[1:-1] >= edges[:-1]) & (selected[1:-1] < edges[1:])).all()
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(1000, dtype="float64")
+    y = np.zeros(1000)
+    y[[123, 640]] = [10.0, -8.0]
+    selected = lttb_indices(x, y, 20)
+    assert 123 in selected and 640 in selected
+
+
+def test_lttb_short_series_and_small_budgets():
+    x = np.arange(10, dtype="float64")
+    assert lttb_indices(x, x, 10).tolist() == list(range(10))
+    assert lttb_indices(x, x, 20).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+    assert lttb_indices(x[:0], x[:0], 5).tolist() == []
+
+
+def test_lttb_ignores_missing_values():
+    x = np.arange(100, dtype="float64")
+    y = np.arange(100, dtype="float64")
+    y[10:40] = np.nan
+    selected = lttb_indices(x, y, 10)
+    assert len(selected) == 10 and (np.diff(selected) > 0).all()
+
+
+def test_lttb_accepts_datetime_integers_and_float32():
+    x = pd.date_range("2020-01-01", periods=300, freq="12H").values.astype("int64")
+    y = np.random.default_rng(1).normal(size=300).astype("float32")
+    assert lttb_indices(x, y, 30).tolist() == reference_lttb(x.astype("float64").tolist(),
+                                                             y.astype("float64").tolist(), 30)
+
+
+def test_minmax_keeps_minimum_and_maximum_per_bucket():
+    y = np.array([3, 1, 4, 1.5, 9, 2, 6, 5, 3, 5], dtype="float64")
+    selected = minmax_indices(y, 4)
+    assert selected.tolist() == [1, 4, 5, 6]
+    assert minmax_indices(y, 10).tolist() == list(range(10))
+
+
+def test_decimate_records_per_series():
+    dates = pd.date_range("2020-01-01", periods=400, freq="D")
+    records = pd.DataFrame({"datetime": np.tile(dates, 2), "value": np.random.default_rng(2).normal(size=800),
+                            "fid": np.repeat([1, 2], 400), "parameter": "VV"})
+    budget = series_budget(50, 2)
+    reduced, dropped = decimate_records(records, 50)
+    assert dropped == 800 - 2 * budget
+    assert reduced.groupby("fid").size().tolist() == [budget, budget]
+    assert reduced.index.is_monotonic_increasing
+    unchanged, dropped = decimate_records(records, 50, method="None")
+    assert unchanged is records and dropped == 0
+    reduced, dropped = decimate_records(records, 50, method="Min/Max")
+    assert dropped == 800 - len(reduced) and len(reduced) <= 2 * budget
+    assert reduced["value"].max() == records["value"].max() and reduced["value"].min() == records["value"].min()
@@ -0,0 +1,111 @@
+"""
+Tests of the change tracking of databases (deltas.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import sqlite3
+import pytest
+import deltas
+from db_pool import ConnectionPool
+from deltas import APPENDED_SQL, DeltaTracker, classify_change
+from synthetic_db import generate_database
+
+# state of a database before the changes
+OLD_STATE = {"max_rowid": 10, "rows": 10, "fields": "a"}
+
+
+# define function to generate a small database
+@pytest.fixture
+def db_path(tmp_path):
+    """
+    :param tmp_path: pytest tmp_path fixture
+    :return: string with path to database file
+    """
+    path = str(tmp_path / "rcm.db")
+    generate_database(path, aois=1, years=1, fids=4, acquisitions=6, products=1, statistics=1, vertices=4)
+    return path
+
+
+# define function to get the epoch of a tracker after the verification in the background
+def verified_epoch(tracker):
+    """
+    :param tracker: deltas.DeltaTracker object
+    :return: epoch of tracker after the verification started by the check of the database has finished
+    """
+    tracker.current()
+    verifier = tracker._verifier
+    if verifier is not None:
+        verifier.join(10)
+    return tracker.current()[0]
+
+
+# define function to change a database and get the new epoch of its tracker
+def change_epoch(db_path, change):
+    """
+    :param db_path: string with path to database file
+    :param change: function that takes a sqlite3.Connection object and changes the database
+    :return: tuple with epochs of the tracker before and after the change
+    """
+    tracker = DeltaTracker(ConnectionPool(db_path))
+    epoch = verified_epoch(tracker)
+    db = sqlite3.connect(db_path)
+    change(db)
+    db.commit()
+    db.close()
+    return epoch, verified_epoch(tracker)
+
+
+def test_classify_change():
+    appended = [("DEMM", "2018", 2)]
+    assert classify_change(None, OLD_STATE, []) == "initial"
+    assert classify_change(OLD_STATE, dict(OLD_STATE), []) == "unchanged"
+    assert classify_change(OLD_STATE, dict(OLD_STATE, max_rowid=12, rows=12), appended) == "append"
+    # an old row has been deleted
+    assert classify_change(OLD_STATE, dict(OLD_STATE, max_rowid=12, rows=11), appended) == "full"
+    assert classify_change(OLD_STATE, dict(OLD_STATE, rows=9), []) == "full"
+    assert classify_change(OLD_STATE, dict(OLD_STATE, fields="b"), []) == "full"
+
+
+def test_updated_datetime_starts_new_epoch(db_path):
+    before, after = change_epoch(db_path, lambda db: db.execute(
+        "UPDATE s1fieldstatistic SET datetime = '2019-01-01 00:00:00' WHERE rowid = 1;"))
+    assert after == before + 1
+
+
+def test_swapped_values_start_new_epoch(db_path):
+    # the row count and the sum of the values of the table are unchanged
+    def swap(db):
+        (first,), (second,) = db.execute("SELECT value FROM s1fieldstatistic WHERE rowid IN (1, 2) "
+                                         "ORDER BY rowid;").fetchall()
+        assert first != second
+        db.executemany("UPDATE s1fieldstatistic SET value = ? WHERE rowid = ?;", [(second, 1), (first, 2)])
+
+    before, after = change_epoch(db_path, swap)
+    assert after == before + 1
+
+
+def test_appended_rows_keep_epoch(db_path):
+    before, after = change_epoch(db_path, lambda db: db.execute(
+        "INSERT INTO s1fieldstatistic SELECT * FROM s1fieldstatistic WHERE rowid <= 3;"))
+    assert after == before
+
+
+def test_append_path_does_not_scan_old_rows(db_path, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(deltas, "row_hash", lambda *values: hashed.append(values[0]) or 0)
+    monkeypatch.setattr(DeltaTracker, "_start_verify", lambda tracker: None)
+    tracker = DeltaTracker(ConnectionPool(db_path))
+    epoch, watermark = tracker.current()
+    db = sqlite3.connect(db_path)
+    db.execute("INSERT INTO s1fieldstatistic SELECT * FROM s1fieldstatistic WHERE rowid <= 3;")
+    db.commit()
+    aoi, year = db.execute("SELECT aoi, strftime('%Y', datetime) FROM s1fieldstatistic WHERE rowid = 1;").fetchone()
+    # the appended rows are found by a search of the rowid b-tree above the watermark
+    plan = " ".join(row[-1] for row in db.execute("EXPLAIN QUERY PLAN " + APPENDED_SQL, [watermark]))
+    db.close()
+    assert "INTEGER PRIMARY KEY (rowid>?)" in plan
+    assert tracker.current() == (epoch, watermark + 3)
+    assert tracker.has_new_rows(aoi, year, watermark)
+    # no rows are hashed while the change is classified (only by the verification in the background)
+    assert hashed == []
@@ -0,0 +1,44 @@
+"""
+Tests of the derived parameters (derived.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import numpy as np
+import pandas as pd
+from derived import derived_label, pair_records, pair_unit
+
+
+# define function to make records of one observation with VV and VH values
+def make_records(units):
+    """
+    :param units: list with units of the VV and VH value
+    :return: dataframe with records
+    """
+    return pd.DataFrame({"fid": [1, 1], "datetime": pd.to_datetime(["2018-05-01"] * 2), "acquisition": ["A", "A"],
+                         "product": ["GRD", "GRD"], "parameter": ["VV", "VH"], "value": [-10.0, -16.0],
+                         "unit": units})
+
+
+def test_pairs_of_db_values():
+    records = make_records(["dB", "dB"])
+    assert pair_unit(records, "VH/VV") == "dB"
+    derived = pair_records(records, ["VH/VV", "VV-VH"])
+    assert np.isclose(derived["VH/VV"]["value"][0], 10 ** -0.6)
+    assert np.isclose(derived["VV-VH"]["value"][0], 6.0)
+    assert derived_label("VV-VH", "dB") == "Difference [dB]"
+
+
+def test_pairs_of_linear_values():
+    records = make_records(["linear", "linear"])
+    derived = pair_records(records, ["VH/VV", "VV-VH"])
+    assert np.isclose(derived["VH/VV"]["value"][0], 1.6)
+    assert derived_label("VV-VH", "linear") == "Difference [linear]"
+
+
+def test_pairs_of_missing_or_mixed_units_are_not_computed():
+    for units in (["dB", "linear"], ["dB", None]):
+        records = make_records(units)
+        assert pair_unit(records, "VH/VV") is None
+        assert pair_records(records, ["VH/VV", "VV-VH"]) == {}
+    assert pair_unit(make_records(["dB", "dB"]).drop(columns="unit"), "VV-VH") is None
@@ -0,0 +1,148 @@
+"""
+Tests of the parsing of field geometries (geometry.py) with known WKT, WKB/EWKB and GeoPackage geometries.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import struct
+import pytest
+from geometry import field_feature, parse_geometry, parse_wkt, simplify_polygons
+
+# POLYGON ((0 0, 1 0, 1 1, 0 0)) as WKB (little- and big-endian, e.g. from ST_AsBinary())
+TRIANGLE = [[(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 0.0)]]
+TRIANGLE_WKB_LE = ("01030000000100000004000000000000000000000000000000000000000000000000"
+                   "00f03f0000000000000000000000000000f03f000000000000f03f000000000000"
+                   "00000000000000000000")
+TRIANGLE_WKB_BE = ("00000000030000000100000004000000000000000000000000000000003ff00000"
+                   "0000000000000000000000003ff00000000000003ff0000000000000000000000000"
+                   "00000000000000000000")
+
+# square with a hole and second square, as rings of the polygons of a multipolygon
+SQUARE = [[(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 10.0), (0.0, 0.0)],
+          [(2.0, 2.0), (4.0, 2.0), (4.0, 4.0), (2.0, 2.0)]]
+OTHER_SQUARE = [[(20.0, 0.0), (30.0, 0.0), (30.0, 10.0), (20.0, 10.0), (20.0, 0.0)]]
+
+
+# define function to encode a polygon or multipolygon as WKB
+def encode_wkb(polygons, byte_order="<", multi=True, srid=None, z=False):
+    """
+    :param polygons: list of polygons (each a list of rings, each a list of (x, y) tuples)
+    :param byte_order: "<" for little-endian (NDR), ">" for big-endian (XDR)
+    :param multi: True for a multipolygon, False for a polygon (polygons must contain one polygon)
+    :param srid: SRID of EWKB geometry, None for WKB
+    :param z: True to add Z coordinates (EWKB flag)
+    :return: bytes with (E)WKB geometry
+    """
+    def header(geometry_type, with_srid):
+        flags = (0x80000000 if z else 0) | (0x20000000 if with_srid else 0)
+        blob = bytes([byte_order == "<"]) + struct.pack(byte_order + "I", geometry_type | flags)
+        return blob + struct.pack(byte_order + "I", srid) if with_srid else blob
+
+    def polygon_wkb(polygon, with_srid):
+        blob = header(3, with_srid) + struct.pack(byte_order + "I", len(polygon))
+        for ring in polygon:
+            blob += struct.pack(byte_order + "I", len(ring))
+            for x, y in ring:
+                blob += struct.pack(byte_order + ("3d" if z else "2d"), x, y, *((5.0,) if z else ()))
+        return blob
+
+    if not multi:
+        return polygon_wkb(polygons[0], srid is not None)
+    blob = header(6, srid is not None) + struct.pack(byte_order + "I", len(polygons))
+    return blob + b"".join(polygon_wkb(polygon, False) for polygon in polygons)
+
+
+# define function to wrap a WKB geometry in a GeoPackage geometry blob
+def encode_gpkg(wkb, envelope=1, empty=False):
+    """
+    :param wkb: bytes with WKB geometry
+    :param envelope: envelope type of the header (0: none, 1: xy, 2: xyz, 3: xym, 4: xyzm)
+    :param empty: True to set the flag of empty geometries
+    :return: bytes with GeoPackage geometry blob
+    """
+    flags = 0x01 | (envelope << 1) | (0x10 if empty else 0)
+    n_values = (0, 4, 6, 6, 8)[envelope]
+    return b"GP" + bytes([0, flags]) + struct.pack("<i", 4326) + struct.pack("<{}d".format(n_values),
+                                                                           *range(n_values)) + wkb
+
+
+def test_known_polygon_wkb_little_and_big_endian():
+    assert parse_geometry(bytes.fromhex(TRIANGLE_WKB_LE)) == [TRIANGLE]
+    assert parse_geometry(bytes.fromhex(TRIANGLE_WKB_BE)) == [TRIANGLE]
+    # hex strings (e.g. geometries stored as text) are decoded
+    assert parse_geometry(TRIANGLE_WKB_LE) == [TRIANGLE]
+    assert parse_geometry(TRIANGLE_WKB_BE.upper()) == [TRIANGLE]
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_polygon_wkb_round_trip(byte_order):
+    assert parse_geometry(encode_wkb([SQUARE], byte_order, multi=False)) == [SQUARE]
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_multipolygon_wkb_round_trip(byte_order):
+    polygons = [SQUARE, OTHER_SQUARE]
+    assert parse_geometry(encode_wkb(polygons, byte_order)) == polygons
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_ewkb_with_srid_and_z_coordinates(byte_order):
+    polygons = [SQUARE, OTHER_SQUARE]
+    assert parse_geometry(encode_wkb(polygons, byte_order, srid=25832, z=True)) == polygons
+    assert parse_geometry(encode_wkb([SQUARE], byte_order, multi=False, srid=4326)) == [SQUARE]
+
+
+def test_iso_wkb_z_type():
+    # ISO WKB: type 1003 (polygon Z), coordinates x, y, z
+    ring = [(0.0, 0.0, 1.0), (1.0, 0.0, 1.0), (1.0, 1.0, 1.0), (0.0, 0.0, 1.0)]
+    blob = b"\x01" + struct.pack("<III", 1003, 1, len(ring)) + b"".join(struct.pack("<3d", *point) for point in ring)
+    assert parse_geometry(blob) == [TRIANGLE]
+
+
+@pytest.mark.parametrize("envelope", [0, 1, 2, 3, 4])
+def test_gpkg_envelopes(envelope):
+    polygons = [SQUARE, OTHER_SQUARE]
+    assert parse_geometry(encode_gpkg(encode_wkb(polygons, ">"), envelope)) == polygons
+    assert parse_geometry(encode_gpkg(bytes.fromhex(TRIANGLE_WKB_LE), envelope)) == [TRIANGLE]
+
+
+def test_gpkg_without_header_is_plain_wkb():
+    blob = encode_wkb([SQUARE])
+    assert parse_geometry(encode_gpkg(blob, envelope=0)) == parse_geometry(blob) == [SQUARE]
+
+
+def test_empty_geometries():
+    assert parse_geometry(None) is None
+    assert parse_geometry(b"") is None
+    assert parse_geometry("POLYGON EMPTY") == []
+    assert parse_geometry("SRID=4326;MULTIPOLYGON EMPTY") == []
+    assert parse_geometry(encode_wkb([], "<")) == []
+    assert parse_geometry(encode_wkb([], ">")) == []
+    # polygon without rings
+    assert parse_geometry(b"\x01" + struct.pack("<II", 3, 0)) == []
+    assert parse_geometry(encode_gpkg(encode_wkb([]), envelope=0, empty=True)) == []
+    assert parse_geometry(encode_gpkg(b"\x01" + struct.pack("<II", 3, 0), envelope=1, empty=True)) == []
+
+
+def test_wkt_matches_wkb():
+    wkt = "MULTIPOLYGON Z (((0 0 1, 10 0 1, 10 10 1, 0 10 1, 0 0 1), (2 2 1, 4 2 1, 4 4 1, 2 2 1)), " \
+          "((20 0 1, 30 0 1, 30 10 1, 20 10 1, 20 0 1)))"
+    assert parse_wkt(wkt) == parse_geometry(encode_wkb([SQUARE, OTHER_SQUARE])) == [SQUARE, OTHER_SQUARE]
+    assert parse_geometry("SRID=4326;POLYGON ((0 0, 1 0, 1 1, 0 0))") == [TRIANGLE]
+
+
+def test_unsupported_geometries():
+    with pytest.raises(ValueError):
+        parse_geometry("POINT (1 2)")
+    with pytest.raises(ValueError):
+        parse_geometry(b"\x01" + struct.pack("<I2d", 1, 1.0, 2.0))
+
+
+def test_feature_of_simplified_polygons():
+    ring = [(float(x), 0.0) for x in range(11)] + [(10.0, 10.0), (0.0, 10.0), (0.0, 0.0)]
+    simplified = simplify_polygons([[ring]], relative_tolerance=0.01)
+    assert simplified == [[[(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 10.0), (0.0, 0.0)]]]
+    feature = field_feature(7, simplified)
+    assert feature["geometry"]["type"] == "MultiPolygon"
+    assert feature["geometry"]["coordinates"][0][0][1] == [10.0, 0.0]
+    assert feature["properties"] == {"fid": 7}
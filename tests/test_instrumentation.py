@@ -0,0 +1,72 @@
+"""
+Tests of the instrumentation of the app (instrumentation.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import json
+import logging
+import time
+import altair as alt
+import numpy as np
+import pandas as pd
+import instrumentation
+from instrumentation import Profiler, logger, setup_logging, spec_size
+
+
+# define function to set up the logger with a log level from the environment
+def configure_logger(monkeypatch, level):
+    """
+    :param monkeypatch: pytest monkeypatch fixture
+    :param level: string with value of RCM_LOG_LEVEL
+    :return: list to which the log records are appended
+    """
+    monkeypatch.setattr(logger, "handlers", [])
+    monkeypatch.setenv("RCM_LOG_LEVEL", level)
+    records = []
+    monkeypatch.setattr(logging.StreamHandler, "emit", lambda handler, record: records.append(record))
+    setup_logging()
+    return records
+
+
+def test_log_level_from_environment(monkeypatch):
+    configure_logger(monkeypatch, "warning")
+    assert logger.level == logging.WARNING
+
+
+def test_invalid_log_level_falls_back_to_info(monkeypatch):
+    records = configure_logger(monkeypatch, "LOUD")
+    assert logger.level == logging.INFO
+    assert records[-1].levelno == logging.WARNING
+    assert "LOUD" in json.loads(records[-1].getMessage())["error"]
+
+
+def test_chart_specification_is_measured_in_own_stage(monkeypatch):
+    monkeypatch.setattr(instrumentation, "spec_size", lambda chart: time.sleep(0.05) or 1234)
+    profiler = Profiler(detailed=True)
+    with profiler.stage("make_chart:VV"):
+        chart = object()
+    profiler.add_chart("chart_spec:VV", chart)
+    make_chart, chart_spec = profiler.stages
+    assert make_chart["stage"] == "make_chart:VV" and "spec_bytes" not in make_chart
+    assert make_chart["seconds"] < 0.05 <= chart_spec["seconds"]
+    assert chart_spec == dict(chart_spec, stage="chart_spec:VV", spec_bytes=1234)
+
+    profiler = Profiler(detailed=False)
+    profiler.add_chart("chart_spec:VV", chart)
+    assert profiler.stages == []
+
+
+def test_chart_specification_size_includes_all_rows_without_changing_data_transformer(monkeypatch):
+    # more rows than the row limit of Altair's default data transformer, and two layers whose first rows are equal
+    records = pd.DataFrame({"datetime": pd.date_range("2017-01-01", periods=6000, freq="H"),
+                            "value": np.linspace(-20, 0, 6000)})
+    points = alt.Chart(records).mark_circle().encode(x="datetime:T", y="value")
+    chart = alt.vconcat(points + alt.Chart(records.head(10)).mark_line().encode(x="datetime:T", y="value"), points)
+    with alt.data_transformers.enable("default", max_rows=None):
+        expected = len(json.dumps(chart.to_dict()))
+
+    def enable(*args, **kwargs):
+        raise AssertionError("data transformer changed")
+    monkeypatch.setattr(alt.data_transformers, "enable", enable)
+    assert spec_size(chart) == expected
@@ -0,0 +1,95 @@
+"""
+Tests of the background prefetch of supersets (prefetch.py).
+
+|  Python version: 3.8  |
+"""
+# import packages
+import threading
+from prefetch import Prefetcher
+from queries import normalize_selection
+
+
+# define class for a backend whose loads block until they are released
+class BlockingBackend:
+    """
+    Backend stand-in that records the loaded selections (nothing is cached).
+    """
+    key = "blocking"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.loaded = []
+        self.probes = []
+
+    def cached_records(self, selection, count=True):
+        self.probes.append(count)
+        return None
+
+    def load_records(self, selection, timings=None):
+        self.release.wait(5)
+        self.loaded.append(selection.crop_type)
+
+
+# define function to make the superset of a crop type
+def superset(crop_type):
+    """
+    :param crop_type: string with crop type
+    :return: queries.FilterSelection object
+    """
+    return normalize_selection("DEMM", 2018, crop_type, "mean", ["A"], ["GRD"], ["VV"], [1, 2])
+
+
+def test_sessions_only_drop_their_own_pending_prefetches():
+    backend = BlockingBackend()
+    prefetcher = Prefetcher(max_workers=1)
+    # the only worker is busy with the first superset, the other supersets are pending
+    prefetcher.prefetch(backend, superset("Maize"), "first")
+    prefetcher.prefetch(backend, superset("Rape"), "first")
+    prefetcher.prefetch(backend, superset("Beet"), "second")
+    prefetcher.prefetch(backend, superset("Rape"), "third")
+
+    # the first session chooses other main filters: Rape is still requested by the third session
+    prefetcher.prefetch(backend, superset("Wheat"), "first")
+    assert prefetcher.stats()["dropped"] == 0
+    # the third session chooses other main filters: Rape is dropped, Beet of the second session is kept
+    prefetcher.prefetch(backend, superset("Barley"), "third")
+    assert prefetcher.stats()["dropped"] == 1
+    # prefetches without session are never dropped
+    prefetcher.prefetch(backend, superset("Oats"))
+    prefetcher.prefetch(backend, superset("Rye"))
+
+    backend.release.set()
+    prefetcher._executor.shutdown(wait=True)
+    assert sorted(backend.loaded) == ["Barley", "Beet", "Maize", "Oats", "Rye", "Wheat"]
+    stats = prefetcher.stats()
+    assert stats["submitted"] == 7 and stats["dropped"] == 1 and stats["in_flight"] == 0
+
+
+def test_too_large_supersets_are_skipped_once():
+    backend = BlockingBackend()
+    backend.release.set()
+    prefetcher = Prefetcher(max_workers=1, max_bytes=1000)
+    # the estimated memory of the first superset exceeds the limit on every rerun of the app
+    for _ in range(3):
+        prefetcher.prefetch(backend, superset("Maize"), "first", rows=1000)
+    prefetcher.prefetch(backend, superset("Rape"), "first", rows=10)
+    prefetcher.prefetch(backend, superset("Beet"), "first")
+    prefetcher._executor.shutdown(wait=True)
+    assert sorted(backend.loaded) == ["Beet", "Rape"]
+    # the checks whether the supersets are cached are not counted as cache misses
+    assert backend.probes == [False, False]
+    stats = prefetcher.stats()
+    assert stats["too_large"] == 1 and stats["submitted"] == 2
+
+
+def test_load_drops_pending_prefetch_and_loads_superset():
+    backend = BlockingBackend()
+    prefetcher = Prefetcher(max_workers=1)
+    prefetcher.prefetch(backend, superset("Maize"), "first")
+    prefetcher.prefetch(backend, superset("Rape"), "second")
+    # the pending prefetch is loaded in the calling thread instead of waiting for the busy worker
+    threading.Timer(0.1, backend.release.set).start()
+    prefetcher.load(backend, superset("Rape"))
+    prefetcher._executor.shutdown(wait=True)
+    assert sorted(backend.loaded) == ["Maize", "Rape"]
+    assert prefetcher.stats()["dropped"] == 1
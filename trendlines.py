@@ -0,0 +1,170 @@
+"""
+This module computes the trendlines of the charts of the Radar Crop Monitor app on the server side, so the charts only
+receive the small precomputed line series instead of computing LOESS/rolling means in the browser.
+
+Two trendlines are available, either pooled over all points of a chart or per group (e.g. per FID):
+    - LOESS (locally weighted linear regression with tricube weights, bandwidth 0.3 like Vega's loess transform),
+      vectorized over blocks of evaluation points
+    - Rolling Mean (centered mean of 11 values, like the window transform with frame [-5, 5])
+
+Computed trendlines are cached per data source, filter selection, parameter, date range and grouping.
+
+|  Python version: 3.8  |
+"""
+# import packages
+import numpy as np
+import pandas as pd
+from decimation import lttb_indices
+from query_cache import ResultCache
+
+# number of evaluation points of LOESS trendlines
+LOESS_POINTS = 200
+
+# number of evaluation points for which the distances to all data points are computed at once
+LOESS_BLOCK_SIZE = 25
+
+# number of values of rolling mean (centered)
+ROLLING_WINDOW = 11
+
+# process-wide cache of computed trendlines, shared across app sessions
+trendline_cache = ResultCache(max_bytes=64 * 1024 ** 2)
+
+
+# define function to compute a LOESS trendline
+def loess(x, y, bandwidth=0.3, n_points=LOESS_POINTS):
+    """
+    Computes a LOESS trendline: for each evaluation point, a linear regression is fitted to the nearest
+    bandwidth * n data points, weighted with the tricube function of their distance.
+
+    :param x: numpy.ndarray with x values (float)
+    :param y: numpy.ndarray with y values (float)
+    :param bandwidth: fraction of data points used for each local regression
+    :param n_points: maximum number of evaluation points (evenly spaced between smallest and largest x value)
+    :return: numpy.ndarray with x values of evaluation points, numpy.ndarray with fitted y values
+    """
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = x[valid]
+    y = y[valid]
+    if len(x) < 3:
+        return x, y
+
+    grid = np.unique(x)
+    if len(grid) > n_points:
+        grid = np.linspace(grid[0], grid[-1], n_points)
+    k = min(len(x), max(2, int(np.ceil(bandwidth * len(x)))))
+
+    fitted = np.empty(len(grid))
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for start in range(0, len(grid), LOESS_BLOCK_SIZE):
+            points = grid[start:start + LOESS_BLOCK_SIZE, None]
+            distances = np.abs(x[None, :] - points)
+            radius = np.partition(distances, k - 1, axis=1)[:, k - 1:k]
+            weights = np.clip(1 - (distances / radius) ** 3, 0, None) ** 3
+            # points at distance 0 get full weight if the k nearest points all have the same x value
+            weights = np.where(radius > 0, weights, (distances == 0).astype("float64"))
+            weight_sum = weights.sum(axis=1)
+            mean_x = (weights * x).sum(axis=1) / weight_sum
+            mean_y = (weights * y).sum(axis=1) / weight_sum
+            centered_x = x[None, :] - mean_x[:, None]
+            variance = (weights * centered_x ** 2).sum(axis=1)
+            covariance = (weights * centered_x * (y[None, :] - mean_y[:, None])).sum(axis=1)
+            slope = np.where(variance > 0, covariance / variance, 0)
+            fitted[start:start + LOESS_BLOCK_SIZE] = mean_y + slope * (points[:, 0] - mean_x)
+    return grid, fitted
+
+
+# define function to compute a rolling mean trendline
+def rolling_mean(x, y, window=ROLLING_WINDOW):
+    """
+    :param x: numpy.ndarray with x values (float, sorted ascending)
+    :param y: numpy.ndarray with y values (float)
+    :param window: number of values per mean (centered, fewer values at the start and end of the series)
+    :return: numpy.ndarray with x values, numpy.ndarray with mean values
+    """
+    means = pd.Series(y).rolling(window, center=True, min_periods=1).mean().to_numpy()
+    return x, means
+
+
+# define function to compute the trendline of one series
+def series_trendline(dates, values, method, max_points):
+    """
+    :param dates: numpy.ndarray with datetime64 values
+    :param values: numpy.ndarray with values
+    :param method: string with trendline method ("LOESS" or "Rolling Mean")
+    :param max_points: maximum number of points of the trendline (reduced with LTTB)
+    :return: dataframe with columns "datetime" and "trend"
+    """
+    order = np.argsort(dates, kind="stable")
+    nanoseconds = dates[order].astype("int64")
+    origin = nanoseconds[0] if len(nanoseconds) else 0
+    # x values in days since first date (avoids loss of precision for large nanosecond values)
+    x = (nanoseconds - origin) / 8.64e13
+    y = values[order].astype("float64")
+
+    if method == "LOESS":
+        x_line, y_line = loess(x, y)
+    else:
+        x_line, y_line = rolling_mean(x, y)
+    kept = lttb_indices(x_line, y_line, max_points)
+    x_line = x_line[kept]
+    y_line = y_line[kept]
+
+    line_dates = pd.to_datetime(np.round(x_line * 8.64e13).astype("int64") + origin)
+    return pd.DataFrame({"datetime": line_dates, "trend": y_line})
+
+
+# define function to compute the trendline(s) of a chart
+def compute_trendline(pol_records, method, group_column=None, max_points=1000):
+    """
+    Computes a trendline over all points of the dataframe, or one trendline per group.
+
+    :param pol_records: dataframe with columns "datetime" and "value" (and group column)
+    :param method: string with trendline method ("LOESS" or "Rolling Mean")
+    :param group_column: column name or tuple of column names for one trendline per group (e.g. "fid"), None for
+        one pooled trendline
+    :param max_points: maximum number of points per trendline
+    :return: dataframe with columns "datetime", "trend" (and group columns)
+    """
+    dates = pd.to_datetime(pol_records["datetime"]).to_numpy()
+    values = pol_records["value"].to_numpy(dtype="float64")
+    if group_column is None:
+        return series_trendline(dates, values, method, max_points)
+
+    group_columns = [group_column] if isinstance(group_column, str) else list(group_column)
+    lines = []
+    for group, positions in pol_records.groupby(group_columns, sort=False, observed=True).indices.items():
+        line = series_trendline(dates[positions], values[positions], method, max_points)
+        for column, value in zip(group_columns, group if isinstance(group, tuple) else (group,)):
+            line[column] = value
+        lines.append(line)
+    if not lines:
+        return pd.DataFrame(columns=["datetime", "trend"] + group_columns)
+    return pd.concat(lines, ignore_index=True)
+
+
+# define function to get a (cached) trendline
+def get_trendline(pol_records, method, group_column=None, max_points=1000, cache_key=None):
+    """
+    Returns the trendline(s) of a chart from the process-wide cache or computes them.
+
+    :param pol_records: dataframe with columns "datetime" and "value" (and group column)
+    :param method: string with trendline method ("LOESS", "Rolling Mean" or "None")
+    :param group_column: column name or tuple of column names for one trendline per group (e.g. "fid"), None for
+        one pooled trendline
+    :param max_points: maximum number of points per trendline
+    :param cache_key: tuple (data source key, data version, hashable filter key) that identifies pol_records,
+        or None to compute the trendline without cache
+    :return: dataframe with columns "datetime", "trend" (and group columns), None if method is "None"
+    """
+    if method not in ("LOESS", "Rolling Mean"):
+        return None
+    if cache_key is None:
+        return compute_trendline(pol_records, method, group_column, max_points)
+
+    source_key, version, filter_key = cache_key
+    key = (filter_key, method, group_column, max_points)
+    trendline = trendline_cache.get(source_key, key, version)
+    if trendline is None:
+        trendline = compute_trendline(pol_records, method, group_column, max_points)
+        trendline_cache.put(source_key, key, version, trendline)
+    return trendline